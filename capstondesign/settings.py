@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -59,7 +60,8 @@ ROOT_URLCONF = 'capstondesign.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # 렌더링 시간을 기록하는 DjangoTemplates (firstapp/metrics.py)
+        'BACKEND': 'firstapp.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,12 +80,72 @@ WSGI_APPLICATION = 'capstondesign.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres 이면 PostgreSQL(연결 풀 사용), 아니면 SQLite
+# 연결 유지 시간(초): async 뷰(ASGI)는 요청마다 연결을 닫아야 하므로 기본 0, 그 외에는 60
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '0' if os.getenv('ASYNC_VIEWS_ENABLED', 'false').lower() == 'true' else '60'))
+
+if os.getenv('DB_ENGINE', 'sqlite').lower() == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'capstondesign'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # psycopg 연결 풀 (pip install "psycopg[binary,pool]"). 풀이 연결을 재사용하므로 CONN_MAX_AGE는 0
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', '20')),
+                    'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+                },
+            },
+            'CONN_MAX_AGE': 0,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # 여러 워커가 동시에 쓸 때 'database is locked'로 실패하지 않도록:
+            # - WAL: 읽기와 쓰기가 서로 막지 않음, synchronous=NORMAL: 커밋마다 fsync하지 않음 (WAL에서는 안전)
+            # - timeout: 쓰기 잠금을 기다리는 시간(초)
+            # - IMMEDIATE: 트랜잭션 시작 때 쓰기 잠금을 잡아, 도중에 잠금을 올리다 바로 실패하는 일이 없음
+            'OPTIONS': {
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+                'transaction_mode': 'IMMEDIATE',
+            },
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # 테스트 DB도 파일로 만들어 워커 스레드가 위와 같은 잠금 방식(WAL, timeout)으로 함께 씁니다.
+            # (메모리 DB는 스레드 사이에 테이블 잠금을 기다리지 않고 바로 실패함)
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+
+# 캐시: CACHE_REDIS_URL을 정하면 Redis(모든 웹 프로세스가 함께 사용, pip install redis),
+# 아니면 프로세스별 메모리 캐시. 배포할 때 CACHE_KEY_PREFIX를 바꾸면 이전 배포의 캐시를 쓰지 않습니다.
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'capstondesign'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'capstondesign',
+            'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'capstondesign'),
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '1000'))},
+        }
     }
-}
 
 
 # Password validation
@@ -121,14 +183,209 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = '/static/'
+# build_static_assets가 만든 이미지 사본. 앱 static 폴더보다 먼저 찾아지므로 같은 이름의 원본을 대신합니다.
+STATIC_BUILD_DIR = BASE_DIR / 'static'
 STATICFILES_DIRS = [
-    BASE_DIR / 'static',
+    STATIC_BUILD_DIR,
 ]
+# collectstatic 결과 (nginx 등이 제공)
+STATIC_ROOT = os.getenv('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # 내용 해시 이름 + gzip/brotli 압축본 (firstapp/static_assets.py)
+    'staticfiles': {'BACKEND': 'firstapp.static_assets.CompressedManifestStaticFilesStorage'},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-MEDIA_ROOT = BASE_DIR
-MEDIA_URL = '/media/'
\ No newline at end of file
+# 업로드/생성 파일은 프로젝트 루트가 아닌 전용 폴더에 저장합니다.
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+
+# 이미지 생성 작업 큐 (python manage.py run_generation_worker)
+GENERATION_WORKER_CONCURRENCY = int(os.getenv('GENERATION_WORKER_CONCURRENCY', '4'))
+GENERATION_WORKER_POLL_INTERVAL = float(os.getenv('GENERATION_WORKER_POLL_INTERVAL', '1.0'))
+# 실행 중인 작업의 heartbeat_at을 갱신하고 멈춘 작업을 정리하는 간격(초)
+GENERATION_JOB_HEARTBEAT_SECONDS = float(os.getenv('GENERATION_JOB_HEARTBEAT_SECONDS', '30'))
+# 이 시간(초) 이상 heartbeat가 없는 RUNNING 작업은 워커가 죽은 것으로 보고 다시 큐에 넣습니다.
+GENERATION_JOB_STALE_SECONDS = int(os.getenv('GENERATION_JOB_STALE_SECONDS', '300'))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv('GENERATION_JOB_MAX_ATTEMPTS', '2'))
+# 요청(작업) 하나가 동시에 실행하는 이미지 예측 수
+GENERATION_PER_REQUEST_CONCURRENCY = int(os.getenv('GENERATION_PER_REQUEST_CONCURRENCY', '4'))
+# 프로세스 전체에서 동시에 실행하는 이미지 예측 수
+GENERATION_MAX_CONCURRENT_PREDICTIONS = int(os.getenv('GENERATION_MAX_CONCURRENT_PREDICTIONS', '16'))
+
+# 텍스트 LLM 호출 캐시 (firstapp/llm_cache.py)
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+# 몇 번 저장할 때마다 만료/초과 항목을 정리할지 (프로세스별)
+LLM_CACHE_EVICT_EVERY = max(1, int(os.getenv('LLM_CACHE_EVICT_EVERY', '100')))
+# custom_* 모델: 장면당 만들어 두고 재사용할 배경 수, 배경 URL 유효 시간(초)
+GENERATION_BACKGROUND_POOL_SIZE = int(os.getenv('GENERATION_BACKGROUND_POOL_SIZE', '2'))
+GENERATION_BACKGROUND_TTL_SECONDS = int(os.getenv('GENERATION_BACKGROUND_TTL_SECONDS', '3600'))
+
+# 생성 결과 로컬 미러링 (firstapp/media_store.py)
+ASSET_STORE_DIR = MEDIA_ROOT / 'assets'
+ASSET_MIRROR_ENABLED = os.getenv('ASSET_MIRROR_ENABLED', 'true').lower() == 'true'
+ASSET_DOWNLOAD_TIMEOUT = float(os.getenv('ASSET_DOWNLOAD_TIMEOUT', '30'))
+# 썸네일 / 반응형 이미지 폭(px) (firstapp/derivatives.py)
+ASSET_THUMBNAIL_WIDTH = 160
+ASSET_RESPONSIVE_WIDTHS = [480, 960, 1600]
+
+# 프로필 갤러리 한 페이지에 보여줄 이미지 수
+PROFILE_PAGE_SIZE = int(os.getenv('PROFILE_PAGE_SIZE', '24'))
+# 관리자 페이지 유저 목록 한 페이지 크기
+ADMIN_USERS_PAGE_SIZE = int(os.getenv('ADMIN_USERS_PAGE_SIZE', '50'))
+
+# 업로드 이미지를 provider Files API에 한 번만 올리고 재사용 (firstapp/provider_files.py)
+PROVIDER_FILE_CACHE_ENABLED = os.getenv('PROVIDER_FILE_CACHE_ENABLED', 'true').lower() == 'true'
+# 만료 시각을 알 수 없을 때 사용할 유효 시간, 만료 전에 새로 올릴 여유 시간(초)
+PROVIDER_FILE_TTL_SECONDS = int(os.getenv('PROVIDER_FILE_TTL_SECONDS', str(23 * 3600)))
+PROVIDER_FILE_EXPIRY_MARGIN_SECONDS = int(os.getenv('PROVIDER_FILE_EXPIRY_MARGIN_SECONDS', '600'))
+
+# 모델 입력 이미지 정규화 (firstapp/image_prep.py): 모델별 최대 변 길이(px)
+IMAGE_NORMALIZE_ENABLED = os.getenv('IMAGE_NORMALIZE_ENABLED', 'true').lower() == 'true'
+IMAGE_NORMALIZE_JPEG_QUALITY = 90
+MODEL_INPUT_MAX_EDGE = {
+    'default': 2048,
+    'openai/o4-mini': 1024,
+    'openai/gpt-5': 1024,
+    'black-forest-labs/flux-kontext-pro': 1440,
+}
+
+# 결과 스트리밍 (firstapp/streaming.py): DB 확인 간격(초), 연결 유지 최대 시간(초), 재접속 간격(ms)
+GENERATION_EVENTS_POLL_INTERVAL = float(os.getenv('GENERATION_EVENTS_POLL_INTERVAL', '0.5'))
+GENERATION_EVENTS_MAX_SECONDS = int(os.getenv('GENERATION_EVENTS_MAX_SECONDS', '300'))
+GENERATION_EVENTS_RETRY_MS = 1000
+# WSGI 배포에서 결과 페이지가 스트림 대신 작업 상태를 조회하는 간격(ms)
+GENERATION_STATUS_POLL_MS = int(os.getenv('GENERATION_STATUS_POLL_MS', '2000'))
+# 편집 스트리밍에서 예측 상태를 확인하는 간격(초)
+EDITING_POLL_INTERVAL = float(os.getenv('EDITING_POLL_INTERVAL', '1'))
+
+# ASGI 배포 (firstapp/async_views.py): 생성/분석/편집/영상 뷰를 async 버전으로 연결
+ASYNC_VIEWS_ENABLED = os.getenv('ASYNC_VIEWS_ENABLED', 'false').lower() == 'true'
+# async 뷰에서 등록한 생성 작업을 워커 대신 같은 프로세스의 이벤트 루프에서 바로 실행
+GENERATION_ASYNC_INLINE = os.getenv('GENERATION_ASYNC_INLINE', 'true').lower() == 'true'
+
+# 이미지 분석 결과 캐시 (firstapp/analysis_cache.py)
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+# 같은 이미지로 볼 지각 해시(64비트)의 최대 해밍 거리 (0이면 해시가 같을 때만, 11 이하 권장)
+ANALYSIS_CACHE_MAX_DISTANCE = int(os.getenv('ANALYSIS_CACHE_MAX_DISTANCE', '6'))
+
+# 생성 기록 유사 이미지 검색 (firstapp/similar_index.py)
+SIMILAR_SEARCH_MAX_DISTANCE = int(os.getenv('SIMILAR_SEARCH_MAX_DISTANCE', '8'))
+SIMILAR_SEARCH_LIMIT = int(os.getenv('SIMILAR_SEARCH_LIMIT', '12'))
+# 메모리 인덱스를 DB에서 전체 다시 읽는 간격(초). 그 사이에는 새 행만 추가합니다.
+SIMILAR_INDEX_REBUILD_SECONDS = int(os.getenv('SIMILAR_INDEX_REBUILD_SECONDS', '600'))
+
+# provider 예측 완료 방식 (firstapp/webhooks.py)
+# poll: 워커가 client.run()으로 끝날 때까지 기다림 / webhook: 제출만 하고 provider의 완료 웹훅으로 다음 단계 진행
+GENERATION_COMPLETION_MODE = os.getenv('GENERATION_COMPLETION_MODE', 'poll').lower()
+# provider가 웹훅을 보낼 이 서버의 외부 주소, 웹훅 서명 키(whsec_...), 허용할 서명 시각 오차(초)
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', 'http://localhost:8000')
+REPLICATE_WEBHOOK_SECRET = os.getenv('REPLICATE_WEBHOOK_SECRET', '')
+WEBHOOK_TIMESTAMP_TOLERANCE_SECONDS = 300
+# 이 시간(초)이 지나도 완료 알림이 없는 예측은 워커가 provider에서 직접 상태를 조회
+GENERATION_WEBHOOK_RECONCILE_SECONDS = int(os.getenv('GENERATION_WEBHOOK_RECONCILE_SECONDS', '120'))
+
+# provider 백엔드 (firstapp/providers.py): replicate, fake(로컬 대체), record(실제 호출 + 녹화), replay(녹화 재생)
+REPLICATE_PROVIDER = os.getenv('REPLICATE_PROVIDER', 'replicate').lower()
+# 가짜 예측이 끝나기까지의 시간(초, 비우면 모델별 지연/오류 분포 사용), 가짜 이미지 결과 URL (비우면 정적 샘플 이미지)
+FAKE_PROVIDER_DELAY = float(os.getenv('FAKE_PROVIDER_DELAY')) if os.getenv('FAKE_PROVIDER_DELAY') else None
+FAKE_PROVIDER_OUTPUT_URL = os.getenv('FAKE_PROVIDER_OUTPUT_URL', '')
+# 모델별 분포의 지연에 곱하는 값 (0.01이면 100배 빠르게), 모델별 분포 덮어쓰기 (fake_provider.PROFILES 형식)
+FAKE_PROVIDER_LATENCY_SCALE = float(os.getenv('FAKE_PROVIDER_LATENCY_SCALE', '1.0'))
+FAKE_PROVIDER_PROFILES = {}
+
+# provider 동시 예측 수 제한 (firstapp/admission.py): DB에 자리를 두어 모든 웹/워커 프로세스가 공유
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_GLOBAL_MAX_PREDICTIONS = int(os.getenv('ADMISSION_GLOBAL_MAX_PREDICTIONS', '32'))
+ADMISSION_USER_MAX_PREDICTIONS = int(os.getenv('ADMISSION_USER_MAX_PREDICTIONS', '8'))
+# 모델별 동시 예측 수 ('default'는 목록에 없는 모델)
+ADMISSION_MODEL_MAX_PREDICTIONS = {
+    'default': int(os.getenv('ADMISSION_MODEL_MAX_PREDICTIONS', '16')),
+    'openai/o4-mini': 16,
+    'google/nano-banana-pro': 16,
+    'black-forest-labs/flux-kontext-pro': 16,
+}
+# 자리가 날 때까지 기다리는 최대 시간(초) (반납되지 않은 자리를 회수하기까지의 시간은 PROVIDER_POLICIES 아래)
+ADMISSION_WAIT_SECONDS = float(os.getenv('ADMISSION_WAIT_SECONDS', '120'))
+# 생성 작업 대기열 상한 (넘으면 503), 사용자별 대기+실행 작업 수 상한 (넘으면 429), 거절 시 Retry-After(초)
+GENERATION_QUEUE_MAX = int(os.getenv('GENERATION_QUEUE_MAX', '200'))
+GENERATION_USER_MAX_ACTIVE_JOBS = int(os.getenv('GENERATION_USER_MAX_ACTIVE_JOBS', '3'))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', '30'))
+
+# provider 호출 정책 (firstapp/resilience.py)
+# HTTP 연결/읽기 시간 제한(초), 예측 상태 확인 간격(초)
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv('PROVIDER_CONNECT_TIMEOUT', '10'))
+PROVIDER_READ_TIMEOUT = float(os.getenv('PROVIDER_READ_TIMEOUT', '75'))
+PROVIDER_POLL_INTERVAL = float(os.getenv('PROVIDER_POLL_INTERVAL', '0.5'))
+# 모델별 정책 ('default'에 모델 항목을 덮어씀)
+# timeout: 예측 최대 대기(초), retries/backoff/backoff_max: 일시적 오류 재시도(지수 백오프 + jitter),
+# hedge: 사본을 보낼 시점(초 또는 'p95', None이면 안 함), breaker_failures/breaker_cooldown: 서킷 브레이커
+PROVIDER_POLICIES = {
+    'default': {
+        'timeout': 300, 'retries': 2, 'backoff': 1.0, 'backoff_max': 20.0, 'hedge': None,
+        'breaker_failures': 5, 'breaker_cooldown': 60,
+    },
+    'openai/o4-mini': {'timeout': 60, 'hedge': 'p95'},
+    'google/nano-banana-pro': {'timeout': 180, 'hedge': 'p95'},
+    'black-forest-labs/flux-kontext-pro': {'timeout': 120, 'hedge': 'p95'},
+    'bytedance/seedream-4': {'timeout': 180},
+    'openai/gpt-5': {'timeout': 180, 'retries': 1},
+    'google/veo-3.1': {'timeout': 900, 'retries': 0},
+}
+
+
+def _longest_call_seconds(policies):
+    # 재시도까지 포함해 호출 하나가 자리를 잡고 있을 수 있는 가장 긴 시간(초)
+    longest = 0
+    for name, overrides in policies.items():
+        pol = {**policies['default'], **overrides}
+        longest = max(longest, (pol['retries'] + 1) * (pol['timeout'] + pol['backoff_max']))
+    return longest
+
+
+# 반납되지 않은 자리를 회수하기까지의 시간(초). 자리는 연장하지 않으므로, 호출 중에 회수되지 않도록
+# 가장 긴 모델 정책의 호출 시간 + 자리 대기 + webhook 확인(reconcile) 간격보다 짧게는 설정할 수 없습니다.
+ADMISSION_LEASE_SECONDS = max(
+    int(os.getenv('ADMISSION_LEASE_SECONDS', '0')),
+    int(_longest_call_seconds(PROVIDER_POLICIES) + ADMISSION_WAIT_SECONDS + GENERATION_WEBHOOK_RECONCILE_SECONDS),
+)
+
+# Prometheus 지표 (/metrics, firstapp/metrics.py)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+# 프로세스별 지표 파일을 모으는 디렉터리 (웹/워커 프로세스가 함께 써야 함), 파일에 쓰는 간격(초)
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'capstondesign-metrics'))
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+# 비우지 않으면 /metrics 요청에 'Authorization: Bearer <토큰>'이 필요
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# provider HTTP 연결 풀 (firstapp/providers.py): 최대 연결 수, 유지할 유휴 연결 수, 유휴 연결 유지 시간(초),
+# 풀에 빈 연결이 없을 때 기다리는 시간(초)
+PROVIDER_POOL_MAX_CONNECTIONS = int(os.getenv('PROVIDER_POOL_MAX_CONNECTIONS', '100'))
+PROVIDER_POOL_MAX_KEEPALIVE = int(os.getenv('PROVIDER_POOL_MAX_KEEPALIVE', '20'))
+PROVIDER_POOL_KEEPALIVE_EXPIRY = float(os.getenv('PROVIDER_POOL_KEEPALIVE_EXPIRY', '30'))
+PROVIDER_POOL_TIMEOUT = float(os.getenv('PROVIDER_POOL_TIMEOUT', '10'))
+# REPLICATE_PROVIDER=record/replay 가 결과를 저장하고 읽는 디렉터리
+PROVIDER_CASSETTE_DIR = os.getenv('PROVIDER_CASSETTE_DIR', os.path.join(BASE_DIR, 'provider_cassettes'))
+
+# 정적 이미지 빌드 (python manage.py build_static_assets): 반응형 사본 폭, 같은 이름 사본의 최대 폭,
+# 이보다 작은 파일(바이트)은 그대로 둠
+STATIC_IMAGE_WIDTHS = [320, 640, 1280]
+STATIC_IMAGE_MAX_WIDTH = int(os.getenv('STATIC_IMAGE_MAX_WIDTH', '1600'))
+STATIC_IMAGE_MIN_BYTES = 32 * 1024
+# nginx 없이 배포할 때 Django가 STATIC_ROOT를 압축본/캐시 헤더와 함께 제공
+STATIC_SERVE_ENABLED = os.getenv('STATIC_SERVE_ENABLED', 'false').lower() == 'true'
+# 해시가 없는 이름으로 요청한 정적 파일의 캐시 시간(초). 해시 이름은 1년 + immutable
+STATIC_CACHE_MAX_AGE = int(os.getenv('STATIC_CACHE_MAX_AGE', '3600'))
+
+# GET 폼 페이지(홈/로그인/생성/분석/편집/영상)의 렌더링 결과 캐시 (firstapp/page_cache.py): 사용 여부, 유지 시간(초)
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'true').lower() == 'true'
+PAGE_CACHE_SECONDS = int(os.getenv('PAGE_CACHE_SECONDS', '600'))
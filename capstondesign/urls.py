@@ -15,22 +15,39 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from firstapp import views
+from django.urls import path, include, re_path
+from firstapp import static_assets, views
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 from django.conf.urls.static import static
 
+# ASGI로 배포할 때는 provider 호출을 기다리는 뷰들을 async 버전으로 연결합니다.
+if settings.ASYNC_VIEWS_ENABLED:
+    from firstapp import async_views as provider_views
+else:
+    provider_views = views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views.generate_images, name='main'),
-    path('analysis/', views.analysis_view, name='analysis'),
-    path('editing/', views.editing_view, name='editing'),
-    path('video/', views.video_view, name='video'),
+    path('', provider_views.generate_images, name='main'),
+    path('analysis/', provider_views.analysis_view, name='analysis'),
+    path('editing/', provider_views.editing_view, name='editing'),
+    path('video/', provider_views.video_view, name='video'),
+    # 이미지 생성 작업 (결과 페이지 / 상태 조회 / 진행 상황 스트림)
+    path('jobs/<uuid:job_id>/', views.generation_job, name='generation_job'),
+    path('jobs/<uuid:job_id>/status/', views.generation_job_status, name='generation_job_status'),
+    path('jobs/<uuid:job_id>/events/', provider_views.generation_job_events, name='generation_job_events'),
+    # provider 예측 완료 웹훅 (GENERATION_COMPLETION_MODE=webhook)
+    path('webhooks/replicate/', views.replicate_webhook, name='replicate_webhook'),
+    # Prometheus 지표
+    path('metrics', views.metrics_view, name='metrics'),
+    # 로컬에 저장한 생성 결과 (내용 해시 주소)
+    path('assets/<str:digest>/', views.media_asset, name='media_asset'),
+    path('assets/<str:digest>/<int:width>.<str:fmt>', views.media_asset_derivative, name='media_asset_derivative'),
     # 메인 화면
     path('home/', views.home_view, name='home'),
     # 로그인/로그아웃/회원가입
-    path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
+    path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('signup/', views.signup, name='signup'),
     
@@ -38,7 +55,16 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('delete_account/', views.delete_account, name='delete_account'),
     path('profile/<int:user_id>/', views.view_user_profile, name='view_user'),
+    # 프로필 갤러리 무한 스크롤 (다음 페이지 JSON)
+    path('profile/images/', views.profile_images, name='profile_images'),
+    path('profile/<int:user_id>/images/', views.view_user_images, name='view_user_images'),
+    # 업로드한 제품 사진과 비슷한 이전 생성 결과
+    path('similar/', views.similar_generations, name='similar_generations'),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if settings.STATIC_SERVE_ENABLED and not settings.DEBUG:
+    # nginx 없이 배포할 때 collectstatic 결과를 압축본/영구 캐시 헤더와 함께 제공합니다.
+    urlpatterns += [re_path(rf'^{settings.STATIC_URL.strip("/")}/(?P<path>.+)$', static_assets.serve)]
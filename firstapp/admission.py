@@ -0,0 +1,186 @@
+"""provider 호출 동시 실행 제한 (admission control)
+
+한 서버에서 여러 사용자가 동시에 N장씩 요청하면 provider 호출이 수십~수백 개 한꺼번에 나가
+provider 속도 제한에 걸리고, 재시도와 타임아웃이 겹쳐 모두가 느려집니다.
+예측을 시작하기 전에 아래 세 범위에서 자리(slot)를 하나씩 얻고, 끝나면 반납합니다.
+
+- global: 전체 동시 예측 수 (ADMISSION_GLOBAL_MAX_PREDICTIONS)
+- model:<이름>: 모델별 동시 예측 수 (ADMISSION_MODEL_MAX_PREDICTIONS, 'default'는 나머지 모델)
+- user:<id>: 사용자별 동시 예측 수 (ADMISSION_USER_MAX_PREDICTIONS)
+
+자리는 DB의 ProviderSlot 행이라 웹 서버와 워커 프로세스가 모두 같은 한도를 공유합니다.
+빈 자리는 조건부 UPDATE로 선점하므로(작업 큐와 같은 방식) 여러 프로세스가 같은 자리를 얻지 않으며,
+프로세스가 죽어 반납하지 못한 자리는 ADMISSION_LEASE_SECONDS가 지나면 다른 호출이 가져갑니다.
+(기본값은 가장 긴 모델 정책의 호출 시간보다 길게 정해지므로, 살아 있는 호출의 자리는 회수되지 않습니다)
+
+자리가 없으면 ADMISSION_WAIT_SECONDS까지 기다리고, 그래도 없으면 Overloaded를 던집니다.
+작업 등록 단계에서는 check_enqueue()가 대기열 길이를 확인해 기다리지 않고 바로 거절합니다. (429/503 + Retry-After)
+"""
+import asyncio
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .llm_cache import incr_counter
+from .models import GenerationJob, ProviderSlot
+
+REJECTED_COUNTER = 'admission.rejected'
+TIMEOUT_COUNTER = 'admission.timeouts'
+# 자리를 다시 확인하기까지의 대기 시간(초): 처음엔 짧게, 점점 길게 (최대값)
+_POLL_MIN = 0.05
+_POLL_MAX = 1.0
+
+# 이 프로세스에서 이미 행을 만들어 둔 (범위, 한도)
+_prepared_scopes = set()
+
+
+class Overloaded(Exception):
+    """지금은 처리할 수 없으니 retry_after초 뒤에 다시 시도하라는 거절"""
+
+    def __init__(self, message, status=503, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after if retry_after is not None else settings.ADMISSION_RETRY_AFTER_SECONDS
+
+
+def model_limit(model):
+    limits = settings.ADMISSION_MODEL_MAX_PREDICTIONS
+    return limits.get(model.split(':')[0], limits['default'])
+
+
+def scopes(model, user_id=None):
+    """(범위, 한도) 목록. 항상 같은 순서로 잡아 두 호출이 서로의 자리를 기다리며 멈추지 않게 합니다."""
+    result = [('global', settings.ADMISSION_GLOBAL_MAX_PREDICTIONS), (f'model:{model.split(":")[0]}', model_limit(model))]
+    if user_id:
+        result.append((f'user:{user_id}', settings.ADMISSION_USER_MAX_PREDICTIONS))
+    return result
+
+
+def _prepare(scope, limit):
+    if (scope, limit) in _prepared_scopes:
+        return
+    ProviderSlot.objects.bulk_create(
+        [ProviderSlot(scope=scope, slot=i) for i in range(limit)], ignore_conflicts=True,
+    )
+    _prepared_scopes.add((scope, limit))
+
+
+def _free(now):
+    return Q(holder='') | Q(expires_at__lt=now)
+
+
+def _claim(scope, limit, holder):
+    """scope의 빈 자리 하나를 holder 이름으로 선점합니다. 없으면 False"""
+    _prepare(scope, limit)
+    now = timezone.now()
+    free = list(ProviderSlot.objects
+                .filter(_free(now), scope=scope, slot__lt=limit)
+                .values_list('pk', flat=True)[:limit])
+    # 여러 프로세스가 같은 행부터 시도하지 않도록 섞습니다.
+    random.shuffle(free)
+    expires_at = now + timedelta(seconds=settings.ADMISSION_LEASE_SECONDS)
+    for pk in free:
+        if ProviderSlot.objects.filter(_free(now), pk=pk).update(holder=holder, expires_at=expires_at):
+            return True
+    return False
+
+
+def try_acquire(model, user_id=None, holder=None):
+    """모든 범위의 자리를 얻으면 holder 이름을, 하나라도 없으면 (잡은 자리를 반납하고) None을 반환합니다."""
+    if not settings.ADMISSION_ENABLED:
+        return holder or ''
+    holder = holder or uuid.uuid4().hex
+    for scope, limit in scopes(model, user_id):
+        if not _claim(scope, limit, holder):
+            release(holder)
+            return None
+    return holder
+
+
+def release(holder):
+    if holder:
+        ProviderSlot.objects.filter(holder=holder).update(holder='', expires_at=None)
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(_POLL_MAX, _POLL_MIN * 2 ** attempt))
+
+
+def acquire(model, user_id=None, holder=None, wait=None):
+    """자리가 날 때까지 최대 wait초(기본 ADMISSION_WAIT_SECONDS) 기다려 얻습니다."""
+    wait = settings.ADMISSION_WAIT_SECONDS if wait is None else wait
+    deadline = time.monotonic() + wait
+    attempt = 0
+    while True:
+        acquired = try_acquire(model, user_id, holder)
+        if acquired is not None:
+            return acquired
+        if time.monotonic() >= deadline:
+            incr_counter(TIMEOUT_COUNTER)
+            raise Overloaded(f"{model}: provider 호출이 밀려 있습니다. 잠시 후 다시 시도해주세요.")
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+async def aacquire(model, user_id=None, holder=None, wait=None):
+    """acquire()의 async 버전. 기다리는 동안 이벤트 루프를 막지 않습니다."""
+    wait = settings.ADMISSION_WAIT_SECONDS if wait is None else wait
+    deadline = time.monotonic() + wait
+    attempt = 0
+    while True:
+        acquired = await sync_to_async(try_acquire)(model, user_id, holder)
+        if acquired is not None:
+            return acquired
+        if time.monotonic() >= deadline:
+            await sync_to_async(incr_counter)(TIMEOUT_COUNTER)
+            raise Overloaded(f"{model}: provider 호출이 밀려 있습니다. 잠시 후 다시 시도해주세요.")
+        await asyncio.sleep(_backoff(attempt))
+        attempt += 1
+
+
+@contextmanager
+def admitted(model, user_id=None, wait=None):
+    """with 블록 동안 model 예측 자리를 잡아 둡니다."""
+    holder = acquire(model, user_id, wait=wait)
+    try:
+        yield
+    finally:
+        release(holder)
+
+
+@asynccontextmanager
+async def aadmitted(model, user_id=None, wait=None):
+    holder = await aacquire(model, user_id, wait=wait)
+    try:
+        yield
+    finally:
+        await sync_to_async(release)(holder)
+
+
+def check_enqueue(user):
+    """새 생성 작업을 받을 수 있는지 확인합니다. 받을 수 없으면 Overloaded를 던집니다.
+
+    - 사용자의 대기+실행 중 작업이 GENERATION_USER_MAX_ACTIVE_JOBS 이상이면 429
+    - 전체 대기 작업이 GENERATION_QUEUE_MAX 이상이면 503
+    """
+    if not settings.ADMISSION_ENABLED:
+        return
+    active = (GenerationJob.STATUS_QUEUED, GenerationJob.STATUS_RUNNING)
+    if user is not None and user.is_authenticated:
+        running = GenerationJob.objects.filter(user=user, status__in=active).count()
+        if running >= settings.GENERATION_USER_MAX_ACTIVE_JOBS:
+            incr_counter(REJECTED_COUNTER)
+            raise Overloaded(
+                f"진행 중인 생성 작업이 {running}개 있습니다. 끝난 뒤에 다시 요청해주세요.", status=429,
+            )
+    queued = GenerationJob.objects.filter(status=GenerationJob.STATUS_QUEUED).count()
+    if queued >= settings.GENERATION_QUEUE_MAX:
+        incr_counter(REJECTED_COUNTER)
+        raise Overloaded("지금은 요청이 많아 작업을 받을 수 없습니다. 잠시 후 다시 시도해주세요.", status=503)
@@ -0,0 +1,93 @@
+"""이미지 분석 결과 캐시
+
+분석 프롬프트는 고정이므로 결과는 이미지와 reasoning_effort/verbosity에만 달라집니다.
+같은 제품 사진으로 여러 번 분석하는 경우가 많아, 지각 해시가 가까운 이미지의 이전 결과를 재사용합니다.
+
+- 키: 이미지 dHash + reasoning_effort + verbosity
+- ANALYSIS_CACHE_MAX_DISTANCE 이하의 해밍 거리면 같은 이미지로 봅니다. (0이면 해시가 같을 때만)
+- TTL(ANALYSIS_CACHE_TTL_SECONDS)이 지난 결과는 사용하지 않습니다.
+- 사용자가 '다시 분석'을 선택하면 캐시를 건너뛰고 새 결과로 덮어씁니다.
+- 적중/미스 수는 텍스트 캐시처럼 프로세스 지표(firstapp_analysis_cache_requests_total)로 셉니다.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics, phash as phash_lib
+from .models import AnalysisCache
+
+REQUESTS_METRIC = 'firstapp_analysis_cache_requests_total'
+BAND_PREFIX = 'phash_band'
+# 가까운 해시 후보를 가져올 최대 개수
+MAX_CANDIDATES = 200
+
+
+def image_phash(path):
+    """분석할 이미지의 지각 해시. 읽을 수 없는 이미지면 None (캐시를 쓰지 않음)"""
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    return phash_lib.try_dhash(path)
+
+
+def lookup(phash, reasoning_effort, verbosity):
+    """가장 가까운 이전 분석 결과 텍스트. 없으면 None"""
+    if phash is None:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYSIS_CACHE_TTL_SECONDS)
+    entries = AnalysisCache.objects.filter(
+        reasoning_effort=reasoning_effort, verbosity=verbosity, created_at__gte=cutoff,
+    )
+    entry = entries.filter(phash=phash).order_by('-created_at').first()
+    max_distance = settings.ANALYSIS_CACHE_MAX_DISTANCE
+    if entry is None and max_distance > 0:
+        candidates = (entries.filter(phash_lib.near_q(phash, max_distance, BAND_PREFIX))
+                      .order_by('-created_at')
+                      .only('pk', 'phash', 'analysis_text')[:MAX_CANDIDATES])
+        best = None
+        for candidate in candidates:
+            distance = phash_lib.hamming(phash, candidate.phash)
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, candidate)
+        entry = best[1] if best else None
+
+    if entry is None:
+        metrics.inc(REQUESTS_METRIC, outcome='miss')
+        return None
+    AnalysisCache.objects.filter(pk=entry.pk).update(
+        last_used_at=timezone.now(), hit_count=F('hit_count') + 1,
+    )
+    metrics.inc(REQUESTS_METRIC, outcome='hit')
+    return entry.analysis_text
+
+
+def store(phash, reasoning_effort, verbosity, analysis_text):
+    if phash is None or not analysis_text:
+        return
+    # 같은 해시/옵션의 이전 결과는 새 결과로 바꿉니다. ('다시 분석' 포함)
+    AnalysisCache.objects.filter(phash=phash, reasoning_effort=reasoning_effort, verbosity=verbosity).delete()
+    AnalysisCache.objects.create(
+        phash=phash,
+        reasoning_effort=reasoning_effort,
+        verbosity=verbosity,
+        analysis_text=analysis_text,
+        **phash_lib.band_fields(phash, BAND_PREFIX),
+    )
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYSIS_CACHE_TTL_SECONDS)
+    AnalysisCache.objects.filter(created_at__lt=cutoff).delete()
+
+
+def cache_stats():
+    if not settings.METRICS_ENABLED:
+        return {'hits': None, 'misses': None, 'hit_rate': None, 'entries': AnalysisCache.objects.count()}
+    counters, _ = metrics.collect()
+    hits = counters.get((REQUESTS_METRIC, (('outcome', 'hit'),)), 0)
+    misses = counters.get((REQUESTS_METRIC, (('outcome', 'miss'),)), 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'entries': AnalysisCache.objects.count(),
+    }
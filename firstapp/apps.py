@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class FirstappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'firstapp'
+
+    def ready(self):
+        from .metrics import install_db_wrapper
+
+        # DB 쓰기 시간 측정 (firstapp/metrics.py)
+        connection_created.connect(install_db_wrapper, dispatch_uid='firstapp.metrics.db_writes')
@@ -0,0 +1,230 @@
+"""이미지 생성의 async 버전 (ASGI 배포용, firstapp/async_views.py에서 사용)
+
+generation.py와 같은 단계(번역 → 이미지 N장, 추천 문구는 동시에)를 이벤트 루프 위에서 실행합니다.
+provider 호출은 providers.arun으로 기다리므로 요청마다 스레드를 붙잡지 않습니다.
+
+ORM 접근:
+- 작업 상태/결과 저장은 Django async ORM(asave, aupdate)을 씁니다.
+  Django가 이를 하나의 전용 스레드에서 순서대로 실행하므로 이벤트 루프는 막히지 않습니다.
+- 완료 상태와 GeneratedImage는 generation.save_job_success()를 같은 ORM 스레드에서 실행해
+  한 트랜잭션, bulk_create 한 번으로 저장합니다.
+- 이미지 정규화/업로드처럼 오래 걸리는 동기 함수는 thread_sensitive=False로 별도 스레드 풀에서 실행해
+  ORM 스레드를 오래 점유하지 않게 합니다.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
+from django.utils import timezone
+
+from . import admission, llm_cache, providers
+from .generation import (_source_phash, build_prompts, flatten_output, flatten_output2, heartbeat, run_job,
+                         save_job_success)
+from .image_prep import prepare_image
+from .media_store import mirror_job_results
+from .model_pipelines import aget_background_pool, async_generate_background, async_run_pipeline, get_pipeline
+from .models import GenerationJob
+from .provider_files import open_input, resolve_image_input
+
+logger = logging.getLogger(__name__)
+
+# 이 프로세스(이벤트 루프)에서 동시에 실행되는 이미지 예측 수 제한
+_prediction_slots = asyncio.Semaphore(settings.GENERATION_MAX_CONCURRENT_PREDICTIONS)
+# 실행 중인 작업 태스크 (가비지 컬렉션으로 사라지지 않도록 참조를 들고 있음)
+_running_tasks = set()
+
+_prepare_image = sync_to_async(prepare_image, thread_sensitive=False)
+_resolve_image_input = sync_to_async(resolve_image_input, thread_sensitive=False)
+
+
+async def aclaim_job(job_id):
+    """방금 등록한 작업을 이 프로세스가 직접 실행하도록 선점합니다. (워커와 같은 조건부 UPDATE)"""
+    claimed = await GenerationJob.objects.filter(
+        id=job_id, status=GenerationJob.STATUS_QUEUED,
+    ).aupdate(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+        heartbeat_at=timezone.now(),
+        attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return None
+    return await GenerationJob.objects.aget(id=job_id)
+
+
+def runs_inline(request):
+    """이 요청에서 등록한 작업을 이벤트 루프에서 바로 실행할지 (GENERATION_ASYNC_INLINE)
+
+    ASGI 서버에서 받은 요청만 해당합니다. WSGI(runserver, 테스트 클라이언트 포함)에서 async 뷰를 부르면
+    요청마다 만든 이벤트 루프가 응답 뒤에 닫혀 태스크가 사라지므로, 큐에 두고 워커가 처리하게 합니다.
+    """
+    return settings.GENERATION_ASYNC_INLINE and isinstance(request, ASGIRequest)
+
+
+def start_job(job):
+    """작업을 이벤트 루프의 백그라운드 태스크로 실행합니다.
+
+    실행하는 동안 heartbeat_at을 갱신합니다. 프로세스가 재시작되면 태스크도 사라지고 heartbeat가 끊기므로,
+    run_generation_worker의 requeue_stale_jobs()가 다시 큐에 넣어 처리합니다.
+    """
+    if settings.GENERATION_COMPLETION_MODE == "webhook":
+        # 예측 제출만 하면 되므로 동기 버전을 스레드 풀에서 실행합니다.
+        run = sync_to_async(run_job, thread_sensitive=False)(job)
+    else:
+        run = run_job_async(job)
+    task = asyncio.create_task(_with_heartbeat(job, run))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return task
+
+
+async def _with_heartbeat(job, run):
+    async def beat():
+        while True:
+            await asyncio.sleep(settings.GENERATION_JOB_HEARTBEAT_SECONDS)
+            try:
+                await sync_to_async(heartbeat)([job.id])
+            except Exception:
+                logger.exception("Heartbeat of job %s failed", job.id)
+
+    beater = asyncio.create_task(beat())
+    try:
+        return await run
+    finally:
+        beater.cancel()
+
+
+async def run_job_async(job):
+    """generation.run_job()의 async 버전. 예외는 밖으로 던지지 않습니다."""
+    try:
+        await run_generation_job_async(job)
+        source_phash = await sync_to_async(_source_phash, thread_sensitive=False)(job)
+        await sync_to_async(save_job_success)(job, source_phash)
+    except Exception as e:
+        logger.exception("Generation job %s failed", job.id)
+        job.status = GenerationJob.STATUS_FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        try:
+            await job.asave(update_fields=['status', 'error', 'finished_at'])
+        except Exception:
+            logger.exception("Saving failure of job %s failed", job.id)
+        return job
+
+    if settings.ASSET_MIRROR_ENABLED:
+        try:
+            await sync_to_async(mirror_job_results, thread_sensitive=False)(job)
+        except Exception:
+            logger.exception("Mirroring results of job %s failed", job.id)
+    return job
+
+
+async def apredict_image(pipeline, full_prompt, aspect_ratio, product_image, background_url=None, user_id=None):
+    if pipeline.background and not background_url:
+        background_url = await apredict_background(pipeline, full_prompt, aspect_ratio, product_image, user_id)
+    async with _prediction_slots, admission.aadmitted(pipeline.model, user_id):
+        return await async_run_pipeline(pipeline, full_prompt, aspect_ratio, product_image, background_url)
+
+
+async def apredict_background(pipeline, full_prompt, aspect_ratio, product_image, user_id=None):
+    async with _prediction_slots, admission.aadmitted(pipeline.background.model, user_id):
+        return await async_generate_background(pipeline, full_prompt, aspect_ratio, product_image)
+
+
+async def run_generation_job_async(job):
+    """generation.run_generation_job()의 async 버전"""
+    pipeline = get_pipeline(job.model_choice)
+    if pipeline is None:
+        raise ValueError(f"지원하지 않는 모델입니다: {job.model_choice}")
+
+    full_prompt_, word_prompt = build_prompts(job.product_type, job.theme, job.mood, job.placement, job.user_prompt)
+    full_path = default_storage.path(job.upload_path)
+    upload_digest = job.upload_digest or await sync_to_async(llm_cache.file_digest, thread_sensitive=False)(full_path)
+
+    async def translate():
+        async def call():
+            async with admission.aadmitted("openai/o4-mini", job.user_id):
+                return flatten_output2(await providers.arun(
+                    "openai/o4-mini",
+                    input={"prompt": full_prompt_}, stage="translate",
+                ))
+        full_prompt = await llm_cache.acached_text_call("openai/o4-mini", {"prompt": full_prompt_}, call)
+        job.full_prompt = full_prompt
+        await job.asave(update_fields=["full_prompt"])
+        return full_prompt
+
+    async def copywrite():
+        async def call():
+            image_key, image_path = await _prepare_image(upload_digest, full_path, "openai/o4-mini")
+            async with admission.aadmitted("openai/o4-mini", job.user_id):
+                with open_input(await _resolve_image_input(image_key, image_path)) as f:
+                    output = await providers.arun(
+                        "openai/o4-mini",
+                        input={"prompt": word_prompt, "input_image": f}, stage="copy",
+                    )
+            return flatten_output(output)
+        text = await llm_cache.acached_text_call(
+            "openai/o4-mini", {"prompt": word_prompt}, call,
+            extra_key=upload_digest,
+        )
+        job.word_urls = [text]
+        await job.asave(update_fields=["word_urls"])
+        return job.word_urls
+
+    async def images():
+        translated = await translate()
+        image_number = job.image_number
+        product_image = await _resolve_image_input(*await _prepare_image(upload_digest, full_path, pipeline.model))
+        # 작업 하나가 동시에 보내는 예측 수 (동기 버전의 스레드 풀 크기와 같음)
+        per_job = asyncio.Semaphore(max(1, min(image_number, settings.GENERATION_PER_REQUEST_CONCURRENCY)))
+
+        async def background():
+            async with per_job:
+                return await apredict_background(pipeline, translated, job.aspect_ratio, product_image, job.user_id)
+
+        backgrounds = [None]
+        if pipeline.background and job.reuse_backgrounds:
+            pool_size = max(1, min(image_number, settings.GENERATION_BACKGROUND_POOL_SIZE))
+            backgrounds = await aget_background_pool(
+                pipeline, translated, job.aspect_ratio, upload_digest, pool_size, background,
+            )
+
+        async def one(index):
+            try:
+                async with per_job:
+                    url = await apredict_image(pipeline, translated, job.aspect_ratio, product_image,
+                                               backgrounds[index % len(backgrounds)], job.user_id)
+            except Exception as e:
+                logger.exception("Image prediction failed (job %s)", job.id)
+                return index, {"url": None, "error": str(e)}
+            return index, ({"url": url} if url else {"url": None, "error": "생성 결과가 없습니다."})
+
+        # 끝나는 순서대로 자리에 채우고 저장해 결과 스트림에서 바로 보이게 합니다.
+        results = [{"url": None, "pending": True} for _ in range(image_number)]
+        tasks = [asyncio.create_task(one(i)) for i in range(image_number)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, result = await finished
+                results[index] = result
+                await GenerationJob.objects.filter(id=job.id).aupdate(results=results)
+        finally:
+            # 추천 문구가 실패해 취소되면 아직 끝나지 않은 예측도 취소합니다.
+            for task in tasks:
+                task.cancel()
+        if not any(r["url"] for r in results):
+            raise RuntimeError(results[0]["error"] if results else "생성된 이미지가 없습니다.")
+        return results
+
+    # 한쪽이 실패하면 다른 쪽을 취소해, 실패한 작업에 예측을 더 보내거나 결과를 쓰지 않게 합니다.
+    try:
+        async with asyncio.TaskGroup() as group:
+            words = group.create_task(copywrite())
+            results = group.create_task(images())
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
+    job.word_urls, job.results = words.result(), results.result()
+    return job
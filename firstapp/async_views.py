@@ -0,0 +1,267 @@
+"""async 뷰 (ASGI 배포용)
+
+ASYNC_VIEWS_ENABLED=true이면 capstondesign/urls.py가 같은 주소를 이 뷰들로 연결합니다.
+provider 호출을 providers.arun 등으로 기다리므로, 요청 하나가 수십 초~수 분 걸려도
+스레드를 붙잡지 않고 ASGI 프로세스 하나가 많은 요청을 동시에 처리할 수 있습니다.
+
+- 템플릿 렌더링은 request.user/세션 조회(ORM)를 하므로 sync_to_async로 실행합니다.
+- 업로드 저장/이미지 정규화/provider 업로드 같은 동기 파일·네트워크 작업은
+  thread_sensitive=False로 스레드 풀에서 실행합니다.
+- 입력값 검증, 프롬프트, 결과 파싱은 views.py의 함수를 그대로 씁니다.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+from . import admission, analysis_cache, page_cache, providers, resilience
+from .async_generation import aclaim_job, runs_inline, start_job
+from .generation import flatten_output, get_output_url
+from .image_prep import prepare_image
+from .models import GenerationJob
+from .provider_files import open_input, resolve_image_input
+from .streaming import ajob_events, sse_event, sse_response, wants_event_stream
+from .uploads import store_upload
+from .views import (VIDEO_MODELS, _analysis_input, _cached_analysis, _generation_form, _job_created_response,
+                    _overloaded_response, _parse_analysis, _provider_error_message, _video_input)
+
+logger = logging.getLogger(__name__)
+
+arender = sync_to_async(render)
+# GET 폼 페이지 (firstapp/page_cache.py)
+arender_page = sync_to_async(page_cache.render)
+arender_to_string = sync_to_async(render_to_string)
+_store_upload = sync_to_async(store_upload, thread_sensitive=False)
+_store_analysis = sync_to_async(analysis_cache.store)
+
+
+async def _prepared_input(upload, model):
+    """정규화한 입력 이미지를 provider URL(또는 로컬 경로)로 반환합니다."""
+    image_key, image_path = await sync_to_async(prepare_image, thread_sensitive=False)(upload.digest, upload.path, model)
+    return await sync_to_async(resolve_image_input, thread_sensitive=False)(image_key, image_path)
+
+
+async def generate_images(request):
+    if request.method != "POST":
+        return await arender_page(request, "main.html")
+
+    params, uploaded_file, error = _generation_form(request)
+    if error:
+        return await arender(request, "main.html", {"error": error})
+    user = await request.auser()
+    try:
+        await sync_to_async(admission.check_enqueue)(user)
+    except admission.Overloaded as e:
+        return await sync_to_async(_overloaded_response)(request, e)
+
+    upload = await _store_upload(uploaded_file)
+    job = await GenerationJob.objects.acreate(
+        user=user if user.is_authenticated else None,
+        upload_path=upload.name,
+        upload_digest=upload.digest,
+        **params,
+    )
+
+    # 이 프로세스의 이벤트 루프에서 바로 실행합니다. 아니면 워커가 큐에서 가져가 처리합니다.
+    if runs_inline(request):
+        claimed = await aclaim_job(job.id)
+        if claimed is not None:
+            start_job(claimed)
+    return _job_created_response(request, job)
+
+
+async def generation_job_events(request, job_id):
+    """작업 진행 상황 스트림 (async 제너레이터라 연결마다 스레드를 쓰지 않음)"""
+    job = await GenerationJob.objects.filter(id=job_id).afirst()
+    if job is None:
+        raise Http404
+    if job.user_id:
+        user = await request.auser()
+        if job.user_id != user.id and not (
+            user.is_authenticated and await sync_to_async(lambda: user.userprofile.is_admin)()
+        ):
+            raise Http404
+    return sse_response(ajob_events(job.id))
+
+
+async def _analysis_events(request, user_id, upload, model_input, image_hash, cached_text=None):
+    if cached_text is not None:
+        yield sse_event("token", {"text": cached_text})
+        analysis_text = cached_text
+    else:
+        yield sse_event("status", {"status": "analyzing"})
+        chunks = []
+        try:
+            async with admission.aadmitted("openai/gpt-5", user_id):
+                with open_input(await _prepared_input(upload, "openai/gpt-5")) as f:
+                    async for text in providers.astream("openai/gpt-5", {**model_input, "image_input": [f]}, stage="analysis"):
+                        if text:
+                            chunks.append(text)
+                            yield sse_event("token", {"text": text})
+        except Exception as e:
+            logger.exception("Analysis Error: %s", e)
+            yield sse_event("error", {"error": _provider_error_message(e, "분석 중 오류가 발생했습니다.")})
+            return
+        analysis_text = flatten_output("".join(chunks))
+        await _store_analysis(image_hash, model_input["reasoning_effort"], model_input["verbosity"], analysis_text)
+
+    lines, parsed_data = _parse_analysis(analysis_text)
+    html = await arender_to_string("result_analysis.html", {
+        "original_iamge_url": upload.url,
+        "analysis_text": lines,
+        "parsed_data": parsed_data,
+        "from_cache": cached_text is not None,
+    }, request=request)
+    yield sse_event("done", {"html": html})
+
+
+@login_required(login_url='login')
+async def analysis_view(request):
+    if request.method != "POST":
+        return await arender_page(request, "analysis.html")
+
+    uploaded_file = request.FILES.get("target_image")
+    if not uploaded_file:
+        return await arender(request, "analysis.html", {"error": "이미지를 선택해주세요."})
+
+    upload = await _store_upload(uploaded_file)
+    user = await request.auser()
+    model_input = _analysis_input(request)
+    image_hash, cached_text = await sync_to_async(_cached_analysis)(request, upload.path, model_input)
+    if wants_event_stream(request):
+        return sse_response(_analysis_events(request, user.id, upload, model_input, image_hash, cached_text))
+
+    analysis_text = cached_text
+    if cached_text is None:
+        try:
+            async with admission.aadmitted("openai/gpt-5", user.id):
+                with open_input(await _prepared_input(upload, "openai/gpt-5")) as f:
+                    output = await providers.arun("openai/gpt-5", input={**model_input, "image_input": [f]}, stage="analysis")
+            analysis_text = flatten_output(output)
+        except admission.Overloaded as e:
+            return await sync_to_async(_overloaded_response)(request, e, "analysis.html")
+        except Exception as e:
+            logger.exception("Analysis Error: %s", e)
+            return await arender(request, "analysis.html", {"error": _provider_error_message(e, "분석 중 오류가 발생했습니다.")})
+        await _store_analysis(image_hash, model_input["reasoning_effort"], model_input["verbosity"], analysis_text)
+
+    lines, parsed_data = _parse_analysis(analysis_text)
+    return await arender(request, "result_analysis.html", {
+        "original_iamge_url": upload.url,
+        "analysis_text": lines,
+        "parsed_data": parsed_data,
+        "from_cache": cached_text is not None,
+    })
+
+
+async def _editing_events(request, user_id, upload, user_prompt):
+    yield sse_event("status", {"status": "uploading"})
+    try:
+        async with admission.aadmitted("bytedance/seedream-4", user_id):
+            with resilience.guard("bytedance/seedream-4", stage="editing"):
+                with open_input(await _prepared_input(upload, "bytedance/seedream-4")) as f:
+                    prediction = await providers.acreate(
+                        "bytedance/seedream-4", {"image_input": [f], "prompt": user_prompt}, stage="editing",
+                    )
+                timeout = resilience.policy("bytedance/seedream-4")["timeout"]
+                deadline = time.monotonic() + timeout
+                status = None
+                while True:
+                    if prediction.status != status:
+                        status = prediction.status
+                        yield sse_event("status", {"status": status})
+                    if status in ("succeeded", "failed", "canceled"):
+                        break
+                    if time.monotonic() >= deadline:
+                        await prediction.async_cancel()
+                        raise resilience.PredictionTimeout("bytedance/seedream-4", timeout)
+                    await asyncio.sleep(settings.EDITING_POLL_INTERVAL)
+                    await prediction.async_reload()
+                if status != "succeeded":
+                    raise RuntimeError(prediction.error or status)
+        image_url = str(get_output_url(prediction.output)).strip()
+    except Exception as e:
+        logger.exception("Editing Error: %s", e)
+        yield sse_event("error", {"error": _provider_error_message(e, "이미지 편집 중 오류가 발생했습니다.")})
+        return
+
+    yield sse_event("image", {"url": image_url})
+    html = await arender_to_string("result_editing.html", {
+        "original_image_url": upload.url,
+        "edited_image_url": image_url,
+        "prompt": user_prompt,
+    }, request=request)
+    yield sse_event("done", {"html": html})
+
+
+@login_required(login_url='login')
+async def editing_view(request):
+    if request.method != "POST":
+        return await arender_page(request, "editing.html")
+
+    uploaded_file = request.FILES.get("edit_image")
+    user_prompt = request.POST.get("edit_positive_prompt")
+    if not uploaded_file:
+        return await arender(request, "editing.html", {"error": "편집할 이미지를 첨부해주세요."})
+    if not user_prompt:
+        return await arender(request, "editing.html", {"error": "어떻게 편집할지 내용을 입력해주세요."})
+
+    upload = await _store_upload(uploaded_file)
+    user = await request.auser()
+    if wants_event_stream(request):
+        return sse_response(_editing_events(request, user.id, upload, user_prompt))
+
+    try:
+        async with admission.aadmitted("bytedance/seedream-4", user.id):
+            with open_input(await _prepared_input(upload, "bytedance/seedream-4")) as f:
+                output = await providers.arun(
+                    "bytedance/seedream-4",
+                    input={"image_input": [f], "prompt": user_prompt}, stage="editing",
+                )
+        image_url = str(get_output_url(output)).strip()
+    except admission.Overloaded as e:
+        return await sync_to_async(_overloaded_response)(request, e, "editing.html")
+    except Exception as e:
+        logger.exception("Editing Error: %s", e)
+        return await arender(request, "editing.html", {"error": _provider_error_message(e, "이미지 편집 중 오류가 발생했습니다.")})
+
+    return await arender(request, "result_editing.html", {
+        "original_image_url": upload.url,
+        "edited_image_url": image_url,
+        "prompt": user_prompt,
+    })
+
+
+@login_required(login_url='login')
+async def video_view(request):
+    if request.method != "POST":
+        return await arender_page(request, "video.html")
+
+    uploaded_file = request.FILES.get("video_image")
+    if not uploaded_file:
+        return await arender(request, "video.html", {"error": "이미지를 선택해주세요."})
+
+    video_model = request.POST.get('video_model', 'google/veo-3.1')
+    if video_model not in VIDEO_MODELS:
+        return await arender(request, "video.html", {"error": f"지원하지 않는 모델입니다: {video_model}"})
+
+    upload = await _store_upload(uploaded_file)
+    user = await request.auser()
+    try:
+        async with admission.aadmitted(video_model, user.id):
+            with open_input(await _prepared_input(upload, video_model)) as f:
+                output = await providers.arun(video_model, input={"image": f, **_video_input(request)}, stage="video")
+        video_url = get_output_url(output)
+    except admission.Overloaded as e:
+        return await sync_to_async(_overloaded_response)(request, e, "video.html")
+    except Exception as e:
+        logger.exception("Video Generation Error: %s", e)
+        return await arender(request, "video.html", {"error": f"영상 생성 중 오류가 발생했습니다: {str(e)}"})
+
+    return await arender(request, "result_video.html", {"video_url": video_url})
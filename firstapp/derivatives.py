@@ -0,0 +1,62 @@
+"""갤러리/결과 화면용 썸네일과 반응형 크기 이미지
+
+원본(MediaAsset)에서 필요한 크기·포맷을 처음 요청될 때 만들어 디스크에 저장하고,
+이후에는 저장된 파일을 그대로 돌려줍니다.
+"""
+import io
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .media_store import write_atomic, asset_path, store_dir
+
+FORMATS = {
+    # 포맷 이름: (Pillow 포맷, content type, 저장 옵션)
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def allowed_widths():
+    return [settings.ASSET_THUMBNAIL_WIDTH] + list(settings.ASSET_RESPONSIVE_WIDTHS)
+
+
+def derivative_path(digest, width, fmt):
+    return store_dir() / 'derivatives' / digest[:2] / f'{digest}-{width}.{fmt}'
+
+
+def get_or_create_derivative(asset, width, fmt):
+    """width 폭으로 줄인 이미지를 만들고 경로를 반환합니다. (원본보다 크게 늘리지는 않음)"""
+    if fmt not in FORMATS or width not in allowed_widths():
+        raise ValueError(f'지원하지 않는 크기/포맷입니다: {width} {fmt}')
+
+    path = derivative_path(asset.digest, width, fmt)
+    if path.exists():
+        return path
+
+    data = encode_image(asset_path(asset), width, fmt)
+    # 동시에 같은 파일을 만들더라도 완성된 파일만 보이도록 임시 파일에 쓰고 옮깁니다.
+    write_atomic(path, [data])
+    return path
+
+
+def encode_image(source_path, width, fmt):
+    """source_path 이미지를 width 폭(원본보다 크게 늘리지는 않음)의 fmt 포맷 bytes로 인코딩합니다."""
+    pil_format, _, save_options = FORMATS[fmt]
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            # JPEG는 투명도를 지원하지 않으므로 흰 배경에 합칩니다.
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+
+        buffer = io.BytesIO()
+        image.save(buffer, pil_format, **save_options)
+    return buffer.getvalue()
+
+
+def content_type(fmt):
+    return FORMATS[fmt][1]
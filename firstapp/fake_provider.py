@@ -0,0 +1,297 @@
+"""로컬 대체 provider (개발/테스트/벤치마크용, REPLICATE_PROVIDER=fake)
+
+replicate.Client 대신 providers.client로 사용합니다. 실제 provider를 호출하지 않고
+모델별 지연/오류 분포(PROFILES)에 따라 모델 종류에 맞는 가짜 결과를 돌려줍니다.
+
+- run()/async_run()/stream()/async_stream(): 기다린 뒤 결과를 바로 반환
+- predictions.create(webhook=..., wait=...): 예측을 반환하고, 별도 스레드에서 완료 후
+  실제 provider와 같은 헤더로 서명한 완료 웹훅을 webhook URL로 보냅니다.
+  wait초 안에 끝나는 예측은 실제 provider처럼 완료된 상태로 반환합니다.
+- files.create(): 파일을 받은 것처럼 가짜 URL을 반환
+
+지연은 모델별 중앙값/p95로 정한 로그정규분포에서 뽑고 FAKE_PROVIDER_LATENCY_SCALE을 곱합니다.
+error_rate 비율의 예측은 실패로 끝나고, throttle_rate 비율의 요청은 429 오류로 거절됩니다.
+FAKE_PROVIDER_DELAY를 정하면 모든 예측이 그 시간 뒤에 성공합니다. (오류 없음)
+
+webhook 모드의 전체 흐름(제출 → 웹훅 → 다음 단계 제출 → 완료)과 부하 테스트(benchmark 명령)를
+비용 없이 확인할 수 있습니다.
+"""
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils import timezone
+from replicate.exceptions import ModelError, ReplicateError
+
+logger = logging.getLogger(__name__)
+
+_ids = itertools.count(1)
+
+# 모델별 지연(초, 중앙값/p95), 실패율, 429 거절률, 결과 형태
+#   text: 토큰 목록, url: 파일 URL 하나, urls: 파일 URL 목록
+# 'clipnpaper/'처럼 '/'로 끝나는 키는 그 계정의 모든 모델에 적용됩니다.
+PROFILES = {
+    'default': {'median': 5, 'p95': 15, 'error_rate': 0.0, 'throttle_rate': 0.0, 'output': 'urls'},
+    'openai/o4-mini': {'median': 3, 'p95': 8, 'error_rate': 0.01, 'output': 'text'},
+    'openai/gpt-5': {'median': 25, 'p95': 60, 'error_rate': 0.02, 'output': 'text'},
+    'black-forest-labs/flux-kontext-pro': {'median': 8, 'p95': 15, 'error_rate': 0.01, 'output': 'url'},
+    'google/nano-banana-pro': {'median': 20, 'p95': 45, 'error_rate': 0.02, 'throttle_rate': 0.01, 'output': 'url'},
+    # LoRA 배경 모델: 콜드 부팅 때문에 꼬리가 깁니다.
+    'clipnpaper/': {'median': 12, 'p95': 40, 'error_rate': 0.02, 'output': 'urls'},
+    'bytedance/seedream-4': {'median': 15, 'p95': 30, 'error_rate': 0.01, 'output': 'urls'},
+    'google/veo-3.1': {'median': 90, 'p95': 180, 'error_rate': 0.03, 'output': 'url'},
+}
+
+
+def _output_url():
+    if settings.FAKE_PROVIDER_OUTPUT_URL:
+        return settings.FAKE_PROVIDER_OUTPUT_URL
+    return f"{settings.WEBHOOK_BASE_URL.rstrip('/')}{static('images/prod_1.jpg')}"
+
+
+@functools.cache
+def _version_names():
+    # 버전으로 만든 예측은 모델 이름 없이 버전 해시만 받으므로 파이프라인에서 이름을 찾습니다.
+    from .model_pipelines import PIPELINES
+
+    names = {}
+    for pipeline in PIPELINES.values():
+        for model in (pipeline.model, pipeline.background.model if pipeline.background else ''):
+            if ':' in model:
+                name, version = model.split(':', 1)
+                names[version] = name
+    return names
+
+
+def model_name(model):
+    name = (model or '').split(':')[0]
+    return _version_names().get(name, name)
+
+
+def profile(model):
+    profiles = {**PROFILES, **settings.FAKE_PROVIDER_PROFILES}
+    name = model_name(model)
+    entry = profiles.get(name)
+    if entry is None:
+        entry = next((v for k, v in profiles.items() if k.endswith('/') and name.startswith(k)), {})
+    return {**profiles['default'], **entry}
+
+
+def fake_output(model, input):
+    """모델 종류에 맞는 가짜 결과 (텍스트 모델은 토큰 목록, 나머지는 결과 파일 URL)"""
+    kind = profile(model)['output']
+    if kind == 'text':
+        if "input_image" in input:
+            return ["가짜 광고 문구 1\n", "가짜 광고 문구 2\n", "가짜 광고 문구 3"]
+        if "image_input" in input:
+            return ["Product: 가짜 분석 결과"]
+        return ["A product photo ", "in a fake scene."]
+    if kind == 'url':
+        return _output_url()
+    return [_output_url()]
+
+
+def post_webhook(url, headers, body):
+    httpx.post(url, content=body, headers=headers, timeout=10)
+
+
+class FakePrediction:
+    def __init__(self, model, input):
+        self.id = f"fake{next(_ids)}{uuid.uuid4().hex[:8]}"
+        self.model = model
+        self.input = input
+        self.status = "starting"
+        self.output = None
+        self.error = None
+        self.created_at = timezone.now()
+        self.completed_at = None
+        self.done = threading.Event()
+
+    def reload(self):
+        # 완료 스레드가 같은 객체를 바꾸므로 다시 읽을 것이 없습니다.
+        pass
+
+    async def async_reload(self):
+        pass
+
+    def cancel(self):
+        if self.status in ("starting", "processing"):
+            self.status = "canceled"
+            self.done.set()
+
+    async def async_cancel(self):
+        self.cancel()
+
+    def payload(self):
+        return {
+            "id": self.id,
+            "model": self.model,
+            "status": self.status,
+            "output": self.output,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+
+class _FakePredictions:
+    def __init__(self, provider):
+        self._provider = provider
+
+    def create(self, model=None, version=None, input=None, webhook=None, webhook_events_filter=None,
+               wait=None, **kwargs):
+        prediction = self._provider.submit(model or version, input or {}, webhook)
+        if wait:
+            # 실제 provider의 'Prefer: wait'처럼 wait초 안에 끝나면 결과까지 담아 돌려줍니다.
+            prediction.done.wait(wait)
+        return prediction
+
+    async def async_create(self, *args, **kwargs):
+        return await asyncio.to_thread(self.create, *args, **kwargs)
+
+    def get(self, id):
+        return self._provider.predictions_by_id[id]
+
+    def cancel(self, id):
+        prediction = self._provider.predictions_by_id[id]
+        prediction.cancel()
+        return prediction
+
+
+class _FakeModels:
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+
+class _FakeFile:
+    def __init__(self):
+        self.id = f"file{next(_ids)}"
+        self.urls = {"get": f"https://fake-provider.local/files/{self.id}"}
+        self.expires_at = (timezone.now() + timedelta(days=1)).isoformat()
+
+
+class _FakeFiles:
+    def create(self, file, **kwargs):
+        return _FakeFile()
+
+
+class FakeReplicateClient:
+    """replicate.Client 중 이 프로젝트가 쓰는 부분만 흉내 냅니다.
+
+    delay를 정하면 모든 예측이 delay초 뒤에 성공하고, 정하지 않으면 모델별 분포(PROFILES)를 따릅니다.
+    deliver(url, headers, body)로 웹훅 전송 방법을 바꿀 수 있습니다. (기본: HTTP POST)
+    """
+
+    def __init__(self, delay=None, deliver=post_webhook, scale=None, seed=None):
+        self.delay = settings.FAKE_PROVIDER_DELAY if delay is None else delay
+        self.scale = settings.FAKE_PROVIDER_LATENCY_SCALE if scale is None else scale
+        self.deliver = deliver
+        self.random = random.Random(seed)
+        self.predictions_by_id = {}
+        self.predictions = _FakePredictions(self)
+        self.models = _FakeModels(self.predictions)
+        self.files = _FakeFiles()
+
+    def sample(self, model, input):
+        """(지연 초, 실패 메시지 또는 None)"""
+        if self.delay is not None:
+            return self.delay, None
+        p = profile(model)
+        # 중앙값과 p95로 정한 로그정규분포 (p95 = 중앙값 * e^(1.645σ))
+        sigma = math.log(max(p['p95'], p['median']) / p['median']) / 1.645
+        latency = self.random.lognormvariate(math.log(p['median']), sigma) * self.scale
+        if self.random.random() < p['error_rate']:
+            return latency, f"fake: {model_name(model)} 예측 실패 (주입된 오류)"
+        return latency, None
+
+    def output(self, model, input):
+        return fake_output(model, input)
+
+    def _throttle(self, model):
+        if self.delay is None and self.random.random() < profile(model)['throttle_rate']:
+            raise ReplicateError(status=429, detail=f"fake: {model_name(model)} 요청이 너무 많습니다.")
+
+    def _result(self, model, input, error):
+        if error:
+            prediction = FakePrediction(model, input)
+            prediction.status = "failed"
+            prediction.error = error
+            raise ModelError(prediction)
+        return self.output(model, input)
+
+    def run(self, model, input=None, **kwargs):
+        input = input or {}
+        self._throttle(model)
+        latency, error = self.sample(model, input)
+        time.sleep(latency)
+        return self._result(model, input, error)
+
+    async def async_run(self, model, input=None, **kwargs):
+        input = input or {}
+        self._throttle(model)
+        latency, error = self.sample(model, input)
+        await asyncio.sleep(latency)
+        return self._result(model, input, error)
+
+    def stream(self, model, input=None, **kwargs):
+        yield from self.run(model, input)
+
+    async def async_stream(self, model, input=None, **kwargs):
+        output = await self.async_run(model, input)
+
+        async def events():
+            for token in output:
+                yield token
+        return events()
+
+    def submit(self, model, input, webhook=None):
+        self._throttle(model)
+        prediction = FakePrediction(model, input)
+        self.predictions_by_id[prediction.id] = prediction
+        latency, error = self.sample(model, input)
+        timer = threading.Timer(latency, self._complete, args=(prediction, webhook, error))
+        timer.daemon = True
+        timer.start()
+        return prediction
+
+    def _complete(self, prediction, webhook, error=None):
+        if prediction.status == "canceled":
+            return
+        if error:
+            prediction.error = error
+            prediction.status = "failed"
+        else:
+            prediction.output = self.output(prediction.model, prediction.input)
+            prediction.status = "succeeded"
+        prediction.completed_at = timezone.now()
+        prediction.done.set()
+        if webhook:
+            self.send_webhook(webhook, prediction.payload())
+
+    def send_webhook(self, url, payload):
+        from .webhooks import sign
+
+        body = json.dumps(payload).encode()
+        webhook_id = f"msg_{uuid.uuid4().hex}"
+        timestamp = str(int(time.time()))
+        headers = {
+            "content-type": "application/json",
+            "webhook-id": webhook_id,
+            "webhook-timestamp": timestamp,
+            "webhook-signature": f"v1,{sign(webhook_id, timestamp, body)}",
+        }
+        try:
+            self.deliver(url, headers, body)
+        except Exception:
+            logger.exception("Fake webhook delivery failed: %s", url)
@@ -0,0 +1,323 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import GeneratedImage, GenerationJob, Prediction
+from .stages import Stage, closing_connection, run_stages
+from . import admission, llm_cache, phash, providers
+from .image_prep import prepare_image
+from .media_store import mirror_job_results
+from .provider_files import open_input, resolve_image_input
+from .model_pipelines import get_pipeline, get_background_pool, generate_background, run_pipeline
+
+logger = logging.getLogger(__name__)
+
+# 프로세스 전체에서 동시에 실행되는 이미지 예측 수 제한
+_prediction_slots = threading.BoundedSemaphore(settings.GENERATION_MAX_CONCURRENT_PREDICTIONS)
+
+def flatten_output(output):
+    if isinstance(output, list):
+        return ' '.join(str(item).strip() for item in output if item).replace("\n", " ").strip()
+    elif isinstance(output, str):
+        return output.replace("\n", " ").strip()
+    return str(output).strip()
+
+def flatten_output2(o):
+    if isinstance(o, list):
+        return ''.join(s for s in o if s).strip()
+    return (o or '').strip()
+
+def get_output_url(output):
+    """Replicate 결과를 안전하게 문자열 URL로 변환"""
+    if not output: return None
+    if isinstance(output, list) and output: return str(output[0])
+    return str(output)
+
+def build_prompts(product_type, theme, mood, placement, user_prompt):
+    """번역용 프롬프트와 카피라이팅 프롬프트를 만듭니다."""
+    full_prompt_ = f"""
+        Translate the following product marketing scene into natural and realistic English, without listing:
+        "입력된 이미지에 있는 바로 그 {product_type} 제품의 외형(라벨 디자인, 병 모양, 색상 등)을 완벽하게 유지한 채, 다음 상황에 자연스럽게 배치된 고품질 광고 사진을 만드세요: {mood} 분위기의 {theme} 배경에서, 해당 {product_type}이(가) {placement}에 놓여 있습니다. {user_prompt}"
+        """.strip()
+
+    word_prompt = f"""
+        너의 역할은 카피라이터야.
+        상황을 기반으로, 술 마케팅에 어울리는 간결하고 감각적인 한국어 광고 문구 3가지를 추천해줘.
+        상황: {mood} 분위기의 {theme} 배경에서, 해당 {product_type}이(가) {placement}에 놓여 있습니다. {user_prompt}
+        제약 : 서론 없이 문구 3개만 줄바꿈으로 출력.
+        """.strip()
+    return full_prompt_, word_prompt
+
+
+# ---------------------------------------------------------------------------
+# 작업 큐
+# ---------------------------------------------------------------------------
+
+def enqueue_generation_job(user, upload_path, **params):
+    """생성 작업을 큐에 등록하고 바로 반환합니다. (실제 생성은 워커가 처리)"""
+    return GenerationJob.objects.create(
+        user=user if user is not None and user.is_authenticated else None,
+        upload_path=upload_path,
+        **params,
+    )
+
+def claim_next_job():
+    """대기 중인 작업 하나를 RUNNING으로 바꾸고 가져옵니다.
+
+    상태 조건을 건 UPDATE로 선점하므로 워커 프로세스가 여러 개여도
+    같은 작업을 두 번 실행하지 않습니다.
+    """
+    candidates = (GenerationJob.objects
+                  .filter(status=GenerationJob.STATUS_QUEUED)
+                  .order_by('created_at')
+                  .values_list('id', flat=True)[:10])
+    for job_id in candidates:
+        claimed = GenerationJob.objects.filter(
+            id=job_id, status=GenerationJob.STATUS_QUEUED,
+        ).update(
+            status=GenerationJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return GenerationJob.objects.get(id=job_id)
+    return None
+
+def heartbeat(job_ids):
+    """실행 중인 작업의 heartbeat_at을 갱신합니다. (requeue_stale_jobs가 살아 있는 작업을 다시 넣지 않도록)"""
+    if job_ids:
+        GenerationJob.objects.filter(id__in=job_ids, status=GenerationJob.STATUS_RUNNING).update(
+            heartbeat_at=timezone.now(),
+        )
+
+def requeue_stale_jobs(stale_seconds, max_attempts):
+    """워커가 죽어서 RUNNING에 멈춘 작업을 다시 큐에 넣거나 실패 처리합니다.
+
+    stale_seconds 동안 heartbeat가 없는 작업만 대상입니다. (heartbeat_at이 없는 이전 작업은 started_at 기준)
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    stale = (GenerationJob.objects
+             .filter(status=GenerationJob.STATUS_RUNNING)
+             .filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff))
+             # webhook 모드에서 완료 알림이나 다음 단계 진행을 기다리는 작업은 워커가 죽은 것이 아닙니다.
+             .exclude(predictions__status__in=[Prediction.STATUS_STARTING, Prediction.STATUS_PROCESSING])
+             .exclude(predictions__needs_advance=True))
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=GenerationJob.STATUS_FAILED,
+        error='작업 시간이 초과되었습니다.',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=GenerationJob.STATUS_QUEUED, started_at=None, heartbeat_at=None)
+    return requeued, failed
+
+def run_job(job):
+    """작업 하나를 실행하고 결과/상태를 저장합니다. 예외는 밖으로 던지지 않습니다."""
+    if settings.GENERATION_COMPLETION_MODE == "webhook":
+        return start_webhook_job(job)
+    try:
+        run_generation_job(job)
+        save_job_success(job, _source_phash(job))
+    except Exception as e:
+        logger.exception("Generation job %s failed", job.id)
+        job.status = GenerationJob.STATUS_FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        try:
+            job.save(update_fields=['status', 'error', 'finished_at'])
+        except Exception:
+            # 실패 상태도 저장하지 못하면 heartbeat가 끊긴 뒤 requeue_stale_jobs가 정리합니다.
+            logger.exception("Saving failure of job %s failed", job.id)
+        return job
+
+    # 결과를 먼저 보여준 뒤, provider URL이 만료되기 전에 로컬 저장소로 내려받습니다.
+    # (실패해도 결과는 provider URL로 남아 있으므로 작업은 성공으로 둡니다)
+    if settings.ASSET_MIRROR_ENABLED:
+        try:
+            mirror_job_results(job)
+        except Exception:
+            logger.exception("Mirroring results of job %s failed", job.id)
+    return job
+
+def _source_phash(job):
+    # 나중에 같은 제품 사진으로 이전 결과를 찾을 수 있도록 업로드 이미지의 지각 해시를 함께 저장합니다.
+    if not job.user_id:
+        return ''
+    return phash.try_dhash(default_storage.path(job.upload_path)) or ''
+
+def generated_images(job, source_phash=''):
+    """성공한 결과마다 저장할 GeneratedImage (저장 전, bulk_create용)"""
+    return [
+        GeneratedImage(
+            user_id=job.user_id,
+            job=job,
+            image_url=result["url"],
+            prompt=job.full_prompt,
+            product_type=job.product_type,
+            theme=job.theme,
+            mood=job.mood,
+            placement=job.placement,
+            user_prompt=job.user_prompt,
+            source_phash=source_phash,
+        )
+        for result in job.results if result.get("url")
+    ]
+
+def save_job_success(job, source_phash=''):
+    """완료 상태와 GeneratedImage를 한 트랜잭션에서 저장합니다. (이미지 장수와 상관없이 INSERT 한 번)"""
+    job.status = GenerationJob.STATUS_SUCCEEDED
+    job.finished_at = timezone.now()
+    with transaction.atomic():
+        job.save(update_fields=['status', 'full_prompt', 'results', 'word_urls', 'finished_at'])
+        if job.user_id:
+            GeneratedImage.objects.bulk_create(generated_images(job, source_phash))
+
+def start_webhook_job(job):
+    """webhook 모드: 첫 예측만 제출하고 반환합니다. 이후 단계와 완료 처리는 firstapp/webhooks.py가 합니다."""
+    from . import webhooks
+
+    try:
+        webhooks.start_job(job)
+    except Exception as e:
+        logger.exception("Generation job %s failed", job.id)
+        try:
+            webhooks.fail_job(job, str(e))
+        except Exception:
+            logger.exception("Saving failure of job %s failed", job.id)
+    job.refresh_from_db()
+    return job
+
+def predict_image(pipeline, full_prompt, aspect_ratio, product_image, background_url=None, user_id=None):
+    """이미지 1장(custom_*는 배경→합성 체인 하나)을 생성하고 결과 URL(실패 시 None)을 반환합니다.
+
+    provider 호출마다 그 모델의 자리를 얻어서 실행합니다. (firstapp/admission.py)
+    """
+    if pipeline.background and not background_url:
+        background_url = predict_background(pipeline, full_prompt, aspect_ratio, product_image, user_id)
+    with _prediction_slots, admission.admitted(pipeline.model, user_id):
+        return run_pipeline(pipeline, full_prompt, aspect_ratio, product_image, background_url)
+
+def predict_background(pipeline, full_prompt, aspect_ratio, product_image, user_id=None):
+    with _prediction_slots, admission.admitted(pipeline.background.model, user_id):
+        return generate_background(pipeline, full_prompt, aspect_ratio, product_image)
+
+def run_generation_job(job):
+    """번역 → 이미지 N장(병렬), 추천 문구는 번역과 동시에 실행합니다.
+
+    추천 문구는 입력값과 업로드 이미지에만 의존하므로 이미지보다 먼저 끝나며,
+    끝나는 즉시 저장해 상태 조회에서 바로 보이도록 합니다.
+    """
+    product_type = job.product_type
+    theme = job.theme
+    mood = job.mood
+    placement = job.placement
+    user_prompt = job.user_prompt
+    aspect_ratio = job.aspect_ratio
+    image_number = job.image_number
+    pipeline = get_pipeline(job.model_choice)
+    if pipeline is None:
+        raise ValueError(f"지원하지 않는 모델입니다: {job.model_choice}")
+
+    full_prompt_, word_prompt = build_prompts(product_type, theme, mood, placement, user_prompt)
+    full_path = default_storage.path(job.upload_path)
+    # 업로드 저장소가 계산해 둔 해시를 쓰고, 이전 작업처럼 없으면 여기서 계산합니다.
+    upload_digest = job.upload_digest or llm_cache.file_digest(full_path)
+
+    def translate():
+        def call():
+            with admission.admitted("openai/o4-mini", job.user_id):
+                translated_prompt = providers.run(
+                    "openai/o4-mini",
+                    input={
+                        "prompt": full_prompt_,
+                    },
+                    stage="translate",
+                )
+            return flatten_output2(translated_prompt)
+        return llm_cache.cached_text_call("openai/o4-mini", {"prompt": full_prompt_}, call)
+
+    def copywrite():
+        def call():
+            image_key, image_path = prepare_image(upload_digest, full_path, "openai/o4-mini")
+            with open_input(resolve_image_input(image_key, image_path)) as f, \
+                    admission.admitted("openai/o4-mini", job.user_id):
+                output = providers.run(
+                    "openai/o4-mini",
+                    input={
+                        "prompt": word_prompt,
+                        "input_image": f,
+                    },
+                    stage="copy",
+                )
+            return flatten_output(output)
+        # 문구 생성에는 업로드 이미지도 들어가므로 이미지 내용 해시를 키에 포함합니다.
+        text = llm_cache.cached_text_call(
+            "openai/o4-mini", {"prompt": word_prompt}, call,
+            extra_key=upload_digest,
+        )
+        return [text]
+
+    def images(translate):
+        # N장을 동시에 요청하고 결과는 요청 순서대로 모읍니다.
+        max_workers = max(1, min(image_number, settings.GENERATION_PER_REQUEST_CONCURRENCY))
+        # 제품 이미지는 한 번만 올리고 모든 호출(배경의 mask, 합성 입력 포함)에서 같은 URL을 사용합니다.
+        product_image = resolve_image_input(*prepare_image(upload_digest, full_path, pipeline.model))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            backgrounds = [None]
+            if pipeline.background and job.reuse_backgrounds:
+                # 배경을 장면당 몇 장만 만들고 N장의 합성에 돌려가며 사용합니다.
+                pool_size = max(1, min(image_number, settings.GENERATION_BACKGROUND_POOL_SIZE))
+                backgrounds = get_background_pool(
+                    pipeline, translate, aspect_ratio, upload_digest, pool_size,
+                    lambda: closing_connection(predict_background, pipeline, translate, aspect_ratio,
+                                               product_image, job.user_id),
+                    executor,
+                )
+            futures = {
+                executor.submit(closing_connection, predict_image, pipeline, translate, aspect_ratio, product_image,
+                                backgrounds[i % len(backgrounds)], job.user_id): i
+                for i in range(image_number)
+            }
+            # 결과는 요청 순서 자리에 채우고, 한 장 끝날 때마다 저장해 바로 보여줍니다.
+            results = [{"url": None, "pending": True} for _ in range(image_number)]
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    generated_url = future.result()
+                except Exception as e:
+                    logger.exception("Image prediction failed (job %s)", job.id)
+                    results[index] = {"url": None, "error": str(e)}
+                else:
+                    if generated_url:
+                        results[index] = {"url": generated_url}
+                    else:
+                        results[index] = {"url": None, "error": "생성 결과가 없습니다."}
+                GenerationJob.objects.filter(id=job.id).update(results=results)
+        if not any(r["url"] for r in results):
+            raise RuntimeError(results[0]["error"] if results else "생성된 이미지가 없습니다.")
+        return results
+
+    def on_stage_done(name, result):
+        # 단계 결과를 바로 저장합니다. (스케줄러를 실행한 스레드에서 호출됨)
+        if name == "translate":
+            job.full_prompt = result
+            job.save(update_fields=["full_prompt"])
+        elif name == "copy":
+            job.word_urls = result
+            job.save(update_fields=["word_urls"])
+
+    stage_results = run_stages([
+        Stage("translate", translate),
+        Stage("copy", copywrite),
+        Stage("images", images, deps=["translate"]),
+    ], on_stage_done=on_stage_done)
+
+    job.full_prompt = stage_results["translate"]
+    job.results = stage_results["images"]
+    job.word_urls = stage_results["copy"]
+    return job
@@ -0,0 +1,66 @@
+"""모델 입력 전 업로드 이미지 정규화
+
+EXIF 회전 적용 → 모델별 최대 변 길이로 축소 → 메타데이터 제거 → 재인코딩.
+결과는 (원본 해시, 최대 변 길이)별로 한 번만 만들어 MEDIA_ROOT/normalized에 저장합니다.
+"""
+import hashlib
+import io
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .media_store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+def max_edge_for(model):
+    limits = settings.MODEL_INPUT_MAX_EDGE
+    return limits.get(model.split(':')[0], limits['default'])
+
+
+def normalized_path(digest, max_edge, ext):
+    return Path(settings.MEDIA_ROOT) / 'normalized' / digest[:2] / f'{digest}-{max_edge}{ext}'
+
+
+def prepare_image(digest, path, model):
+    """model에 보낼 이미지를 준비하고 (캐시 키, 파일 경로)를 반환합니다.
+
+    캐시 키는 provider 업로드 캐시(provider_files)에서 사용합니다.
+    이미지를 열 수 없으면 원본을 그대로 돌려줍니다.
+    """
+    if not settings.IMAGE_NORMALIZE_ENABLED:
+        return digest, path
+    max_edge = max_edge_for(model)
+    key = hashlib.sha256(f'{digest}:{max_edge}'.encode()).hexdigest()
+
+    for ext in ('.jpg', '.png'):
+        cached = normalized_path(digest, max_edge, ext)
+        if cached.exists():
+            return key, str(cached)
+
+    try:
+        with Image.open(path) as source:
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            if has_alpha and image.convert('RGBA').getchannel('A').getextrema() == (255, 255):
+                has_alpha = False  # 알파 채널이 있어도 전부 불투명하면 JPEG로 충분합니다.
+            buffer = io.BytesIO()
+            # 새 이미지로 저장하므로 EXIF 등 메타데이터는 따라오지 않습니다.
+            if has_alpha:
+                # 배경을 지운 제품 사진은 투명도를 유지해야 하므로 PNG로 저장
+                image.convert('RGBA').save(buffer, 'PNG', optimize=True)
+                ext = '.png'
+            else:
+                image.convert('RGB').save(buffer, 'JPEG', quality=settings.IMAGE_NORMALIZE_JPEG_QUALITY, optimize=True)
+                ext = '.jpg'
+    except Exception:
+        logger.exception("Image normalization failed, sending original (%s)", path)
+        return digest, path
+
+    target = normalized_path(digest, max_edge, ext)
+    write_atomic(target, [buffer.getvalue()])
+    return key, str(target)
@@ -0,0 +1,157 @@
+"""텍스트 LLM 호출 캐시
+
+같은 입력(제품 종류/테마/분위기/배치/키워드)으로 들어온 번역·광고 문구 요청은
+provider를 다시 호출하지 않고 저장된 결과를 돌려줍니다.
+
+- 키: 모델 이름 + 정규화된 입력값(+ 이미지가 포함되면 이미지 내용 해시)
+- TTL(LLM_CACHE_TTL_SECONDS)이 지난 항목은 사용하지 않습니다.
+- 항목 수가 LLM_CACHE_MAX_ENTRIES를 넘으면 가장 오래 사용되지 않은 항목부터 지웁니다. (LRU)
+  저장할 때마다 세지 않고 LLM_CACHE_EVICT_EVERY번 저장할 때마다, 또는 `llm_cache --evict` 명령으로 정리합니다.
+- 적중/미스 수는 조회마다 DB에 쓰지 않고 프로세스 지표(firstapp_llm_cache_requests_total)로 셉니다.
+  그래서 METRICS_ENABLED=false면 세지 않으며, cache_stats()의 적중/미스 수와 적중률은 None입니다.
+"""
+import hashlib
+import itertools
+import json
+import unicodedata
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Counter, TextCompletionCache
+
+REQUESTS_METRIC = 'firstapp_llm_cache_requests_total'
+
+# 이 프로세스에서 저장한 횟수 (LLM_CACHE_EVICT_EVERY번마다 evict)
+_stores = itertools.count(1)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        # 유니코드 정규화 + 연속 공백 정리
+        return ' '.join(unicodedata.normalize('NFC', value).split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def file_digest(path):
+    """파일 내용의 sha256 (이미지가 포함된 호출의 캐시 키에 사용)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_key(model_name, inputs):
+    payload = json.dumps([model_name, _normalize(inputs)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def text_call_key(model_name, inputs, extra_key=None):
+    """cached_text_call()이 쓰는 캐시 키 (호출을 직접 제출하고 결과를 나중에 저장하는 경우용)"""
+    return make_key(model_name, {'inputs': inputs, 'extra': extra_key})
+
+
+def incr_counter(name, amount=1):
+    if not Counter.objects.filter(name=name).update(value=F('value') + amount):
+        try:
+            Counter.objects.create(name=name, value=amount)
+        except IntegrityError:
+            # 다른 프로세스가 먼저 만든 경우
+            Counter.objects.filter(name=name).update(value=F('value') + amount)
+
+
+def cache_stats():
+    if not settings.METRICS_ENABLED:
+        # 지표를 끄면 적중/미스를 세지 않으므로 0 대신 알 수 없음으로 보여줍니다.
+        return {'hits': None, 'misses': None, 'hit_rate': None, 'entries': TextCompletionCache.objects.count()}
+    counters, _ = metrics.collect()
+    hits = counters.get((REQUESTS_METRIC, (('outcome', 'hit'),)), 0)
+    misses = counters.get((REQUESTS_METRIC, (('outcome', 'miss'),)), 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'entries': TextCompletionCache.objects.count(),
+    }
+
+
+def lookup(key):
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)
+    entry = TextCompletionCache.objects.filter(key=key, created_at__gte=cutoff).first()
+    if entry is None:
+        metrics.inc(REQUESTS_METRIC, outcome='miss')
+        return None
+    TextCompletionCache.objects.filter(pk=entry.pk).update(
+        last_used_at=timezone.now(), hit_count=F('hit_count') + 1,
+    )
+    metrics.inc(REQUESTS_METRIC, outcome='hit')
+    return entry.response
+
+
+def store(key, model_name, response):
+    if not settings.LLM_CACHE_ENABLED:
+        return
+    now = timezone.now()
+    fields = {'model_name': model_name, 'response': response, 'created_at': now, 'last_used_at': now}
+    # update_or_create는 트랜잭션 안에서 읽은 뒤 쓰기 때문에 SQLite에서 잠금 충돌이 나기 쉬워
+    # 단일 UPDATE / INSERT 문으로 처리합니다.
+    if not TextCompletionCache.objects.filter(key=key).update(**fields):
+        try:
+            TextCompletionCache.objects.create(key=key, **fields)
+        except IntegrityError:
+            TextCompletionCache.objects.filter(key=key).update(**fields)
+    if next(_stores) % settings.LLM_CACHE_EVICT_EVERY == 0:
+        evict()
+
+
+def evict():
+    """만료된 항목과 최대 개수를 넘는 오래된 항목을 지우고, 지운 개수를 반환합니다."""
+    cutoff = timezone.now() - timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS)
+    deleted, _ = TextCompletionCache.objects.filter(created_at__lt=cutoff).delete()
+    overflow = TextCompletionCache.objects.count() - settings.LLM_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        oldest = TextCompletionCache.objects.order_by('last_used_at').values_list('pk', flat=True)[:overflow]
+        deleted += TextCompletionCache.objects.filter(pk__in=list(oldest)).delete()[0]
+    return deleted
+
+
+def cached_text_call(model_name, inputs, call, extra_key=None):
+    """캐시를 먼저 확인하고, 없으면 call()을 실행해 결과(문자열)를 저장합니다.
+
+    inputs는 provider에 보내는 입력값 중 결과에 영향을 주는 값들,
+    extra_key는 파일처럼 그대로 키에 넣을 수 없는 입력의 해시입니다.
+    """
+    key = text_call_key(model_name, inputs, extra_key)
+    cached = lookup(key)
+    if cached is not None:
+        return cached
+    response = call()
+    store(key, model_name, response)
+    return response
+
+
+async def acached_text_call(model_name, inputs, call, extra_key=None):
+    """cached_text_call()의 async 버전. call은 코루틴 함수입니다.
+
+    캐시 조회/저장은 ORM이라 sync_to_async로 실행하고, provider 호출만 이벤트 루프에서 기다립니다.
+    """
+    key = text_call_key(model_name, inputs, extra_key)
+    cached = await sync_to_async(lookup)(key)
+    if cached is not None:
+        return cached
+    response = await call()
+    await sync_to_async(store)(key, model_name, response)
+    return response
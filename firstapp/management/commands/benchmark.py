@@ -0,0 +1,339 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.test.signals import template_rendered
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from firstapp import generation, providers, webhooks
+from firstapp.models import GenerationJob
+
+ENDPOINTS = ("generation", "analysis", "editing", "video")
+FINISHED = (GenerationJob.STATUS_SUCCEEDED, GenerationJob.STATUS_FAILED)
+
+
+def percentile(values, q):
+    """가장 가까운 순위 방식의 백분위수"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class _QueryCounter:
+    """모든 DB 연결의 쿼리 수 (전체 / 스레드별)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0
+        self.local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.total += 1
+        self.local.count = getattr(self.local, "count", 0) + 1
+        return execute(sql, params, many, context)
+
+    def thread_count(self):
+        return getattr(self.local, "count", 0)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = ("가짜 provider(REPLICATE_PROVIDER=fake)로 생성/분석/편집/영상 요청을 동시에 보내 "
+            "처리량, 지연 백분위수, DB 쿼리 수를 측정합니다.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=4, help="동시에 요청하는 가상 사용자 수")
+        parser.add_argument("--requests", type=int, default=3, help="사용자마다 엔드포인트별로 보내는 요청 수")
+        parser.add_argument(
+            "--endpoints", default=",".join(ENDPOINTS),
+            help=f"측정할 엔드포인트 (쉼표로 구분: {', '.join(ENDPOINTS)})",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=settings.GENERATION_WORKER_CONCURRENCY,
+            help="생성 작업을 처리할 워커 스레드 수 (같은 프로세스에서 실행)",
+        )
+        parser.add_argument("--model", default="flux", help="생성 요청의 모델 (flux, nanobanana, custom_* ...)")
+        parser.add_argument("--count", type=int, default=2, help="생성 요청 하나의 이미지 장수")
+        parser.add_argument(
+            "--latency-scale", type=float, default=0.05,
+            help="가짜 provider 지연 배율 (1이면 실제 모델과 비슷한 지연)",
+        )
+        parser.add_argument("--seed", type=int, default=None, help="가짜 provider 난수 시드 (지연/오류 재현)")
+        parser.add_argument("--image", default=None, help="업로드할 이미지 (기본: 정적 샘플 이미지)")
+        parser.add_argument("--cold", action="store_true", help="LLM/분석 캐시를 끄고 측정합니다.")
+        parser.add_argument("--timeout", type=float, default=600, help="생성 작업 하나를 기다리는 최대 시간(초)")
+        parser.add_argument("--output", help="결과를 JSON으로 저장할 파일")
+        parser.add_argument("--baseline", help="비교할 이전 결과 JSON (p95가 느려지면 실패)")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="--baseline 비교 시 허용하는 p95 증가율/처리량 감소율 (0.2 = 20%%)",
+        )
+
+    def handle(self, *args, **options):
+        if settings.REPLICATE_PROVIDER not in ("fake", "replay"):
+            raise CommandError("벤치마크는 REPLICATE_PROVIDER=fake 또는 replay 에서만 실행합니다. (실제 provider 비용 방지)")
+        endpoints = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"알 수 없는 엔드포인트: {', '.join(sorted(unknown))}")
+        image_path = options["image"] or os.path.join(settings.BASE_DIR, "firstapp", "static", "images", "prod_1.jpg")
+        with open(image_path, "rb") as f:
+            self.image = (os.path.basename(image_path), f.read())
+        self.options = options
+
+        client = providers.client
+        client.scale = options["latency_scale"]
+        client.delay = None
+        if options["seed"] is not None:
+            client.random.seed(options["seed"])
+        # 완료 웹훅은 HTTP 대신 같은 프로세스의 테스트 클라이언트로 전달합니다.
+        client.deliver = self._deliver_webhook
+
+        work_dir = tempfile.mkdtemp(prefix="benchmark-")
+        overrides = {
+            "MEDIA_ROOT": os.path.join(work_dir, "media"),
+            "ASSET_STORE_DIR": os.path.join(work_dir, "assets"),
+            "ASSET_MIRROR_ENABLED": False,
+            "METRICS_DIR": os.path.join(work_dir, "metrics"),
+        }
+        if options["cold"]:
+            overrides.update(LLM_CACHE_ENABLED=False, ANALYSIS_CACHE_ENABLED=False)
+        test_db = self._setup_database(work_dir)
+        setup_test_environment()
+        self._rendered = threading.local()
+        template_rendered.connect(self._on_render)
+        try:
+            with override_settings(**overrides):
+                report = self._run(endpoints)
+        finally:
+            template_rendered.disconnect(self._on_render)
+            teardown_test_environment()
+            connection.creation.destroy_test_db(test_db, verbosity=0)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        self._print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"결과 저장: {options['output']}")
+        if options["baseline"]:
+            self._compare(report, options["baseline"], options["tolerance"])
+
+    # ------------------------------------------------------------------
+    # 준비
+    # ------------------------------------------------------------------
+
+    def _setup_database(self, work_dir):
+        """실제 DB를 건드리지 않도록 테스트 DB를 만들어 씁니다. (SQLite는 여러 스레드가 함께 쓰도록 파일로)"""
+        old_name = connection.settings_dict["NAME"]
+        if connection.vendor == "sqlite":
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(work_dir, "benchmark.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return old_name
+
+    def _deliver_webhook(self, url, headers, body):
+        parts = urlsplit(url)
+        try:
+            Client().post(
+                f"{parts.path}?{parts.query}", body, content_type="application/json",
+                headers={k: v for k, v in headers.items() if k != "content-type"},
+            )
+        finally:
+            connection.close()
+
+    def _upload(self, field):
+        name, content = self.image
+        return {field: SimpleUploadedFile(name, content, content_type="image/jpeg")}
+
+    # ------------------------------------------------------------------
+    # 실행
+    # ------------------------------------------------------------------
+
+    def _run(self, endpoints):
+        options = self.options
+        counter = _QueryCounter()
+        connection_created.connect(counter.install, weak=False)
+        for conn in connections.all(initialized_only=True):
+            counter.install(connection=conn)
+
+        stop = threading.Event()
+        workers = [threading.Thread(target=self._worker, args=(stop,), daemon=True)
+                   for _ in range(max(1, options["workers"]))]
+        samples = defaultdict(list)  # 엔드포인트 → [(초, 성공 여부, 쿼리 수)]
+        lock = threading.Lock()
+
+        def record(name, seconds, ok, queries):
+            with lock:
+                samples[name].append((seconds, ok, queries))
+
+        users = [
+            User.objects.create_user(f"bench-{uuid.uuid4().hex[:8]}", password=uuid.uuid4().hex)
+            for _ in range(max(1, options["users"]))
+        ]
+        threads = [threading.Thread(target=self._user, args=(user, endpoints, counter, record)) for user in users]
+        started = time.monotonic()
+        try:
+            for thread in workers + threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            stop.set()
+            for thread in workers:
+                thread.join()
+            connection_created.disconnect(counter.install)
+        elapsed = time.monotonic() - started
+
+        report = {
+            "users": options["users"],
+            "requests": options["requests"],
+            "workers": options["workers"],
+            "latency_scale": options["latency_scale"],
+            "mode": settings.GENERATION_COMPLETION_MODE,
+            "elapsed": elapsed,
+            "db_queries": counter.total,
+            "endpoints": {},
+        }
+        for name, rows in sorted(samples.items()):
+            latencies = [seconds for seconds, ok, _ in rows if ok]
+            report["endpoints"][name] = {
+                "requests": len(rows),
+                "errors": sum(1 for _, ok, _ in rows if not ok),
+                "throughput": len(latencies) / elapsed if elapsed else 0.0,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "queries_per_request": sum(q for _, _, q in rows) / len(rows),
+            }
+        return report
+
+    def _worker(self, stop):
+        webhook_mode = settings.GENERATION_COMPLETION_MODE == "webhook"
+        try:
+            while not stop.is_set():
+                # webhook 모드: 완료 알림을 받은 예측의 다음 단계 (run_generation_worker와 같은 순서)
+                prediction = webhooks.claim_completed() if webhook_mode else None
+                if prediction is not None:
+                    webhooks.advance(prediction)
+                    continue
+                job = generation.claim_next_job()
+                if job is None:
+                    stop.wait(0.05)
+                    continue
+                generation.run_job(job)
+        finally:
+            connection.close()
+
+    def _user(self, user, endpoints, counter, record):
+        http = Client()
+        http.force_login(user)
+        try:
+            for endpoint in endpoints:
+                for _ in range(self.options["requests"]):
+                    getattr(self, f"_request_{endpoint}")(http, counter, record)
+        finally:
+            connection.close()
+
+    def _on_render(self, sender, template, context, **kwargs):
+        # 테스트 클라이언트의 response.context는 다른 스레드의 렌더링까지 모으므로, 이 스레드의 오류만 따로 기록합니다.
+        errors = getattr(self._rendered, "errors", None)
+        if errors is not None and context.get("error"):
+            errors.append(context.get("error"))
+
+    def _timed_post(self, http, counter, path, data, **extra):
+        self._rendered.errors = []
+        before = counter.thread_count()
+        started = time.monotonic()
+        response = http.post(path, data, **extra)
+        return response, time.monotonic() - started, counter.thread_count() - before
+
+    def _view_error(self, response):
+        if response.status_code >= 400:
+            return f"HTTP {response.status_code}"
+        return self._rendered.errors[0] if self._rendered.errors else None
+
+    def _request_generation(self, http, counter, record):
+        data = {"model": self.options["model"], "count": str(self.options["count"]), **self._upload("image")}
+        started = time.monotonic()
+        response, seconds, queries = self._timed_post(http, counter, "/", data, HTTP_ACCEPT="application/json")
+        record("generation.submit", seconds, response.status_code == 202, queries)
+        if response.status_code != 202:
+            record("generation", time.monotonic() - started, False, queries)
+            return
+        status_url = f"/jobs/{response.json()['job_id']}/status/"
+        deadline = started + self.options["timeout"]
+        status = None
+        while time.monotonic() < deadline:
+            status = http.get(status_url).json()["status"]
+            if status in FINISHED:
+                break
+            time.sleep(0.05)
+        record("generation", time.monotonic() - started, status == GenerationJob.STATUS_SUCCEEDED, queries)
+
+    def _request_analysis(self, http, counter, record):
+        response, seconds, queries = self._timed_post(http, counter, "/analysis/", self._upload("target_image"))
+        record("analysis", seconds, self._view_error(response) is None, queries)
+
+    def _request_editing(self, http, counter, record):
+        data = {"edit_positive_prompt": "밝은 해변 배경으로 바꿔주세요", **self._upload("edit_image")}
+        response, seconds, queries = self._timed_post(http, counter, "/editing/", data)
+        record("editing", seconds, self._view_error(response) is None, queries)
+
+    def _request_video(self, http, counter, record):
+        response, seconds, queries = self._timed_post(http, counter, "/video/", self._upload("video_image"))
+        record("video", seconds, self._view_error(response) is None, queries)
+
+    # ------------------------------------------------------------------
+    # 결과
+    # ------------------------------------------------------------------
+
+    def _print_report(self, report):
+        def ms(value):
+            return "-" if value is None else f"{value * 1000:.0f}"
+
+        self.stdout.write(
+            f"사용자 {report['users']}명 x 요청 {report['requests']}회, 워커 {report['workers']}개, "
+            f"지연 배율 {report['latency_scale']}, mode={report['mode']}, {report['elapsed']:.1f}초"
+        )
+        self.stdout.write(f"{'endpoint':<18}{'req':>6}{'err':>6}{'req/s':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'q/req':>8}")
+        for name, row in report["endpoints"].items():
+            self.stdout.write(
+                f"{name:<18}{row['requests']:>6}{row['errors']:>6}{row['throughput']:>8.2f}"
+                f"{ms(row['p50']):>9}{ms(row['p95']):>9}{ms(row['p99']):>9}{row['queries_per_request']:>8.1f}"
+            )
+        self.stdout.write(f"전체 DB 쿼리: {report['db_queries']} (워커/웹훅 포함)")
+
+    def _compare(self, report, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, row in report["endpoints"].items():
+            old = baseline.get("endpoints", {}).get(name)
+            if not old:
+                continue
+            if old["p95"] and row["p95"] and row["p95"] > old["p95"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {old['p95'] * 1000:.0f}ms → {row['p95'] * 1000:.0f}ms")
+            if old["throughput"] and row["throughput"] < old["throughput"] * (1 - tolerance):
+                regressions.append(f"{name}: 처리량 {old['throughput']:.2f} → {row['throughput']:.2f} req/s")
+        if regressions:
+            raise CommandError("성능이 나빠졌습니다:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"기준 결과({baseline_path}) 대비 성능 저하 없음"))
@@ -0,0 +1,41 @@
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from firstapp import static_assets
+
+
+def _size(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+class Command(BaseCommand):
+    help = ("정적 이미지의 줄인 사본/반응형 WebP·JPEG 사본을 만들고, collectstatic으로 "
+            "내용 해시 이름과 gzip/brotli 압축본을 STATIC_ROOT에 만듭니다.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="이미 만든 이미지 사본도 다시 만듭니다.")
+        parser.add_argument("--images-only", action="store_true", help="이미지 사본만 만들고 collectstatic은 하지 않습니다.")
+
+    def handle(self, *args, **options):
+        index = static_assets.build_images(force=options["force"])
+        build_dir = Path(settings.STATIC_BUILD_DIR)
+        replaced = {name: path for name, path in static_assets._source_images() if (build_dir / name).exists()}
+        self.stdout.write(
+            f"이미지 {len(index)}개: 반응형 사본 {sum(len(v['webp']) + len(v['jpeg']) for v in index.values())}개, "
+            f"줄인 사본 {len(replaced)}개 ({_size(replaced.values()) / 1024:.0f}KB → "
+            f"{_size(build_dir / name for name in replaced) / 1024:.0f}KB)"
+        )
+        if options["images_only"]:
+            return
+
+        # 줄인 사본이 앱의 원본을 가리므로 생기는 'Found another file' 안내는 -v 2 이상에서만 보입니다.
+        call_command("collectstatic", interactive=False, verbosity=max(options["verbosity"] - 1, 0))
+        compressed = [path for path in Path(settings.STATIC_ROOT).rglob("*") if path.suffix in (".gz", ".br")]
+        self.stdout.write(
+            f"압축본 {len(compressed)}개 (brotli {'사용' if static_assets.brotli else '미설치, gzip만'}), "
+            f"STATIC_ROOT: {settings.STATIC_ROOT}"
+        )
@@ -0,0 +1,43 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from firstapp import phash
+from firstapp.media_store import asset_path
+from firstapp.models import GeneratedImage, MediaAsset
+
+
+class Command(BaseCommand):
+    help = "유사 이미지 검색용 지각 해시가 없는 기존 생성 이미지/로컬 사본의 해시를 계산합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=5000, help="한 번에 처리할 최대 개수 (종류별)")
+
+    def handle(self, *args, **options):
+        limit = options["limit"]
+
+        # 결과 이미지: 로컬 사본 파일에서 계산
+        assets = MediaAsset.objects.filter(phash='', content_type__startswith='image/')[:limit]
+        asset_count = 0
+        for asset in assets:
+            value = phash.try_dhash(asset_path(asset))
+            if value:
+                MediaAsset.objects.filter(pk=asset.pk).update(phash=value)
+                asset_count += 1
+
+        # 제품(업로드) 이미지: 작업의 업로드 파일에서 계산. 같은 업로드는 한 번만 계산합니다.
+        upload_hashes = {}
+        image_count = 0
+        images = (GeneratedImage.objects
+                  .filter(source_phash='', job__isnull=False)
+                  .values_list('job__upload_path', flat=True)
+                  .distinct()[:limit])
+        for upload_path in images:
+            if upload_path not in upload_hashes and default_storage.exists(upload_path):
+                upload_hashes[upload_path] = phash.try_dhash(default_storage.path(upload_path))
+            value = upload_hashes.get(upload_path)
+            if value:
+                image_count += GeneratedImage.objects.filter(
+                    source_phash='', job__upload_path=upload_path,
+                ).update(source_phash=value)
+
+        self.stdout.write(f"결과 이미지 해시 {asset_count}건, 업로드 이미지 해시 {image_count}건을 저장했습니다.")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from firstapp import analysis_cache, llm_cache
+from firstapp.models import AnalysisCache, TextCompletionCache
+
+
+class Command(BaseCommand):
+    help = "텍스트 LLM 캐시와 이미지 분석 캐시의 적중률을 보여주거나 캐시를 비웁니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="캐시 항목을 모두 지웁니다. (적중/미스 수는 /metrics 지표라 지우지 않음)")
+        parser.add_argument("--evict", action="store_true",
+                            help="텍스트 캐시에서 만료된 항목과 LLM_CACHE_MAX_ENTRIES를 넘는 오래된 항목을 지웁니다.")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted, _ = TextCompletionCache.objects.all().delete()
+            analysis_deleted, _ = AnalysisCache.objects.all().delete()
+            self.stdout.write(f"캐시 항목 {deleted}개, 분석 캐시 항목 {analysis_deleted}개를 지웠습니다.")
+            return
+        if options["evict"]:
+            self.stdout.write(f"텍스트 캐시 항목 {llm_cache.evict()}개를 지웠습니다.")
+            return
+
+        for label, stats in (("텍스트", llm_cache.cache_stats()), ("이미지 분석", analysis_cache.cache_stats())):
+            if stats['hit_rate'] is None:
+                self.stdout.write(f"[{label}] 항목 {stats['entries']}개 / 적중률 알 수 없음 (METRICS_ENABLED=false)")
+                continue
+            self.stdout.write(
+                f"[{label}] 항목 {stats['entries']}개 / 적중 {stats['hits']} / 실패 {stats['misses']} "
+                f"/ 적중률 {stats['hit_rate']:.1%}"
+            )
@@ -0,0 +1,29 @@
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from firstapp.media_store import mirror_url
+from firstapp.models import GeneratedImage
+
+
+class Command(BaseCommand):
+    help = "아직 로컬 사본이 없는 생성 이미지를 내려받아 로컬 저장소에 연결합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=500, help="한 번에 처리할 최대 개수")
+
+    def handle(self, *args, **options):
+        images = GeneratedImage.objects.filter(asset__isnull=True).order_by("-created_at")[:options["limit"]]
+        mirrored = failed = 0
+        with httpx.Client(timeout=settings.ASSET_DOWNLOAD_TIMEOUT, follow_redirects=True) as http:
+            for image in images:
+                try:
+                    asset = mirror_url(image.image_url, http=http)
+                except Exception as e:
+                    # 오래된 provider URL은 이미 만료되었을 수 있습니다.
+                    failed += 1
+                    self.stderr.write(f"{image.id}: {e}")
+                    continue
+                GeneratedImage.objects.filter(pk=image.pk).update(asset=asset)
+                mirrored += 1
+        self.stdout.write(f"미러링 {mirrored}건, 실패 {failed}건")
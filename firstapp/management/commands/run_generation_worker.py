@@ -0,0 +1,126 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from firstapp.generation import claim_next_job, heartbeat, requeue_stale_jobs, run_job
+from firstapp.models import GenerationJob
+from firstapp.webhooks import advance, claim_completed, reconcile_predictions
+
+logger = logging.getLogger(__name__)
+
+
+def _run_in_thread(job):
+    # 스레드마다 DB 연결이 따로 열리므로 작업이 끝나면 닫아 줍니다.
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def _advance_in_thread(prediction):
+    # webhook 모드: 완료 알림을 받은 예측의 다음 단계를 제출합니다. 작업이 끝났으면 작업을 반환합니다.
+    try:
+        advance(prediction)
+        job = GenerationJob.objects.get(id=prediction.job_id)
+        return None if job.status == GenerationJob.STATUS_RUNNING else job
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "대기 중인 이미지 생성 작업(GenerationJob)을 처리하는 워커를 실행합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.GENERATION_WORKER_CONCURRENCY,
+            help="동시에 처리할 작업 수",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=settings.GENERATION_WORKER_POLL_INTERVAL,
+            help="대기 중인 작업이 없을 때 다시 확인하기까지의 시간(초)",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="대기 중인 작업을 모두 처리하면 종료합니다.",
+        )
+
+    def _maintain(self, in_flight):
+        # 이 워커가 실행 중인 작업의 heartbeat를 갱신하고, heartbeat가 끊긴 (다른 워커가 죽은) 작업을 정리합니다.
+        try:
+            heartbeat(set(in_flight.values()))
+            requeued, failed = requeue_stale_jobs(
+                settings.GENERATION_JOB_STALE_SECONDS, settings.GENERATION_JOB_MAX_ATTEMPTS,
+            )
+        except Exception:
+            # DB 잠금 등 일시적인 오류는 다음 주기에 다시 시도합니다.
+            logger.exception("Generation worker maintenance failed")
+            return
+        if requeued or failed:
+            self.stdout.write(f"멈춘 작업 정리: 재등록 {requeued}건, 실패 처리 {failed}건")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options["concurrency"])
+        poll_interval = options["poll_interval"]
+
+        webhook_mode = settings.GENERATION_COMPLETION_MODE == "webhook"
+        self.stdout.write(f"생성 워커 시작 (concurrency={concurrency}, mode={settings.GENERATION_COMPLETION_MODE})")
+        in_flight = {}  # future → 작업 id
+        reconcile_at = 0.0
+        maintain_at = 0.0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    close_old_connections()
+                    if time.monotonic() >= maintain_at:
+                        maintain_at = time.monotonic() + settings.GENERATION_JOB_HEARTBEAT_SECONDS
+                        self._maintain(in_flight)
+                    if webhook_mode and time.monotonic() >= reconcile_at:
+                        # 완료 웹훅이 유실된 예측을 provider에서 직접 확인합니다.
+                        reconcile_at = time.monotonic() + settings.GENERATION_WEBHOOK_RECONCILE_SECONDS / 2
+                        reconciled = reconcile_predictions()
+                        if reconciled:
+                            self.stdout.write(f"웹훅 없이 완료 확인: {reconciled}건")
+                    # 진행 중인 작업을 먼저 마무리하도록, 완료 알림을 받은 예측의 다음 단계부터 가져옵니다.
+                    while webhook_mode and len(in_flight) < concurrency:
+                        prediction = claim_completed()
+                        if prediction is None:
+                            break
+                        in_flight[executor.submit(_advance_in_thread, prediction)] = prediction.job_id
+                    # 빈 슬롯만큼 작업을 가져옵니다.
+                    while len(in_flight) < concurrency:
+                        job = claim_next_job()
+                        if job is None:
+                            break
+                        self.stdout.write(f"작업 시작: {job.id} ({job.model_choice} x{job.image_number})")
+                        in_flight[executor.submit(_run_in_thread, job)] = job.id
+
+                    if not in_flight:
+                        if options["once"]:
+                            break
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = in_flight.pop(future)
+                        try:
+                            job = future.result()
+                        except Exception:
+                            # 작업 하나의 오류(DB 잠금 등)로 워커 전체가 멈추지 않도록 기록만 합니다.
+                            # 끝나지 못한 작업은 heartbeat가 끊긴 뒤 requeue_stale_jobs가 다시 처리합니다.
+                            logger.exception("Generation job %s raised", job_id)
+                            continue
+                        if job is None:
+                            continue
+                        if job.status == GenerationJob.STATUS_RUNNING:
+                            # webhook 모드: 제출만 끝났고 나머지는 완료 알림을 받은 뒤 진행합니다.
+                            self.stdout.write(f"예측 제출 완료: {job.id}")
+                        else:
+                            self.stdout.write(f"작업 종료: {job.id} ({job.status})")
+            except KeyboardInterrupt:
+                self.stdout.write("종료 요청을 받았습니다. 진행 중인 작업을 마무리합니다...")
+                wait(in_flight)
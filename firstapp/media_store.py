@@ -0,0 +1,150 @@
+"""내용 주소 기반(content-addressed) 로컬 미디어 저장소
+
+파일은 sha256 해시로 이름을 붙여 ASSET_STORE_DIR/<앞 2글자>/<해시><확장자>에 저장합니다.
+같은 내용은 한 번만 저장되고, 이름이 내용으로 정해지므로 영구 캐시 헤더를 붙여 서빙할 수 있습니다.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+
+import httpx
+from django.conf import settings
+
+from . import phash
+from .models import GeneratedImage, MediaAsset
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def store_dir():
+    return Path(settings.ASSET_STORE_DIR)
+
+
+def asset_path(asset):
+    return store_dir() / asset.path
+
+
+def write_atomic(final_path, chunks):
+    # 완성된 파일만 보이도록 임시 파일에 쓰고 옮깁니다.
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=final_path.parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in chunks:
+                tmp.write(chunk)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def content_path(digest, ext='', namespace=''):
+    rel_path = Path(namespace) / digest[:2] / f'{digest}{ext}' if namespace else Path(digest[:2]) / f'{digest}{ext}'
+    return rel_path.as_posix()
+
+
+def put_chunks(chunks, ext='', namespace='', root=None):
+    """한 번만 읽을 수 있는 스트림(다운로드 등)을 해시하면서 임시 파일에 쓰고, 해시 이름으로 옮깁니다.
+
+    같은 내용이 이미 있으면 임시 파일만 지웁니다. (digest, root 기준 상대 경로, 크기)를 반환합니다.
+    """
+    root = Path(root) if root else store_dir()
+    base = root / namespace if namespace else root
+    base.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=base, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in chunks:
+                h.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+        digest = h.hexdigest()
+        rel_path = content_path(digest, ext, namespace)
+        final_path = root / rel_path
+        if final_path.exists():
+            os.remove(tmp_path)
+        else:
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest, rel_path, size
+
+
+def put_file(file, ext='', namespace='', root=None):
+    """다시 읽을 수 있는 파일(업로드 등)은 먼저 해시만 계산하고, 처음 보는 내용일 때만 디스크에 씁니다."""
+    root = Path(root) if root else store_dir()
+    h = hashlib.sha256()
+    size = 0
+    for chunk in file.chunks(CHUNK_SIZE):
+        h.update(chunk)
+        size += len(chunk)
+    digest = h.hexdigest()
+    rel_path = content_path(digest, ext, namespace)
+    final_path = root / rel_path
+    if not final_path.exists():
+        write_atomic(final_path, file.chunks(CHUNK_SIZE))
+    return digest, rel_path, size
+
+
+def mirror_url(url, http=None):
+    """원격 URL을 한 번만 내려받아 MediaAsset으로 저장합니다."""
+    existing = MediaAsset.objects.filter(source_url=url).first()
+    if existing is not None:
+        return existing
+
+    close = http is None
+    http = http or httpx.Client(timeout=settings.ASSET_DOWNLOAD_TIMEOUT, follow_redirects=True)
+    try:
+        with http.stream('GET', url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('content-type', '').split(';')[0] or 'application/octet-stream'
+            ext = mimetypes.guess_extension(content_type) or Path(httpx.URL(url).path).suffix
+            digest, rel_path, size = put_chunks(response.iter_bytes(CHUNK_SIZE), ext, namespace='generated')
+    finally:
+        if close:
+            http.close()
+
+    # 이미지면 유사 이미지 검색용 지각 해시를 함께 저장합니다.
+    image_phash = ''
+    if content_type.startswith('image/'):
+        image_phash = phash.try_dhash(store_dir() / rel_path) or ''
+    asset, _ = MediaAsset.objects.get_or_create(
+        digest=digest,
+        defaults={'path': rel_path, 'content_type': content_type, 'size': size, 'source_url': url,
+                  'phash': image_phash},
+    )
+    return asset
+
+
+def mirror_job_results(job):
+    """작업 결과 이미지를 로컬로 내려받고 결과/GeneratedImage에 연결합니다.
+
+    미러링에 실패해도 provider URL로 계속 볼 수 있으므로 예외는 기록만 합니다.
+    """
+    changed = False
+    with httpx.Client(timeout=settings.ASSET_DOWNLOAD_TIMEOUT, follow_redirects=True) as http:
+        for result in job.results:
+            if not result.get('url') or result.get('asset'):
+                continue
+            try:
+                asset = mirror_url(result['url'], http=http)
+            except Exception:
+                logger.exception("Failed to mirror %s", result['url'])
+                continue
+            result['asset'] = asset.digest
+            changed = True
+            GeneratedImage.objects.filter(job=job, image_url=result['url']).update(asset=asset)
+    if changed:
+        job.save(update_fields=['results'])
+    return job
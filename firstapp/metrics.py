@@ -0,0 +1,372 @@
+"""Prometheus 형식 지표 (/metrics)
+
+provider 호출(모델/단계별 지연, 성공·실패, 업로드 바이트), DB 쓰기, 템플릿 렌더링 시간, 페이지 캐시 적중을
+히스토그램과 카운터로 모아 /metrics에서 Prometheus 텍스트 형식으로 보여줍니다.
+
+- 값은 프로세스 메모리에 모으고, METRICS_FLUSH_SECONDS마다 METRICS_DIR/<pid>-<id>.json에 씁니다.
+  /metrics는 디렉터리의 모든 파일을 더해 보여주므로 웹 서버와 워커 프로세스의 값이 합쳐집니다.
+  끝난 프로세스의 파일은 collect()가 자기 값에 더한 뒤 지우므로, 카운터는 줄지 않고 파일 수는 늘지 않습니다.
+  (배포할 때 디렉터리를 비우면 0부터 다시 셉니다.)
+- DB 쓰기는 연결마다 execute wrapper를 달아 INSERT/UPDATE/DELETE 문만 잽니다. (apps.py)
+- 템플릿 렌더링은 TEMPLATES의 BACKEND를 InstrumentedDjangoTemplates로 바꿔 잽니다.
+- 캐시 적중/거절 같은 DB 카운터(Counter 모델)는 이미 모든 프로세스가 공유하므로 그대로 내보냅니다.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 900)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+RENDER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+# 이름: (종류, 설명, 히스토그램 구간)
+METRICS = {
+    'firstapp_provider_request_duration_seconds': (
+        'histogram', 'provider 예측 하나가 끝나기까지의 시간 (재시도 포함)', PROVIDER_BUCKETS),
+    'firstapp_provider_requests_total': ('counter', 'provider 예측 수 (outcome=success/failure)', None),
+    'firstapp_provider_retries_total': ('counter', '일시적인 오류로 다시 보낸 provider 요청 수', None),
+    'firstapp_provider_hedges_total': ('counter', '느린 예측에 보낸 사본(헤징) 수', None),
+    'firstapp_provider_circuit_open_total': ('counter', '서킷 브레이커가 열려 보내지 않은 호출 수', None),
+    'firstapp_provider_upload_bytes_total': ('counter', 'provider로 올린 입력 파일 크기 합계', None),
+    'firstapp_db_write_duration_seconds': ('histogram', 'DB 쓰기 문 실행 시간', DB_BUCKETS),
+    'firstapp_template_render_duration_seconds': ('histogram', '템플릿 렌더링 시간', RENDER_BUCKETS),
+    'firstapp_page_cache_requests_total': ('counter', '페이지 캐시를 거친 GET 요청 수 (outcome=hit/miss)', None),
+    'firstapp_llm_cache_requests_total': ('counter', '텍스트 LLM 캐시 조회 수 (outcome=hit/miss)', None),
+    'firstapp_analysis_cache_requests_total': ('counter', '이미지 분석 캐시 조회 수 (outcome=hit/miss)', None),
+}
+EVENTS_METRIC = 'firstapp_events_total'
+
+_WRITE_RE = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?([\w.]+)"?', re.IGNORECASE)
+
+_lock = threading.Lock()
+# 파일 쓰기는 한 번에 한 스레드만 (같은 임시 파일에 동시에 쓰지 않도록)
+_flush_lock = threading.Lock()
+_counters = {}    # (이름, 라벨) → 값
+_histograms = {}  # (이름, 라벨) → [구간별 개수..., +Inf 개수, 합계]
+_pid = None
+_path = None
+_flushed_at = 0.0
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _check_process():
+    # fork로 만든 프로세스는 부모의 값을 물려받으므로 비우고 새 파일에 씁니다.
+    global _pid, _path
+    if _pid != os.getpid():
+        _counters.clear()
+        _histograms.clear()
+        _pid = os.getpid()
+        _path = os.path.join(settings.METRICS_DIR, f'{_pid}-{uuid.uuid4().hex[:8]}.json')
+
+
+def inc(name, amount=1, **labels):
+    if not settings.METRICS_ENABLED:
+        return
+    with _lock:
+        _check_process()
+        key = (name, _labels(labels))
+        _counters[key] = _counters.get(key, 0) + amount
+    _maybe_flush()
+
+
+def observe(name, value, **labels):
+    if not settings.METRICS_ENABLED:
+        return
+    buckets = METRICS[name][2]
+    with _lock:
+        _check_process()
+        key = (name, _labels(labels))
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(buckets) + 2)
+        values[bisect_left(buckets, value)] += 1
+        values[-1] += value
+    _maybe_flush()
+
+
+@contextmanager
+def timed(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+# ---------------------------------------------------------------------------
+# provider 호출
+# ---------------------------------------------------------------------------
+
+def input_bytes(input):
+    """입력값 중 파일 객체의 크기 합계 (URL/문자열 입력은 0)"""
+    total = 0
+    for value in input.values():
+        for item in value if isinstance(value, list) else [value]:
+            if hasattr(item, 'fileno'):
+                try:
+                    total += os.fstat(item.fileno()).st_size
+                except (OSError, ValueError):
+                    pass
+    return total
+
+
+def record_provider_call(model, stage, seconds, ok):
+    model = model.split(':')[0]
+    outcome = 'success' if ok else 'failure'
+    observe('firstapp_provider_request_duration_seconds', seconds, model=model, stage=stage, outcome=outcome)
+    inc('firstapp_provider_requests_total', model=model, stage=stage, outcome=outcome)
+
+
+def record_upload(model, stage, size):
+    if size:
+        inc('firstapp_provider_upload_bytes_total', size, model=model.split(':')[0], stage=stage)
+
+
+# ---------------------------------------------------------------------------
+# DB 쓰기 / 템플릿 렌더링
+# ---------------------------------------------------------------------------
+
+def _db_write_wrapper(execute, sql, params, many, context):
+    match = _WRITE_RE.match(sql)
+    if match is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        operation = match.group(1).split()[0].lower()
+        observe('firstapp_db_write_duration_seconds', time.perf_counter() - started,
+                operation=operation, table=match.group(2))
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created 신호에서 새 DB 연결마다 쓰기 시간 측정을 답니다."""
+    if settings.METRICS_ENABLED and _db_write_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_write_wrapper)
+
+
+class _TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            observe('firstapp_template_render_duration_seconds', time.perf_counter() - started,
+                    template=self.template.origin.template_name or 'string')
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """렌더링 시간을 기록하는 DjangoTemplates"""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return _TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# ---------------------------------------------------------------------------
+# 프로세스 간 합치기 / 출력
+# ---------------------------------------------------------------------------
+
+def _snapshot():
+    with _lock:
+        _check_process()
+        return _path, {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, values] for (name, labels), values in _histograms.items()],
+        }
+
+
+def _write():
+    # _flush_lock을 잡은 상태에서 부릅니다.
+    global _flushed_at
+    _flushed_at = time.monotonic()
+    path, data = _snapshot()
+    try:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("Metrics flush failed: %s", path)
+        return False
+    return True
+
+
+def flush():
+    """이 프로세스의 값을 파일로 씁니다. (임시 파일에 쓴 뒤 바꿔치기) 성공하면 True"""
+    with _flush_lock:
+        return _write()
+
+
+def _maybe_flush():
+    # 다른 스레드가 쓰는 중이면 기다리지 않고 넘어갑니다. (그 스레드가 최신 값을 씀)
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        if time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_SECONDS:
+            _write()
+    finally:
+        _flush_lock.release()
+
+
+atexit.register(lambda: settings.METRICS_ENABLED and _pid is not None and flush())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _add(data):
+    # 다른 프로세스 파일의 값을 이 프로세스의 값에 더합니다. (구간 설정이 바뀌기 전의 히스토그램은 버림)
+    with _lock:
+        _check_process()
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            _counters[key] = _counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            if name not in METRICS or len(values) != len(METRICS[name][2]) + 2:
+                continue
+            merged = _histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(values))
+            for i, v in enumerate(values):
+                merged[i] += v
+
+
+def _merge_dead_files():
+    """끝난 프로세스의 파일을 이 프로세스의 값에 더하고 지웁니다.
+
+    파일 이름을 바꿔 먼저 가져간 프로세스 하나만 더하므로 두 번 더해지지 않습니다.
+    """
+    if os.name != 'posix':
+        return  # os.kill(pid, 0)로 프로세스가 살아 있는지 확인할 수 있는 경우만
+    try:
+        names = os.listdir(settings.METRICS_DIR)
+    except FileNotFoundError:
+        return
+    claimed = []
+    for file_name in names:
+        pid, _, rest = file_name.partition('-')
+        if not rest.endswith('.json') or not pid.isdigit() or int(pid) == os.getpid() or _alive(int(pid)):
+            continue
+        path = os.path.join(settings.METRICS_DIR, file_name)
+        merging = f'{path}.{os.getpid()}.merging'
+        try:
+            os.rename(path, merging)
+            with open(merging) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            continue  # 다른 프로세스가 먼저 가져감
+        except (OSError, ValueError):
+            logger.warning("Unreadable metrics file: %s", path)
+            continue
+        _add(data)
+        claimed.append(merging)
+    # 더한 값을 먼저 파일에 쓴 뒤에 지웁니다. (쓰지 못하면 남겨 두어 값을 잃지 않음)
+    if claimed and flush():
+        for merging in claimed:
+            try:
+                os.remove(merging)
+            except OSError:
+                pass
+
+
+def collect():
+    """모든 프로세스의 값을 더한 (counters, histograms)"""
+    _merge_dead_files()
+    flush()
+    counters = {}
+    histograms = {}
+    try:
+        names = [n for n in os.listdir(settings.METRICS_DIR) if n.endswith('.json')]
+    except FileNotFoundError:
+        names = []
+    for file_name in names:
+        try:
+            with open(os.path.join(settings.METRICS_DIR, file_name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if name not in METRICS or len(values) != len(METRICS[name][2]) + 2:
+                continue  # 구간 설정이 바뀌기 전의 파일
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, v in enumerate(values):
+                merged[i] += v
+    return counters, histograms
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(db_counters=None):
+    """Prometheus 텍스트 형식 (db_counters: Counter 모델의 {이름: 값})"""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(values[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    if db_counters:
+        lines.append(f'# HELP {EVENTS_METRIC} 모든 프로세스가 함께 세는 이벤트 수 (캐시 적중, 요청 거절 등)')
+        lines.append(f'# TYPE {EVENTS_METRIC} counter')
+        for name, value in sorted(db_counters.items()):
+            lines.append(f'{EVENTS_METRIC}{_format_labels([("name", name)])} {value}')
+    return '\n'.join(lines) + '\n'
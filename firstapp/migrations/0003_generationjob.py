@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:34
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0002_generatedimage_mood_generatedimage_placement_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', '대기 중'), ('running', '생성 중'), ('succeeded', '완료'), ('failed', '실패')], db_index=True, default='queued', max_length=20)),
+                ('product_type', models.CharField(max_length=50)),
+                ('theme', models.CharField(max_length=50)),
+                ('mood', models.CharField(max_length=50)),
+                ('placement', models.CharField(max_length=100)),
+                ('user_prompt', models.TextField(blank=True, default='')),
+                ('aspect_ratio', models.CharField(default='16:9', max_length=20)),
+                ('image_number', models.PositiveSmallIntegerField(default=1)),
+                ('model_choice', models.CharField(default='flux', max_length=50)),
+                ('upload_path', models.CharField(max_length=500)),
+                ('full_prompt', models.TextField(blank=True, default='')),
+                ('results', models.JSONField(blank=True, default=list)),
+                ('word_urls', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='images', to='firstapp.generationjob'),
+        ),
+        migrations.CreateModel(
+            name='Preset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('data', models.TextField()),
+                ('image', models.ImageField(blank=True, null=True, upload_to='presets/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
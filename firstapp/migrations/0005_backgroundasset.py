@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0004_textcompletioncache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scene_key', models.CharField(db_index=True, max_length=64)),
+                ('pipeline', models.CharField(max_length=50)),
+                ('url', models.URLField(max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='reuse_backgrounds',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0006_mediaasset'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedimage',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='genimage_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0007_generatedimage_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='upload_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0008_generationjob_upload_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('file_id', models.CharField(max_length=200)),
+                ('url', models.URLField(max_length=500)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0009_providerfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phash', models.CharField(db_index=True, max_length=16)),
+                ('phash_band0', models.PositiveIntegerField(db_index=True)),
+                ('phash_band1', models.PositiveIntegerField(db_index=True)),
+                ('phash_band2', models.PositiveIntegerField(db_index=True)),
+                ('phash_band3', models.PositiveIntegerField(db_index=True)),
+                ('reasoning_effort', models.CharField(max_length=20)),
+                ('verbosity', models.CharField(max_length=20)),
+                ('analysis_text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0010_analysiscache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedimage',
+            name='source_phash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='mediaasset',
+            name='phash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
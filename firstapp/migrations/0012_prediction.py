@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0011_image_phash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='backgrounds',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='Prediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=20)),
+                ('index', models.PositiveSmallIntegerField(default=0)),
+                ('model', models.CharField(max_length=200)),
+                ('provider_id', models.CharField(blank=True, db_index=True, default='', max_length=100)),
+                ('status', models.CharField(db_index=True, default='starting', max_length=20)),
+                ('output', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='predictions', to='firstapp.generationjob')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job', 'stage', 'index'], name='prediction_job_stage_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0012_prediction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=200)),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('holder', models.CharField(blank=True, db_index=True, default='', max_length=100)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'slot'), name='providerslot_scope_slot_uniq')],
+            },
+        ),
+    ]
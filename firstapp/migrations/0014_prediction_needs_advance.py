@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0013_providerslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediction',
+            name='needs_advance',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
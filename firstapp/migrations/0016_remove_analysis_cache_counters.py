@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def remove_counters(apps, schema_editor):
+    # 이미지 분석 캐시 적중/미스 수는 이제 프로세스 지표(firstapp_analysis_cache_requests_total)로 셉니다.
+    Counter = apps.get_model('firstapp', 'Counter')
+    Counter.objects.filter(name__in=['analysis_cache.hits', 'analysis_cache.misses']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('firstapp', '0015_generationjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_counters, migrations.RunPython.noop),
+    ]
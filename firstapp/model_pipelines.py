@@ -0,0 +1,258 @@
+"""이미지 생성 모델 파이프라인 레지스트리
+
+모델마다 if/elif 분기를 두는 대신, 각 파이프라인을 데이터로 선언하고
+run_pipeline() 하나로 실행합니다. 새 테마 LoRA를 추가할 때는 PIPELINES에 한 줄만 추가하면 됩니다.
+
+- 단일 단계: 제품 이미지 + 번역된 프롬프트 → 결과 이미지 (flux, nanobanana)
+- 2단계(custom_*): LoRA로 배경 생성 → nano-banana-pro로 제품과 배경 합성
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import providers
+from .provider_files import open_input
+
+logger = logging.getLogger(__name__)
+
+NANO_BANANA = "google/nano-banana-pro"
+FLUX_KONTEXT = "black-forest-labs/flux-kontext-pro"
+
+COMPOSITE_PROMPT = "주류 광고 이미지를 제작합니다. 배경 이미지와 제품 이미지를 합성하세요. 제품의 일관성을 유지하세요. "
+KEEP_BOTTLE = ("\n keep the provided bottle exactly as it is, "
+               "do not alter the bottle. Do not alter, redraw, re-create, re-interpret,"
+               " or modify the bottle, label, logo, text, shape, typography, or any branding elements in any way.")
+
+
+class BackgroundStage:
+    """LoRA 배경 생성 단계. 제품 이미지는 mask로 전달합니다."""
+
+    def __init__(self, model, prompt_prefix, prompt_suffix=KEEP_BOTTLE, pass_input_image=False):
+        self.model = model
+        self.prompt_prefix = prompt_prefix
+        self.prompt_suffix = prompt_suffix
+        self.pass_input_image = pass_input_image
+
+    def build_input(self, full_prompt, aspect_ratio, product_image):
+        data = {
+            "model": "dev",
+            "prompt": self.prompt_prefix + full_prompt + self.prompt_suffix,
+            "mask": product_image,
+            "aspect_ratio": aspect_ratio,
+        }
+        if self.pass_input_image:
+            data["input_image"] = product_image
+        return data
+
+
+class Pipeline:
+    def __init__(self, name, model, image_field="image_input", image_as_list=True,
+                 prompt=None, extra_input=None, background=None):
+        self.name = name
+        self.model = model
+        self.image_field = image_field
+        self.image_as_list = image_as_list
+        self.prompt = prompt  # None이면 번역된 프롬프트를 그대로 사용
+        self.extra_input = extra_input or {}
+        self.background = background
+
+    def build_input(self, full_prompt, aspect_ratio, product_image, background_url=None):
+        images = [product_image] + ([background_url] if background_url else [])
+        data = {
+            "prompt": self.prompt if self.prompt is not None else full_prompt,
+            self.image_field: images if self.image_as_list else images[0],
+            "aspect_ratio": aspect_ratio,
+        }
+        data.update(self.extra_input)
+        return data
+
+    def __repr__(self):
+        return f'Pipeline({self.name!r})'
+
+
+def _composite(name, background):
+    return Pipeline(
+        name, NANO_BANANA, prompt=COMPOSITE_PROMPT,
+        extra_input={"output_format": "png"}, background=background,
+    )
+
+
+PIPELINES = {
+    "flux": Pipeline("flux", FLUX_KONTEXT, image_field="input_image", image_as_list=False),
+    "nanobanana": Pipeline("nanobanana", NANO_BANANA, extra_input={"output_format": "png"}),
+    "custom_beach": _composite("custom_beach", BackgroundStage(
+        "clipnpaper/alcohol_beach:5c3ef136e48fd434e8fa47c9deaad6d12527a61757305ca01169e58fc5b19ef5",
+        ",alcohol_beach background", ",Do not create alcohol products", pass_input_image=True,
+    )),
+    "custom_bar": _composite("custom_bar", BackgroundStage(
+        "clipnpaper/alcohol_cozy_bar:8f3dff77476698778b50f4d7a1112e10f03496d0f19ce38c583ab16cecec6fba",
+        ",cozy_bar background",
+    )),
+    "custom_stylish": _composite("custom_stylish", BackgroundStage(
+        "clipnpaper/alcohol_stylish:b320a707aabb4390f663d2e834c30b072b3b1ad0d294182b1c4eec329818074f",
+        "stylish background",
+    )),
+    "custom_bbq": _composite("custom_bbq", BackgroundStage(
+        "clipnpaper/alcohol_bbq:81520f34f3770086c356c923a1101026bf77cbbe0bc84c3d2d9a496fa81735fa",
+        "BBQ background",
+    )),
+    "custom_pojangmacha": _composite("custom_pojangmacha", BackgroundStage(
+        "clipnpaper/pojangmacha:5470dfeb19844ba06245c7e22214b7cdbce9e6034e8edcad74d9ef5a0c61a5cd",
+        "pojangmacha background",
+    )),
+}
+
+# main.html의 Flux 옵션 값은 모델 전체 이름으로 전송됩니다.
+ALIASES = {
+    FLUX_KONTEXT: "flux",
+}
+
+
+def get_pipeline(name):
+    name = (name or "").lower()
+    return PIPELINES.get(ALIASES.get(name, name))
+
+
+def extract_url(output):
+    """Replicate 결과(리스트/문자열/FileOutput)에서 URL을 꺼냅니다. URL이 아니면 None"""
+    if isinstance(output, list):
+        output = output[0] if output else None
+    if not output:
+        return None
+    url = str(output)
+    return url if url.startswith("http") else None
+
+
+def generate_background(pipeline, full_prompt, aspect_ratio, product_image):
+    """product_image: provider URL 또는 로컬 파일 경로 (provider_files.resolve_image_input 참고)"""
+    with open_input(product_image) as f:
+        output = providers.run(
+            pipeline.background.model,
+            input=pipeline.background.build_input(full_prompt, aspect_ratio, f), stage="background",
+        )
+    url = extract_url(output)
+    if not url:
+        raise RuntimeError(f"{pipeline.name}: 배경 생성 결과가 없습니다.")
+    return url
+
+
+def run_pipeline(pipeline, full_prompt, aspect_ratio, product_image, background_url=None):
+    """이미지 1장을 생성하고 결과 URL을 반환합니다.
+
+    배경이 필요한 파이프라인인데 background_url이 없으면 배경부터 새로 만듭니다.
+    """
+    if pipeline.background and not background_url:
+        background_url = generate_background(pipeline, full_prompt, aspect_ratio, product_image)
+    with open_input(product_image) as f:
+        output = providers.run(
+            pipeline.model,
+            input=pipeline.build_input(full_prompt, aspect_ratio, f, background_url), stage="image",
+        )
+    return extract_url(output)
+
+
+async def async_generate_background(pipeline, full_prompt, aspect_ratio, product_image):
+    """generate_background()의 async 버전 (providers.arun 사용)"""
+    with open_input(product_image) as f:
+        output = await providers.arun(
+            pipeline.background.model,
+            input=pipeline.background.build_input(full_prompt, aspect_ratio, f), stage="background",
+        )
+    url = extract_url(output)
+    if not url:
+        raise RuntimeError(f"{pipeline.name}: 배경 생성 결과가 없습니다.")
+    return url
+
+
+async def async_run_pipeline(pipeline, full_prompt, aspect_ratio, product_image, background_url=None):
+    """run_pipeline()의 async 버전 (providers.arun 사용)"""
+    if pipeline.background and not background_url:
+        background_url = await async_generate_background(pipeline, full_prompt, aspect_ratio, product_image)
+    with open_input(product_image) as f:
+        output = await providers.arun(
+            pipeline.model,
+            input=pipeline.build_input(full_prompt, aspect_ratio, f, background_url), stage="image",
+        )
+    return extract_url(output)
+
+
+# ---------------------------------------------------------------------------
+# 배경 재사용 풀
+# ---------------------------------------------------------------------------
+
+def scene_key(pipeline, full_prompt, aspect_ratio, upload_digest):
+    """배경을 공유할 수 있는 '장면' 키.
+
+    LoRA 단계에 제품 이미지가 mask로 들어가므로 업로드 이미지 해시도 키에 포함합니다.
+    """
+    payload = "\x1f".join([pipeline.name, pipeline.background.model, " ".join(full_prompt.split()),
+                           aspect_ratio, upload_digest])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached_backgrounds(key, size):
+    from .models import BackgroundAsset
+
+    cutoff = timezone.now() - timedelta(seconds=settings.GENERATION_BACKGROUND_TTL_SECONDS)
+    return list(BackgroundAsset.objects
+                .filter(scene_key=key, created_at__gte=cutoff)
+                .order_by('-created_at')
+                .values_list('url', flat=True)[:size])
+
+
+def _new_backgrounds(pipeline, key, pool, new_urls):
+    from .models import BackgroundAsset
+
+    if not pool and not new_urls:
+        raise RuntimeError(f"{pipeline.name}: 배경 생성에 실패했습니다.")
+    return [BackgroundAsset(scene_key=key, pipeline=pipeline.name, url=url) for url in new_urls]
+
+
+def get_background_pool(pipeline, full_prompt, aspect_ratio, upload_digest, size, generate, executor):
+    """같은 장면의 배경을 size개까지 모아서 반환합니다.
+
+    다른 요청(다른 사용자 포함)이 만든 배경이 아직 유효하면 그대로 쓰고,
+    모자란 만큼만 generate()를 executor로 동시에 실행해 새로 만들고 저장합니다.
+    """
+    from .models import BackgroundAsset
+
+    key = scene_key(pipeline, full_prompt, aspect_ratio, upload_digest)
+    pool = _cached_backgrounds(key, size)
+
+    missing = size - len(pool)
+    if missing > 0:
+        futures = [executor.submit(generate) for _ in range(missing)]
+        new_urls = []
+        for future in futures:
+            try:
+                new_urls.append(future.result())
+            except Exception:
+                logger.exception("Background generation failed (%s)", pipeline.name)
+        BackgroundAsset.objects.bulk_create(_new_backgrounds(pipeline, key, pool, new_urls))
+        pool.extend(new_urls)
+    return pool
+
+
+async def aget_background_pool(pipeline, full_prompt, aspect_ratio, upload_digest, size, generate):
+    """get_background_pool()의 async 버전. generate는 코루틴 함수입니다."""
+    from .models import BackgroundAsset
+
+    key = scene_key(pipeline, full_prompt, aspect_ratio, upload_digest)
+    pool = await sync_to_async(_cached_backgrounds)(key, size)
+
+    missing = size - len(pool)
+    if missing > 0:
+        new_urls = []
+        for result in await asyncio.gather(*(generate() for _ in range(missing)), return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("Background generation failed (%s): %s", pipeline.name, result)
+            else:
+                new_urls.append(result)
+        await BackgroundAsset.objects.abulk_create(_new_backgrounds(pipeline, key, pool, new_urls))
+        pool.extend(new_urls)
+    return pool
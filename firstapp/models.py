@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import User  # 1. Django의 기본 User 모델을 가져옵니다.
 from django.db.models.signals import post_save
@@ -12,6 +13,24 @@ class UserProfile(models.Model):
     def __str__(self):
         return self.user.username
 
+# 내용 해시(sha256)로 저장한 로컬 미디어 파일 (생성 결과 미러링 등)
+class MediaAsset(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=200)  # ASSET_STORE_DIR 기준 상대 경로
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField(default=0)
+    source_url = models.URLField(max_length=500, blank=True, default='', db_index=True)
+    phash = models.CharField(max_length=16, blank=True, default='')  # 이미지 지각 해시 (유사 이미지 검색용)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+    @property
+    def url(self):
+        from django.urls import reverse
+        return reverse('media_asset', args=[self.digest])
+
 # 3. 생성된 이미지를 저장할 모델
 class GeneratedImage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -24,10 +43,168 @@ class GeneratedImage(models.Model):
     mood = models.CharField(max_length=50, blank=True, null=True)
     placement = models.CharField(max_length=100, blank=True, null=True)
     user_prompt = models.TextField(blank=True, null=True) # 사용자가 입력한 키워드
+    # 이 이미지를 만든 생성 작업 (작업 큐 도입 이전 데이터는 비어 있음)
+    job = models.ForeignKey('GenerationJob', on_delete=models.SET_NULL, blank=True, null=True, related_name='images')
+    # 로컬에 내려받은 사본 (provider URL이 만료되어도 계속 볼 수 있도록)
+    asset = models.ForeignKey(MediaAsset, on_delete=models.SET_NULL, blank=True, null=True)
+    # 생성에 사용한 제품(업로드) 이미지의 지각 해시 (유사 이미지 검색용)
+    source_phash = models.CharField(max_length=16, blank=True, default='')
     
+    class Meta:
+        indexes = [
+            # 프로필 갤러리의 최신순 커서 페이지네이션용
+            models.Index(fields=['user', '-created_at', '-id'], name='genimage_user_created_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username} - {self.id}'
+
+    @property
+    def display_url(self):
+        # 로컬 사본이 있으면 우리 서버에서, 없으면 provider URL로 보여줍니다.
+        return self.asset.url if self.asset_id else self.image_url
+
+# 5. 이미지 생성 작업 큐
+# 뷰는 작업만 등록하고, 실제 생성은 run_generation_worker 명령이 처리합니다.
+class GenerationJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, '대기 중'),
+        (STATUS_RUNNING, '생성 중'),
+        (STATUS_SUCCEEDED, '완료'),
+        (STATUS_FAILED, '실패'),
+    ]
+
+    # 비로그인 사용자도 결과 페이지를 볼 수 있도록 추측하기 어려운 UUID를 사용합니다.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+
+    # 폼 입력값
+    product_type = models.CharField(max_length=50)
+    theme = models.CharField(max_length=50)
+    mood = models.CharField(max_length=50)
+    placement = models.CharField(max_length=100)
+    user_prompt = models.TextField(blank=True, default='')
+    aspect_ratio = models.CharField(max_length=20, default='16:9')
+    image_number = models.PositiveSmallIntegerField(default=1)
+    model_choice = models.CharField(max_length=50, default='flux')
+    # custom_* 모델에서 배경을 한 번만 만들고 여러 장에 재사용할지 여부
+    reuse_backgrounds = models.BooleanField(default=True)
+    upload_path = models.CharField(max_length=500)
+    upload_digest = models.CharField(max_length=64, blank=True, default='')  # 업로드 이미지 sha256
+
+    # 결과
+    full_prompt = models.TextField(blank=True, default='')
+    results = models.JSONField(default=list, blank=True)  # 이미지별 결과: [{"url": ...}, ...]
+    word_urls = models.JSONField(default=list, blank=True)  # 추천 문구
+    # webhook 모드: 배경 슬롯별 재사용 배경 URL (새로 만드는 슬롯은 None, firstapp/webhooks.py 참고)
+    backgrounds = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # 실행 중인 워커가 주기적으로 갱신합니다. (오래 갱신되지 않은 RUNNING 작업은 워커가 죽은 것으로 봄)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f'{self.id} ({self.status})'
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    @property
+    def image_urls(self):
+        # 로컬로 미러링된 결과는 우리 서버 주소를 사용합니다.
+        from django.urls import reverse
+        return [reverse('media_asset', args=[r['asset']]) if r.get('asset') else r['url']
+                for r in self.results if r.get('url')]
+
+    @property
+    def original_settings(self):
+        # result.html의 '설정 유지하고 돌아가기' 링크에서 사용
+        return {
+            'product_type': self.product_type,
+            'theme': self.theme,
+            'mood': self.mood,
+            'placement': self.placement,
+            'prompt': self.user_prompt,
+            'extra_requirements': self.user_prompt,
+            'model': self.model_choice,
+            'aspect_ratio': self.aspect_ratio,
+            'count': self.image_number,
+        }
     
+# custom_* 파이프라인이 만든 배경 이미지 (같은 장면이면 요청/사용자 간에 재사용)
+class BackgroundAsset(models.Model):
+    scene_key = models.CharField(max_length=64, db_index=True)
+    pipeline = models.CharField(max_length=50)
+    url = models.URLField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.pipeline} - {self.scene_key[:12]}'
+
+# provider(Replicate) Files API에 올려 둔 업로드 이미지 (내용 해시별로 한 번만 업로드)
+class ProviderFile(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    file_id = models.CharField(max_length=200)
+    url = models.URLField(max_length=500)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.digest[:12]} -> {self.file_id}'
+
+# 6. 텍스트 LLM 호출(프롬프트 번역, 광고 문구) 결과 캐시
+# DB에 저장하므로 웹 서버와 워커 프로세스가 모두 같은 캐시를 공유합니다.
+class TextCompletionCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)  # 모델 이름 + 정규화된 입력값의 sha256
+    model_name = models.CharField(max_length=200)
+    response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.model_name} - {self.key[:12]}'
+
+# 7. 프로세스 간에 공유하는 단순 카운터 (캐시 적중/실패 횟수 등)
+class Counter(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} = {self.value}'
+
+# 8. 이미지 분석(gpt-5) 결과 캐시
+# 지각 해시(phash.py)로 찾으므로 크기만 바뀌었거나 다시 저장한 같은 사진도 재사용합니다.
+class AnalysisCache(models.Model):
+    phash = models.CharField(max_length=16, db_index=True)  # 64비트 dHash (16진수)
+    # 가까운 해시 검색용 16비트 구간 (phash.near_q 참고)
+    phash_band0 = models.PositiveIntegerField(db_index=True)
+    phash_band1 = models.PositiveIntegerField(db_index=True)
+    phash_band2 = models.PositiveIntegerField(db_index=True)
+    phash_band3 = models.PositiveIntegerField(db_index=True)
+    reasoning_effort = models.CharField(max_length=20)
+    verbosity = models.CharField(max_length=20)
+    analysis_text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.phash} ({self.reasoning_effort}/{self.verbosity})'
+
 class Preset(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100) 
@@ -38,6 +215,63 @@ class Preset(models.Model):
     def __str__(self):
         return f'{self.user.username} - {self.name}'
 
+# 9. provider에 webhook URL과 함께 제출한 예측 (GENERATION_COMPLETION_MODE=webhook)
+# 완료 알림을 받으면 결과를 여기에 기록하고, 워커가 작업의 다음 단계를 제출합니다. (firstapp/webhooks.py)
+class Prediction(models.Model):
+    STAGE_TRANSLATE = 'translate'
+    STAGE_COPY = 'copy'
+    STAGE_BACKGROUND = 'background'
+    STAGE_IMAGE = 'image'
+
+    STATUS_STARTING = 'starting'
+    STATUS_PROCESSING = 'processing'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELED = 'canceled'
+    TERMINAL_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELED)
+
+    job = models.ForeignKey(GenerationJob, on_delete=models.CASCADE, related_name='predictions')
+    stage = models.CharField(max_length=20)
+    index = models.PositiveSmallIntegerField(default=0)  # 이미지/배경 슬롯 번호
+    model = models.CharField(max_length=200)
+    # provider 예측 ID (제출 직후 채워짐, 웹훅 재전송 확인에 사용)
+    provider_id = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    status = models.CharField(max_length=20, default=STATUS_STARTING, db_index=True)
+    output = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    # 완료를 기록했지만 워커가 아직 다음 단계를 진행하지 않음
+    needs_advance = models.BooleanField(default=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'stage', 'index'], name='prediction_job_stage_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.job_id} {self.stage}[{self.index}] ({self.status})'
+
+    @property
+    def is_completed(self):
+        return self.status in self.TERMINAL_STATUSES
+
+# 10. provider 동시 예측 자리 (firstapp/admission.py)
+# 범위(scope)마다 한도만큼 행을 두고, 예측 전에 빈 행을 조건부 UPDATE로 선점합니다.
+class ProviderSlot(models.Model):
+    scope = models.CharField(max_length=200)  # 'global', 'model:<이름>', 'user:<id>'
+    slot = models.PositiveSmallIntegerField()
+    holder = models.CharField(max_length=100, blank=True, default='', db_index=True)  # 비어 있으면 빈 자리
+    expires_at = models.DateTimeField(blank=True, null=True)  # 반납되지 않아도 이 시각 뒤에는 회수
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'slot'], name='providerslot_scope_slot_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}#{self.slot} ({self.holder or "free"})'
+
 # 4. User가 생성될 때 UserProfile도 자동으로 생성/저장하는 신호(Signal)
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -46,4 +280,4 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
\ No newline at end of file
+    instance.userprofile.save()
@@ -0,0 +1,61 @@
+"""GET 폼 페이지의 렌더링 결과 캐시
+
+홈/로그인/생성/분석/편집/영상 페이지는 GET 요청마다 같은 템플릿을 처음부터 렌더링합니다.
+이 페이지들의 내용은 로그인 여부와 csrf 토큰에만 따라 달라지므로:
+
+- csrf 토큰 자리에 CSRF_PLACEHOLDER를 넣어 렌더링한 HTML을 (경로, 템플릿, 로그인 여부)별로 캐시하고
+  (PAGE_CACHE_SECONDS, CACHES의 default 캐시)
+- 요청마다 자리표시자만 그 요청의 토큰으로 바꿔 보냅니다. (토큰을 쓰지 않는 페이지는 쿠키도 만들지 않음)
+- 응답은 Cache-Control: private, Vary: Cookie로 보내 공유 캐시(프록시/CDN)가 다른 사용자에게 주지 않게 합니다.
+
+쿼리 문자열이 있는 요청(?next=... 등)과 GET/HEAD가 아닌 요청은 캐시하지 않습니다.
+사용자 이름처럼 로그인 여부 외의 사용자 정보를 보여주는 템플릿에는 쓰면 안 됩니다.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render as render_page
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import metrics
+
+# {% csrf_token %}은 context의 csrf_token을 그대로 출력하므로 렌더링할 때 이 값을 넣습니다.
+CSRF_PLACEHOLDER = 'page-cache-csrf-token-placeholder'
+
+
+def _cacheable(request):
+    return settings.PAGE_CACHE_ENABLED and request.method in ('GET', 'HEAD') and not request.GET
+
+
+def _key(request, template_name):
+    return f'page:{request.path}:{template_name}:{int(request.user.is_authenticated)}'
+
+
+def render(request, template_name, context=None):
+    """shortcuts.render와 같지만 렌더링 결과를 캐시합니다.
+
+    context는 dict 또는 dict를 반환하는 함수입니다. (함수는 캐시에 없을 때만 부릅니다)
+    """
+    if not _cacheable(request):
+        return render_page(request, template_name, context() if callable(context) else context)
+
+    key = _key(request, template_name)
+    html = cache.get(key)
+    if html is None:
+        metrics.inc('firstapp_page_cache_requests_total', outcome='miss')
+        page_context = context() if callable(context) else dict(context or {})
+        page_context['csrf_token'] = CSRF_PLACEHOLDER
+        html = render_to_string(template_name, page_context, request)
+        cache.set(key, html, settings.PAGE_CACHE_SECONDS)
+    else:
+        metrics.inc('firstapp_page_cache_requests_total', outcome='hit')
+
+    if CSRF_PLACEHOLDER in html:
+        # get_token()은 CsrfViewMiddleware가 csrf 쿠키를 보내도록 표시합니다.
+        html = html.replace(CSRF_PLACEHOLDER, get_token(request))
+    response = HttpResponse(html)
+    patch_vary_headers(response, ('Cookie',))
+    patch_cache_control(response, private=True)
+    return response
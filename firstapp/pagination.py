@@ -0,0 +1,35 @@
+"""생성 이력용 커서(keyset) 페이지네이션
+
+OFFSET 대신 마지막으로 본 (created_at, id) 다음부터 읽으므로,
+이력이 아무리 많아도 페이지마다 (user, -created_at, -id) 인덱스 범위만 읽습니다.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """잘못된 커서면 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'잘못된 커서입니다: {cursor!r}') from e
+
+
+def keyset_page(queryset, cursor=None, limit=24):
+    """최신순으로 limit개를 읽고 (항목 목록, 다음 커서 또는 None)을 반환합니다."""
+    queryset = queryset.order_by('-created_at', '-pk')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    items = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
@@ -0,0 +1,83 @@
+"""이미지 지각 해시(dHash)
+
+같은 사진을 다시 저장했거나 크기만 바꾼 경우처럼 바이트는 달라도 눈으로 보기에 같은 이미지는
+해시의 해밍 거리가 작게 나옵니다. (sha256 내용 해시는 1바이트만 달라도 완전히 달라짐)
+
+- 64비트 해시를 16진수 16자리 문자열로 저장합니다.
+- 가까운 해시를 DB 인덱스로 찾기 위해 16비트씩 4개 구간(band)으로 나눠 따로 저장합니다.
+  거리가 d 이하이면 비둘기집 원리로 어느 한 구간은 d // 4 비트 이하만 다르므로,
+  구간마다 그 범위의 값들(probe)만 IN 조건으로 찾으면 후보를 빠짐없이 가져올 수 있습니다.
+"""
+import logging
+from itertools import combinations
+
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8
+BANDS = 4
+BAND_BITS = HASH_SIZE * HASH_SIZE // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(path):
+    """이미지 파일의 64비트 dHash (가로로 이웃한 픽셀 밝기 비교)"""
+    with Image.open(path) as image:
+        # JPEG는 작은 크기로 바로 디코딩해 큰 사진도 빠르게 처리합니다.
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert("L")
+        image = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+        pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def try_dhash(path):
+    """dhash()와 같지만 이미지를 읽을 수 없으면 None을 반환합니다."""
+    try:
+        return dhash(path)
+    except Exception:
+        logger.exception("Perceptual hash failed: %s", path)
+        return None
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def bands(phash):
+    """해시를 앞에서부터 BAND_BITS씩 나눈 정수 목록"""
+    value = int(phash, 16)
+    return [(value >> (BAND_BITS * (BANDS - 1 - i))) & BAND_MASK for i in range(BANDS)]
+
+
+def band_fields(phash, prefix):
+    """모델 저장용 {f'{prefix}{i}': 구간 값}"""
+    return {f"{prefix}{i}": band for i, band in enumerate(bands(phash))}
+
+
+def band_probes(band, radius):
+    """band와 radius 비트 이하로 다른 모든 값"""
+    values = [band]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), r):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def near_q(phash, max_distance, prefix):
+    """해밍 거리가 max_distance 이하일 수 있는 행을 모두 포함하는 조건 (최종 거리는 hamming()으로 확인)"""
+    radius = max_distance // BANDS
+    q = Q()
+    for i, band in enumerate(bands(phash)):
+        q |= Q(**{f"{prefix}{i}__in": band_probes(band, radius)})
+    return q
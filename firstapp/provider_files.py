@@ -0,0 +1,106 @@
+"""업로드 이미지를 provider Files API에 한 번만 올리고, 받은 URL을 재사용합니다.
+
+모델 입력에 파일 객체를 넘기면 호출할 때마다 이미지를 다시 업로드하므로,
+내용 해시별로 한 번 올린 URL을 만료 전까지 (반복 생성, 다른 뷰, 다른 세션에서) 계속 사용합니다.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics, providers
+from .models import ProviderFile
+
+logger = logging.getLogger(__name__)
+
+# 프로세스 안의 메모: {digest: (url, expires_at)}
+_memo = {}
+_memo_lock = threading.Lock()
+# 해시마다 잠금을 만들면 올린 이미지 수만큼 계속 늘어나므로, 정해진 개수의 잠금을 해시로 나눠 씁니다.
+DIGEST_LOCK_STRIPES = 64
+_digest_locks = [threading.Lock() for _ in range(DIGEST_LOCK_STRIPES)]
+
+
+def _digest_lock(digest):
+    # 동시에 시작한 N장의 생성이 같은 이미지를 N번 올리지 않도록 해시별로 잠급니다.
+    # (다른 이미지와 잠금을 같이 쓰면 업로드 하나를 기다릴 뿐 결과는 같음)
+    return _digest_locks[hash(digest) % DIGEST_LOCK_STRIPES]
+
+
+def _usable_until():
+    return timezone.now() + timedelta(seconds=settings.PROVIDER_FILE_EXPIRY_MARGIN_SECONDS)
+
+
+def _remember(digest, url, expires_at):
+    with _memo_lock:
+        _memo[digest] = (url, expires_at)
+
+
+def _recall(digest):
+    with _memo_lock:
+        cached = _memo.get(digest)
+    if cached and cached[1] > _usable_until():
+        return cached[0]
+    return None
+
+
+def provider_file_url(digest, path):
+    """업로드 이미지의 provider URL을 반환합니다. 없거나 곧 만료되면 새로 올립니다."""
+    url = _recall(digest)
+    if url:
+        return url
+
+    with _digest_lock(digest):
+        url = _recall(digest)
+        if url:
+            return url
+
+        entry = ProviderFile.objects.filter(digest=digest, expires_at__gt=_usable_until()).first()
+        if entry is not None:
+            _remember(digest, entry.url, entry.expires_at)
+            return entry.url
+
+        with open(path, 'rb') as f:
+            uploaded = providers.upload(f)
+        metrics.record_upload('files', 'upload', os.path.getsize(path))
+        url = uploaded.urls['get']
+        expires_at = parse_datetime(uploaded.expires_at) if uploaded.expires_at else None
+        if expires_at is None:
+            expires_at = timezone.now() + timedelta(seconds=settings.PROVIDER_FILE_TTL_SECONDS)
+
+        fields = {'file_id': uploaded.id, 'url': url, 'expires_at': expires_at}
+        if not ProviderFile.objects.filter(digest=digest).update(**fields):
+            try:
+                ProviderFile.objects.create(digest=digest, **fields)
+            except IntegrityError:
+                ProviderFile.objects.filter(digest=digest).update(**fields)
+        _remember(digest, url, expires_at)
+        return url
+
+
+def resolve_image_input(digest, path):
+    """모델 입력으로 넘길 값: 가능하면 재사용 가능한 provider URL, 실패하면 로컬 경로"""
+    if not settings.PROVIDER_FILE_CACHE_ENABLED or not digest:
+        return path
+    try:
+        return provider_file_url(digest, path)
+    except Exception:
+        # Files API를 쓸 수 없으면 예전처럼 호출마다 파일을 보냅니다.
+        logger.exception("Provider file upload failed, falling back to inline upload")
+        return path
+
+
+@contextmanager
+def open_input(image):
+    """resolve_image_input()의 결과를 모델 입력 값으로 엽니다. (URL은 그대로, 경로는 파일로)"""
+    if isinstance(image, str) and image.startswith(('http://', 'https://')):
+        yield image
+    else:
+        with open(image, 'rb') as f:
+            yield f
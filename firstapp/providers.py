@@ -0,0 +1,248 @@
+"""provider 호출 진입점: run / stream / submit / wait / upload / cancel
+
+뷰, 생성 작업, 웹훅 처리는 provider를 직접 부르지 않고 이 모듈을 거칩니다.
+백엔드는 REPLICATE_PROVIDER로 고릅니다.
+
+- replicate: 실제 Replicate API. 프로세스의 모든 호출이 keep-alive 연결 풀 하나를 함께 씁니다.
+  (크기/유지 시간: PROVIDER_POOL_*, async 호출은 이벤트 루프마다 풀 하나)
+- fake: 모델별 지연/오류 분포를 흉내 내는 로컬 provider (fake_provider.py)
+- record: 실제 Replicate를 호출하면서 끝난 run/stream 호출의 결과와 지연을 PROVIDER_CASSETTE_DIR에 저장
+- replay: 저장해 둔 결과를 같은 지연으로 돌려줍니다. (저장되지 않은 호출은 실패, provider 호출 없음)
+
+모델별 시간 제한/재시도/헤징/서킷 브레이커는 resilience.py가, 업로드 재사용은 provider_files.py가 맡습니다.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import replicate
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from dotenv import load_dotenv
+from replicate.client import _build_httpx_client
+
+from . import llm_cache, resilience
+from .fake_provider import FakeReplicateClient, model_name
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BACKENDS = ("replicate", "fake", "record", "replay")
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.PROVIDER_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.PROVIDER_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.PROVIDER_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+class PooledReplicateClient(replicate.Client):
+    """연결 풀 크기와 keep-alive 시간을 정한 replicate.Client
+
+    동기 호출은 프로세스 전체가 httpx.Client 하나를, async 호출은 이벤트 루프마다 httpx.AsyncClient 하나를
+    함께 씁니다. (AsyncClient의 연결은 만든 이벤트 루프에서만 쓸 수 있습니다.)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._sync_http = None
+        self._async_http = weakref.WeakKeyDictionary()
+
+    def _build(self, client_type, transport):
+        return _build_httpx_client(client_type, self._api_token, self._base_url, self._timeout,
+                                   transport=transport, **self._client_kwargs)
+
+    @property
+    def _client(self):
+        with self._lock:
+            if self._sync_http is None:
+                self._sync_http = self._build(httpx.Client, httpx.HTTPTransport(limits=_limits()))
+            return self._sync_http
+
+    @property
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            http = self._async_http.get(loop)
+            if http is None:
+                http = self._async_http[loop] = self._build(
+                    httpx.AsyncClient, httpx.AsyncHTTPTransport(limits=_limits()))
+            return http
+
+
+# ---------------------------------------------------------------------------
+# 녹화 / 재생
+# ---------------------------------------------------------------------------
+
+def _plain(value):
+    # 파일과 URL은 업로드할 때마다 달라지므로 키에서 뺍니다.
+    if isinstance(value, list):
+        return [item for item in map(_plain, value) if item is not None]
+    if hasattr(value, "read") or (isinstance(value, str) and value.startswith(("http://", "https://", "data:"))):
+        return None
+    return value
+
+
+def cassette_key(model, input):
+    """모델 이름(버전 제외)과 파일/URL을 뺀 입력값으로 만든 녹화 키"""
+    return llm_cache.make_key(model_name(model), {k: _plain(v) for k, v in input.items()})
+
+
+def _cassette_path(model, input):
+    return os.path.join(settings.PROVIDER_CASSETTE_DIR, f"{cassette_key(model, input)}.json")
+
+
+def _record(model, input, output, started):
+    if settings.REPLICATE_PROVIDER != "record":
+        return
+    path = _cassette_path(model, input)
+    try:
+        os.makedirs(settings.PROVIDER_CASSETTE_DIR, exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"model": model_name(model), "seconds": time.monotonic() - started,
+                       "output": output}, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+    except (OSError, TypeError):
+        logger.warning("Cassette write failed: %s", path)
+
+
+class ReplayClient(FakeReplicateClient):
+    """record 모드로 저장한 결과를 돌려주는 가짜 provider (지연에는 FAKE_PROVIDER_LATENCY_SCALE을 곱합니다)"""
+
+    def _load(self, model, input):
+        try:
+            with open(_cassette_path(model, input)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def sample(self, model, input):
+        entry = self._load(model, input)
+        if entry is None:
+            return 0, f"replay: {model_name(model)} 녹화된 응답이 없습니다."
+        return entry["seconds"] * self.scale, None
+
+    def output(self, model, input):
+        return self._load(model, input)["output"]
+
+    def _throttle(self, model):
+        pass
+
+
+def build_client(backend=None):
+    backend = backend or settings.REPLICATE_PROVIDER
+    if backend == "fake":
+        return FakeReplicateClient()
+    if backend == "replay":
+        return ReplayClient()
+    if backend in ("replicate", "record"):
+        return PooledReplicateClient(
+            api_token=os.getenv("REPLICATE_API_TOKEN"),
+            # 연결/응답/풀 대기 시간 제한. 예측 전체의 시간 제한은 모델별 정책(resilience.py)이 관리합니다.
+            timeout=httpx.Timeout(settings.PROVIDER_READ_TIMEOUT, connect=settings.PROVIDER_CONNECT_TIMEOUT,
+                                  pool=settings.PROVIDER_POOL_TIMEOUT),
+        )
+    raise ImproperlyConfigured(f"REPLICATE_PROVIDER must be one of {', '.join(BACKENDS)}: {backend}")
+
+
+client = build_client()
+
+
+# ---------------------------------------------------------------------------
+# 호출
+# ---------------------------------------------------------------------------
+
+def run(model, input, stage="predict"):
+    """모델 정책을 적용해 예측을 실행하고 output을 반환합니다."""
+    started = time.monotonic()
+    output = resilience.run(client, model, input, stage)
+    _record(model, input, output, started)
+    return output
+
+
+async def arun(model, input, stage="predict"):
+    started = time.monotonic()
+    output = await resilience.arun(client, model, input, stage)
+    _record(model, input, output, started)
+    return output
+
+
+def stream(model, input, stage="predict"):
+    """출력 토큰을 나오는 대로 yield합니다. (서킷 브레이커만 적용)"""
+    started = time.monotonic()
+    tokens = []
+    with resilience.guard(model, stage):
+        for event in client.stream(model, input=input):
+            tokens.append(str(event))
+            yield tokens[-1]
+    _record(model, input, tokens, started)
+
+
+async def astream(model, input, stage="predict"):
+    started = time.monotonic()
+    tokens = []
+    with resilience.guard(model, stage):
+        async for event in await client.async_stream(model, input=input):
+            tokens.append(str(event))
+            yield tokens[-1]
+    _record(model, input, tokens, started)
+
+
+def create(model, input, stage="predict", **kwargs):
+    """예측을 만들고 바로 반환합니다. (상태 확인/취소는 호출한 쪽에서)"""
+    return resilience.create_prediction(client, model, input, stage, **kwargs)
+
+
+async def acreate(model, input, stage="predict", **kwargs):
+    return await resilience.acreate_prediction(client, model, input, stage, **kwargs)
+
+
+def submit(model, input, stage="predict", **kwargs):
+    """예측을 제출만 합니다. (webhook 모드, 만들기 요청의 일시적인 오류만 재시도)"""
+    return resilience.submit(client, model, input, stage, **kwargs)
+
+
+def get(prediction_id):
+    return client.predictions.get(prediction_id)
+
+
+def wait(prediction_id, timeout=None):
+    """예측이 끝날 때까지 기다려 반환합니다. timeout초를 넘기면 PredictionTimeout (예측은 그대로 둠)"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    prediction = get(prediction_id)
+    while prediction.status not in resilience.TERMINAL_STATUSES:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise resilience.PredictionTimeout(prediction.model or prediction_id, timeout)
+        time.sleep(settings.PROVIDER_POLL_INTERVAL)
+        prediction.reload()
+    return prediction
+
+
+async def await_(prediction_id, timeout=None):
+    """wait()의 async 버전"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    prediction = await asyncio.to_thread(get, prediction_id)
+    while prediction.status not in resilience.TERMINAL_STATUSES:
+        if deadline is not None and time.monotonic() >= deadline:
+            raise resilience.PredictionTimeout(prediction.model or prediction_id, timeout)
+        await asyncio.sleep(settings.PROVIDER_POLL_INTERVAL)
+        await prediction.async_reload()
+    return prediction
+
+
+def cancel(prediction_id):
+    return client.predictions.cancel(prediction_id)
+
+
+def upload(file):
+    """파일을 provider Files API에 올립니다. (id, urls['get'], expires_at)"""
+    return client.files.create(file)
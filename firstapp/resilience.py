@@ -0,0 +1,418 @@
+"""provider 호출 정책: 시간 제한, 재시도, 헤징, 서킷 브레이커 (모델별, PROVIDER_POLICIES)
+
+client.run()은 예측이 끝날 때까지 제한 없이 기다리고, 일시적인 오류도 그대로 실패로 끝납니다.
+run()/arun()은 예측을 직접 만들고 상태를 확인하면서 모델별 정책을 적용합니다.
+
+- timeout: 예측 하나를 기다리는 최대 시간(초). 넘으면 예측을 취소하고 PredictionTimeout
+- retries: 일시적인 오류(네트워크 오류, 429, 5xx)일 때 다시 시도하는 횟수.
+  대기 시간은 backoff * 2^n 안에서 무작위로 정합니다. (full jitter, 최대 backoff_max)
+- hedge: 예측이 이 시간(초)을 넘기면 같은 예측을 하나 더 만들고 먼저 끝난 결과를 씁니다. (나머지는 취소)
+  'p95'면 이 프로세스에서 최근 성공한 호출 지연의 95백분위를 사용합니다. (표본이 모이기 전에는 헤징 안 함)
+  사본도 provider 자리(admission)를 하나 더 쓰므로, 자리가 없으면 헤징하지 않습니다.
+- breaker_failures / breaker_cooldown: provider 장애로 보이는 실패(네트워크 오류, 429, 5xx, 시간 초과)로
+  끝난 호출이 연속 breaker_failures번이면 cooldown초 동안 그 모델 호출을 provider에 보내지 않고
+  바로 CircuitOpen으로 실패합니다. 그 뒤 한 호출만 시험으로 보내고, 성공하면 다시 정상으로 돌아옵니다.
+  (프로세스마다 따로 판단) 재시도는 호출 하나로 세고, 입력 오류(4xx)나 예측 실패는 세지 않습니다.
+  webhook 모드에서는 제출은 시험 표시만 풀고, 결과는 완료를 진행하는 워커가 record_result()로 반영합니다.
+  (제출하는 워커 프로세스와 같은 곳) timeout을 넘겨 끝난 예측은 시간 초과로 셉니다.
+
+연결/읽기 시간 제한(PROVIDER_CONNECT_TIMEOUT, PROVIDER_READ_TIMEOUT)은 providers.client의 HTTP 설정입니다.
+호출마다 모델/단계(stage)별 지연, 성공·실패, 업로드 크기를 metrics에 기록합니다.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import httpx
+from django.conf import settings
+from replicate.exceptions import ReplicateError
+
+from . import admission, metrics
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+# p95 헤징에 필요한 최소 표본 수, 모델별로 기억할 최근 지연 수
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class ProviderError(RuntimeError):
+    """정책이 만든 실패 (메시지는 사용자에게 그대로 보여줄 수 있음)"""
+
+
+class PredictionFailed(ProviderError):
+    pass
+
+
+class PredictionTimeout(ProviderError):
+    def __init__(self, model, seconds):
+        super().__init__(f"{model_key(model)} 모델의 응답 시간({seconds:g}초)이 초과되었습니다.")
+
+
+class CircuitOpen(ProviderError):
+    def __init__(self, model):
+        super().__init__(f"{model_key(model)} 모델이 현재 원활하지 않습니다. 잠시 후 다시 시도해주세요.")
+
+
+def model_key(model):
+    # 버전이 붙은 모델(owner/name:version)도 같은 정책/상태를 씁니다.
+    return model.split(":")[0]
+
+
+def policy(model):
+    policies = settings.PROVIDER_POLICIES
+    return {**policies["default"], **policies.get(model_key(model), {})}
+
+
+# ---------------------------------------------------------------------------
+# 서킷 브레이커 / 지연 기록
+# ---------------------------------------------------------------------------
+
+class CircuitBreaker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def state(self, cooldown):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < cooldown:
+            return "open"
+        return "half-open"
+
+    def before_call(self, model, pol):
+        with self.lock:
+            state = self.state(pol["breaker_cooldown"])
+            if state == "closed":
+                return
+            # 열려 있거나, 다른 호출이 이미 시험 중이면 바로 실패합니다.
+            if state == "open" or self.trial:
+                metrics.inc("firstapp_provider_circuit_open_total", model=model_key(model))
+                raise CircuitOpen(model)
+            self.trial = True
+
+    def record(self, ok, pol):
+        with self.lock:
+            self.trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            # 연속 실패가 한도에 닿거나 시험 호출이 실패하면 (다시) 열고 cooldown을 시작합니다.
+            if self.failures >= pol["breaker_failures"]:
+                self.opened_at = time.monotonic()
+
+    def abandon(self):
+        # 결과를 모르고 끝난 호출 (스트리밍 중 연결이 끊긴 경우 등): 시험 중 표시만 풉니다.
+        with self.lock:
+            self.trial = False
+
+    def record_error(self, exc, pol):
+        # 잘못된 입력이나 거절된 내용 때문에 실패한 호출로 모든 사용자의 호출을 막지 않습니다.
+        if is_outage(exc):
+            self.record(False, pol)
+        else:
+            self.abandon()
+
+
+_lock = threading.Lock()
+_breakers = defaultdict(CircuitBreaker)
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+
+def _breaker(model):
+    with _lock:
+        return _breakers[model_key(model)]
+
+
+def breaker_state(model):
+    return _breaker(model).state(policy(model)["breaker_cooldown"])
+
+
+def record_result(model, ok, stage="predict", seconds=None):
+    """정책 밖에서 끝난 호출(웹훅 완료)의 결과를 서킷 브레이커와 지표에 반영합니다.
+
+    실패한 예측은 PredictionFailed처럼 서킷 브레이커에 세지 않지만,
+    모델 정책의 timeout을 넘겨 끝난 실패(reconcile의 시간 초과 포함)는 PredictionTimeout처럼 셉니다.
+    """
+    pol = policy(model)
+    breaker = _breaker(model)
+    if ok:
+        breaker.record(True, pol)
+    elif seconds is not None and seconds > pol["timeout"]:
+        breaker.record(False, pol)
+    else:
+        breaker.abandon()
+    if seconds is not None:
+        metrics.record_provider_call(model, stage, seconds, ok)
+
+
+def _record_latency(model, seconds):
+    with _lock:
+        _latencies[model_key(model)].append(seconds)
+
+
+def hedge_delay(model, pol=None):
+    """사본을 보낼 시점(초). 헤징하지 않으면 None"""
+    hedge = (pol or policy(model)).get("hedge")
+    if hedge == "p95":
+        with _lock:
+            samples = sorted(_latencies[model_key(model)])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+    return hedge
+
+
+@contextmanager
+def guard(model, stage="predict"):
+    """정책 루프를 쓸 수 없는 호출(스트리밍 등)에 서킷 브레이커만 적용합니다."""
+    pol = policy(model)
+    breaker = _breaker(model)
+    breaker.before_call(model, pol)
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        breaker.record_error(e, pol)
+        metrics.record_provider_call(model, stage, time.monotonic() - started, False)
+        raise
+    except BaseException:
+        breaker.abandon()
+        raise
+    breaker.record(True, pol)
+    metrics.record_provider_call(model, stage, time.monotonic() - started, True)
+
+
+# ---------------------------------------------------------------------------
+# 예측 실행
+# ---------------------------------------------------------------------------
+
+def is_retryable(exc):
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, ReplicateError):
+        return exc.status == 429 or (exc.status or 0) >= 500
+    return False
+
+
+def is_outage(exc):
+    """서킷 브레이커에 세는 실패: 일시적인 오류와 시간 초과 (모델이 응답하지 않음)"""
+    return is_retryable(exc) or isinstance(exc, PredictionTimeout)
+
+
+def _backoff(attempt, pol):
+    return random.uniform(0, min(pol["backoff_max"], pol["backoff"] * 2 ** attempt))
+
+
+def _rewind(input):
+    # 재시도/헤징으로 같은 입력을 다시 보낼 때 파일은 처음부터 읽어야 합니다.
+    for value in input.values():
+        for item in value if isinstance(value, list) else [value]:
+            if hasattr(item, "seek"):
+                item.seek(0)
+
+
+def create_prediction(client, model, input, stage="predict", **kwargs):
+    """model이 'owner/name:version'이면 버전으로, 아니면 공식 모델 이름으로 예측을 만듭니다."""
+    metrics.record_upload(model, stage, metrics.input_bytes(input))
+    if ":" in model:
+        return client.predictions.create(version=model.split(":", 1)[1], input=input, **kwargs)
+    return client.models.predictions.create(model=model, input=input, **kwargs)
+
+
+async def acreate_prediction(client, model, input, stage="predict", **kwargs):
+    metrics.record_upload(model, stage, metrics.input_bytes(input))
+    if ":" in model:
+        return await client.predictions.async_create(version=model.split(":", 1)[1], input=input, **kwargs)
+    return await client.models.predictions.async_create(model=model, input=input, **kwargs)
+
+
+def _sync_wait(pol, delay):
+    # 만들기 요청에서 바로 기다릴 시간(초, 1~60): 빠른 모델은 응답 한 번으로 끝납니다.
+    limit = min(pol["timeout"], delay) if delay else pol["timeout"]
+    return max(1, min(60, int(limit)))
+
+
+def _outcome(model, predictions, started):
+    """끝난 예측이 있으면 결과를, 모두 실패했으면 PredictionFailed를, 아직이면 None을 반환합니다."""
+    for prediction in predictions:
+        if prediction.status == "succeeded":
+            _record_latency(model, time.monotonic() - started)
+            return prediction
+    if all(p.status in TERMINAL_STATUSES for p in predictions):
+        error = predictions[0].error or predictions[0].status
+        raise PredictionFailed(f"{model_key(model)} 예측이 실패했습니다: {error}")
+    return None
+
+
+def _wait(client, model, input, pol, stage):
+    """예측 하나(필요하면 헤징 사본 포함)가 끝날 때까지 기다려 output을 반환합니다."""
+    started = time.monotonic()
+    deadline = started + pol["timeout"]
+    delay = hedge_delay(model, pol)
+    predictions = [create_prediction(client, model, input, stage, wait=_sync_wait(pol, delay))]
+    hedge_holder = None
+    try:
+        while True:
+            winner = _outcome(model, predictions, started)
+            if winner is not None:
+                return winner.output
+            now = time.monotonic()
+            if now >= deadline:
+                raise PredictionTimeout(model, pol["timeout"])
+            if delay is not None and len(predictions) == 1 and now - started >= delay:
+                delay = None
+                hedge_holder = admission.try_acquire(model)
+                if hedge_holder is not None:
+                    try:
+                        _rewind(input)
+                        predictions.append(create_prediction(client, model, input, stage))
+                        metrics.inc("firstapp_provider_hedges_total", model=model_key(model))
+                        logger.info("Hedged %s after %.1fs", model_key(model), now - started)
+                    except Exception:
+                        logger.exception("Hedge request failed (%s)", model_key(model))
+            time.sleep(settings.PROVIDER_POLL_INTERVAL)
+            for prediction in predictions:
+                if prediction.status not in TERMINAL_STATUSES:
+                    prediction.reload()
+    finally:
+        for prediction in predictions:
+            if prediction.status not in TERMINAL_STATUSES:
+                try:
+                    prediction.cancel()
+                except Exception:
+                    logger.warning("Prediction cancel failed: %s", prediction.id)
+        admission.release(hedge_holder)
+
+
+async def _await(client, model, input, pol, stage):
+    """_wait()의 async 버전"""
+    started = time.monotonic()
+    deadline = started + pol["timeout"]
+    delay = hedge_delay(model, pol)
+    predictions = [await acreate_prediction(client, model, input, stage, wait=_sync_wait(pol, delay))]
+    hedge_holder = None
+    try:
+        while True:
+            winner = _outcome(model, predictions, started)
+            if winner is not None:
+                return winner.output
+            now = time.monotonic()
+            if now >= deadline:
+                raise PredictionTimeout(model, pol["timeout"])
+            if delay is not None and len(predictions) == 1 and now - started >= delay:
+                delay = None
+                hedge_holder = await asyncio.to_thread(admission.try_acquire, model)
+                if hedge_holder is not None:
+                    try:
+                        _rewind(input)
+                        predictions.append(await acreate_prediction(client, model, input, stage))
+                        metrics.inc("firstapp_provider_hedges_total", model=model_key(model))
+                        logger.info("Hedged %s after %.1fs", model_key(model), now - started)
+                    except Exception:
+                        logger.exception("Hedge request failed (%s)", model_key(model))
+            await asyncio.sleep(settings.PROVIDER_POLL_INTERVAL)
+            for prediction in predictions:
+                if prediction.status not in TERMINAL_STATUSES:
+                    await prediction.async_reload()
+    finally:
+        for prediction in predictions:
+            if prediction.status not in TERMINAL_STATUSES:
+                try:
+                    await prediction.async_cancel()
+                except Exception:
+                    logger.warning("Prediction cancel failed: %s", prediction.id)
+        if hedge_holder is not None:
+            await asyncio.to_thread(admission.release, hedge_holder)
+
+
+def run(client, model, input, stage="predict"):
+    """client.run() 대신 사용합니다. 모델 정책을 적용해 예측을 실행하고 output을 반환합니다."""
+    pol = policy(model)
+    breaker = _breaker(model)
+    attempt = 0
+    started = time.monotonic()
+    while True:
+        breaker.before_call(model, pol)
+        try:
+            _rewind(input)
+            output = _wait(client, model, input, pol, stage)
+        except Exception as e:
+            if attempt < pol["retries"] and is_retryable(e):
+                # 재시도까지 한 호출이므로 서킷 브레이커에는 마지막 결과만 기록합니다.
+                breaker.abandon()
+                logger.warning("Retrying %s after error: %s", model_key(model), e)
+                metrics.inc("firstapp_provider_retries_total", model=model_key(model))
+                time.sleep(_backoff(attempt, pol))
+                attempt += 1
+                continue
+            breaker.record_error(e, pol)
+            metrics.record_provider_call(model, stage, time.monotonic() - started, False)
+            raise
+        breaker.record(True, pol)
+        metrics.record_provider_call(model, stage, time.monotonic() - started, True)
+        return output
+
+
+async def arun(client, model, input, stage="predict"):
+    """run()의 async 버전 (client.async_run() 대신 사용)"""
+    pol = policy(model)
+    breaker = _breaker(model)
+    attempt = 0
+    started = time.monotonic()
+    while True:
+        breaker.before_call(model, pol)
+        try:
+            _rewind(input)
+            output = await _await(client, model, input, pol, stage)
+        except Exception as e:
+            if attempt < pol["retries"] and is_retryable(e):
+                # 재시도까지 한 호출이므로 서킷 브레이커에는 마지막 결과만 기록합니다.
+                breaker.abandon()
+                logger.warning("Retrying %s after error: %s", model_key(model), e)
+                metrics.inc("firstapp_provider_retries_total", model=model_key(model))
+                await asyncio.sleep(_backoff(attempt, pol))
+                attempt += 1
+                continue
+            breaker.record_error(e, pol)
+            metrics.record_provider_call(model, stage, time.monotonic() - started, False)
+            raise
+        breaker.record(True, pol)
+        metrics.record_provider_call(model, stage, time.monotonic() - started, True)
+        return output
+
+
+def submit(client, model, input, stage="predict", **kwargs):
+    """예측을 만들기만 합니다. (webhook 모드) 만들기 요청의 일시적인 오류만 재시도하고,
+    결과와 지연은 워커가 완료된 예측을 진행할 때(webhooks.advance) record_result()로 반영합니다.
+    """
+    pol = policy(model)
+    breaker = _breaker(model)
+    attempt = 0
+    while True:
+        breaker.before_call(model, pol)
+        try:
+            _rewind(input)
+            prediction = create_prediction(client, model, input, stage, **kwargs)
+        except Exception as e:
+            if attempt < pol["retries"] and is_retryable(e):
+                breaker.abandon()
+                metrics.inc("firstapp_provider_retries_total", model=model_key(model))
+                time.sleep(_backoff(attempt, pol))
+                attempt += 1
+                continue
+            breaker.record_error(e, pol)
+            raise
+        # 제출 성공은 예측 결과가 아니므로 연속 실패 수는 그대로 두고 시험 표시만 풉니다.
+        # (성공/시간 초과는 완료를 진행하는 워커가 record_result()로 반영)
+        breaker.abandon()
+        return prediction
@@ -0,0 +1,129 @@
+"""생성 기록 유사 이미지 검색
+
+새로 올린 제품 사진과 지각 해시(phash.py)가 가까운 과거 생성 결과를 찾습니다.
+각 GeneratedImage는 두 개의 해시로 검색됩니다.
+- source_phash: 생성에 사용한 제품(업로드) 이미지 → 같은 제품으로 만든 결과
+- asset.phash: 로컬로 미러링한 결과 이미지 → 결과 이미지를 다시 올린 경우
+
+인덱스는 프로세스 메모리에 두는 다중 해시 테이블입니다. 64비트 해시를 16비트씩 4개 구간으로 나눠
+구간 값 → 항목 목록 테이블을 만들고, 거리 d 이하를 찾을 때는 구간마다 d // 4 비트 이하로 다른 값만
+조회한 뒤 실제 해밍 거리를 확인합니다. (DB의 분석 캐시 검색과 같은 방식)
+전체를 훑지 않으므로 항목이 수십만 개여도 조회는 수 ms 이내입니다.
+
+인덱스는 처음 검색할 때 DB에서 만들고, 이후 검색마다 새로 생긴 행(id 기준)만 추가합니다.
+미러링으로 나중에 채워지는 결과 해시는 SIMILAR_INDEX_REBUILD_SECONDS마다 전체를 다시 읽을 때 반영됩니다.
+"""
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+from . import phash as phash_lib
+from .models import GeneratedImage
+
+_lock = threading.Lock()
+_index = None
+_max_id = 0
+_built_at = 0.0
+
+
+class HashIndex:
+    """64비트 지각 해시 다중 인덱스 (구간별 해시 테이블)"""
+
+    def __init__(self):
+        self.hashes = array('Q')
+        self.keys = []  # (image_id, user_id)
+        self.tables = [{} for _ in range(phash_lib.BANDS)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, phash, key):
+        position = len(self.keys)
+        self.hashes.append(int(phash, 16))
+        self.keys.append(key)
+        for table, band in zip(self.tables, phash_lib.bands(phash)):
+            table.setdefault(band, []).append(position)
+
+    def search(self, phash, max_distance, accept=None):
+        """거리 max_distance 이하인 (거리, key) 목록. accept(key)가 False인 항목은 건너뜁니다."""
+        query = int(phash, 16)
+        radius = max_distance // phash_lib.BANDS
+        seen = set()
+        matches = []
+        for table, band in zip(self.tables, phash_lib.bands(phash)):
+            for probe in phash_lib.band_probes(band, radius):
+                for position in table.get(probe, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (self.hashes[position] ^ query).bit_count()
+                    key = self.keys[position]
+                    if distance <= max_distance and (accept is None or accept(key)):
+                        matches.append((distance, key))
+        matches.sort(key=lambda match: (match[0], -match[1][0]))
+        return matches
+
+
+def _load(index, rows):
+    max_id = 0
+    for image_id, user_id, source_phash, output_phash in rows:
+        max_id = max(max_id, image_id)
+        for value in {source_phash, output_phash}:
+            if value:
+                index.add(value, (image_id, user_id))
+    return max_id
+
+
+def _rows(min_id=0):
+    return (GeneratedImage.objects
+            .filter(id__gt=min_id)
+            .values_list('id', 'user_id', 'source_phash', 'asset__phash')
+            .order_by('id')
+            .iterator(chunk_size=5000))
+
+
+def get_index():
+    """최신 상태의 인덱스 (필요하면 새 행을 추가하거나 전체를 다시 만듭니다)"""
+    global _index, _max_id, _built_at
+    with _lock:
+        if _index is None or time.monotonic() - _built_at > settings.SIMILAR_INDEX_REBUILD_SECONDS:
+            index = HashIndex()
+            _max_id = _load(index, _rows())
+            _index = index
+            _built_at = time.monotonic()
+        else:
+            _max_id = max(_max_id, _load(_index, _rows(_max_id)))
+        return _index
+
+
+def similar_images(user, phash, limit=None, max_distance=None):
+    """user의 생성 기록에서 phash와 비슷한 GeneratedImage 목록 (가까운 순, 같은 거리면 최신순)
+
+    각 이미지에 distance 속성을 붙여 반환합니다. 관리자는 모든 사용자의 기록을 검색합니다.
+    """
+    if not phash:
+        return []
+    limit = limit or settings.SIMILAR_SEARCH_LIMIT
+    max_distance = settings.SIMILAR_SEARCH_MAX_DISTANCE if max_distance is None else max_distance
+    accept = None
+    if not user.userprofile.is_admin:
+        accept = lambda key: key[1] == user.id
+
+    distances = {}
+    for distance, (image_id, _) in get_index().search(phash, max_distance, accept):
+        # 업로드/결과 해시가 모두 맞으면 더 가까운 쪽을 사용합니다.
+        if image_id not in distances:
+            distances[image_id] = distance
+        if len(distances) >= limit:
+            break
+
+    images = GeneratedImage.objects.select_related('asset', 'job').in_bulk(list(distances))
+    result = []
+    for image_id, distance in distances.items():
+        image = images.get(image_id)
+        if image is not None:
+            image.distance = distance
+            result.append(image)
+    return result
@@ -0,0 +1,83 @@
+"""요청 하나를 작은 단계(stage) 그래프로 실행하는 스케줄러
+
+각 단계는 의존하는 단계의 결과가 모두 준비되는 즉시 시작됩니다.
+예) 번역 → 이미지 생성, 추천 문구는 번역과 동시에 시작
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.db import connection
+
+
+class Stage:
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func  # 의존 단계의 결과를 같은 이름의 키워드 인자로 받습니다.
+        self.deps = tuple(deps)
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, deps={self.deps!r})'
+
+
+class StageError(Exception):
+    def __init__(self, stage_name, error):
+        super().__init__(f'{stage_name}: {error}')
+        self.stage_name = stage_name
+        self.error = error
+
+
+def closing_connection(func, *args, **kwargs):
+    """스레드 풀에서 func를 실행하고, 그 스레드가 연 DB 연결을 닫습니다.
+
+    풀 스레드의 연결은 저절로 닫히지 않아 작업마다 쌓이고, PostgreSQL 연결 풀에도 반납되지 않습니다.
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connection.close()
+
+
+def run_stages(stages, on_stage_done=None):
+    """단계 그래프를 실행하고 {단계 이름: 결과}를 반환합니다.
+
+    on_stage_done(name, result)는 각 단계가 끝날 때마다 호출 스레드에서 불립니다.
+    한 단계가 실패하면 새 단계는 시작하지 않고, 실행 중인 단계가 끝난 뒤 StageError를 던집니다.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [d for d in stage.deps if d not in by_name]
+        if missing:
+            raise ValueError(f'{stage.name}: 알 수 없는 의존 단계 {missing}')
+
+    results = {}
+    pending = list(stages)
+    running = {}
+    failure = None
+
+    with ThreadPoolExecutor(max_workers=len(stages) or 1) as executor:
+        while pending or running:
+            if failure is None:
+                ready = [s for s in pending if all(d in results for d in s.deps)]
+                for stage in ready:
+                    pending.remove(stage)
+                    kwargs = {d: results[d] for d in stage.deps}
+                    running[executor.submit(closing_connection, stage.func, **kwargs)] = stage
+            if not running:
+                if pending and failure is None:
+                    raise ValueError(f'순환 의존이 있습니다: {pending}')
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    if failure is None:
+                        failure = StageError(stage.name, e)
+                    continue
+                if on_stage_done is not None:
+                    on_stage_done(stage.name, results[stage.name])
+
+    if failure is not None:
+        raise failure
+    return results
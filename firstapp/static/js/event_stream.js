@@ -0,0 +1,94 @@
+// 결과 스트리밍 (Server-Sent Events)
+// [data-stream-form] 폼을 fetch로 제출하고, 서버가 보내는 이벤트를 받는 대로 로딩 화면에 보여줍니다.
+//   status: 진행 상태 / token: 분석 텍스트 조각 / image: 결과 이미지 / error: 오류 / done: 결과 화면 HTML
+const STREAM_STATUS_LABELS = {
+    uploading: '이미지를 올리는 중입니다...',
+    analyzing: 'AI가 이미지를 분석하고 있습니다...',
+    starting: '모델을 준비하는 중입니다...',
+    processing: 'AI가 이미지를 만드는 중입니다...',
+    succeeded: '완료되었습니다. 결과 화면을 불러오는 중...',
+};
+
+// fetch 응답 본문을 SSE 메시지 단위로 나눠 onEvent(event, data)를 호출합니다.
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            const data = [];
+            message.split('\n').forEach((line) => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+            });
+            if (data.length) onEvent(event, JSON.parse(data.join('\n')));
+        }
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-stream-form]').forEach((form) => {
+        // 스트리밍을 지원하지 않는 브라우저는 원래대로 폼을 제출합니다.
+        if (!window.fetch || !window.ReadableStream || !window.TextDecoder) return;
+
+        const overlay = document.getElementById('loadingOverlay');
+        const statusText = overlay && overlay.querySelector('[data-stream-status]');
+        const output = overlay && overlay.querySelector('[data-stream-output]');
+        const preview = overlay && overlay.querySelector('[data-stream-image]');
+        const submitButton = form.querySelector('button[type="submit"]');
+
+        const fail = (message) => {
+            if (overlay) overlay.style.display = 'none';
+            if (submitButton) submitButton.disabled = false;
+            alert(message);
+        };
+
+        form.addEventListener('submit', async (e) => {
+            e.preventDefault();
+            if (output) output.textContent = '';
+            if (preview) preview.hidden = true;
+            let finished = false;
+            try {
+                const res = await fetch(form.action || window.location.href, {
+                    method: 'POST',
+                    body: new FormData(form),
+                    headers: { 'Accept': 'text/event-stream' },
+                });
+                // 입력 오류 등으로 일반 페이지가 돌아오면 그대로 보여줍니다.
+                if (!(res.headers.get('content-type') || '').startsWith('text/event-stream')) {
+                    const html = await res.text();
+                    document.open(); document.write(html); document.close();
+                    return;
+                }
+                await readEventStream(res, (event, data) => {
+                    if (event === 'status' && statusText && STREAM_STATUS_LABELS[data.status]) {
+                        statusText.textContent = STREAM_STATUS_LABELS[data.status];
+                    } else if (event === 'token' && output) {
+                        output.hidden = false;
+                        output.textContent += data.text;
+                    } else if (event === 'image' && preview) {
+                        preview.src = data.url;
+                        preview.hidden = false;
+                    } else if (event === 'error') {
+                        finished = true;
+                        fail(data.error);
+                    } else if (event === 'done') {
+                        finished = true;
+                        document.open(); document.write(data.html); document.close();
+                    }
+                });
+                if (!finished) fail('연결이 끊어졌습니다. 다시 시도해주세요.');
+            } catch (err) {
+                console.error(err);
+                if (!finished) fail('요청 중 오류가 발생했습니다.');
+            }
+        });
+    });
+});
@@ -0,0 +1,40 @@
+// 프로필 갤러리 무한 스크롤
+// [data-infinite-scroll] 컨테이너의 data-url에서 data-cursor 다음 페이지를 불러와 이어 붙입니다.
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-infinite-scroll]').forEach((container) => {
+        if (!container.dataset.cursor) return;
+
+        const sentinel = document.createElement('div');
+        sentinel.className = 'infinite-scroll-sentinel';
+        container.after(sentinel);
+
+        let loading = false;
+        const loadMore = async () => {
+            const cursor = container.dataset.cursor;
+            if (loading || !cursor) return;
+            loading = true;
+            try {
+                const url = `${container.dataset.url}?cursor=${encodeURIComponent(cursor)}`;
+                const res = await fetch(url, { headers: { 'Accept': 'application/json' } });
+                if (!res.ok) throw new Error(res.status);
+                const data = await res.json();
+                container.insertAdjacentHTML('beforeend', data.html);
+                container.dataset.cursor = data.next_cursor || '';
+                if (!data.next_cursor) {
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            } catch (e) {
+                console.error('다음 페이지를 불러오지 못했습니다.', e);
+            } finally {
+                loading = false;
+            }
+        };
+
+        // 화면 하단에 가까워지면 미리 불러옵니다.
+        const observer = new IntersectionObserver((entries) => {
+            if (entries.some((entry) => entry.isIntersecting)) loadMore();
+        }, { rootMargin: '600px 0px' });
+        observer.observe(sentinel);
+    });
+});
@@ -0,0 +1,187 @@
+"""정적 파일 빌드와 제공 (python manage.py build_static_assets)
+
+- 이미지: 큰 JPEG 원본을 STATIC_IMAGE_MAX_WIDTH 폭으로 다시 인코딩한 같은 이름의 사본과,
+  반응형 크기별 WebP/JPEG 사본(<이름>-<폭>w.webp 등)을 STATIC_BUILD_DIR(프로젝트의 static/)에 씁니다.
+  STATICFILES_DIRS는 앱 static 폴더보다 먼저 찾아지므로 템플릿/CSS를 고치지 않아도 줄인 이미지가 쓰이고,
+  {% static_image %} 태그는 반응형 사본이 있으면 <picture srcset>으로 그립니다.
+- collectstatic: CompressedManifestStaticFilesStorage가 내용 해시가 붙은 이름(home.3f2a1c….css)으로 복사하고,
+  CSS/JS 등 텍스트 파일은 .gz(brotli가 설치되어 있으면 .br도) 압축본을 함께 씁니다.
+- 제공: 보통 nginx가 STATIC_ROOT를 제공합니다. STATIC_SERVE_ENABLED=true이면 serve()가 압축본을 골라 보내고,
+  해시 이름 파일에는 영구 캐시(immutable) 헤더를 붙입니다.
+"""
+import functools
+import gzip
+import json
+import mimetypes
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from PIL import Image
+
+from .derivatives import encode_image
+from .media_store import write_atomic
+
+try:
+    import brotli
+except ImportError:
+    # 선택 사항: pip install brotli 하면 .br 압축본도 만듭니다.
+    brotli = None
+
+# 반응형 사본을 만드는 이미지 / 압축본을 만드는 텍스트 파일의 확장자
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+COMPRESS_EXTENSIONS = ('.css', '.js', '.mjs', '.svg', '.json', '.txt', '.map')
+# 원본 이름 → {'webp': [[폭, 이름], ...], 'jpeg': [...]}
+VARIANTS_INDEX = 'images/variants.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+# ---------------------------------------------------------------------------
+# 이미지
+# ---------------------------------------------------------------------------
+
+def _source_images():
+    """앱 static 폴더의 이미지 (STATIC_BUILD_DIR에 만든 사본은 제외)"""
+    build_dir = Path(settings.STATIC_BUILD_DIR).resolve()
+    seen = set()
+    for finder in finders.get_finders():
+        for name, storage in finder.list([]):
+            name = name.replace(os.sep, '/')
+            root = Path(storage.location).resolve()
+            if root == build_dir or name in seen or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            seen.add(name)
+            yield name, root / name
+
+
+def _write_if_stale(target, source, encode, force):
+    if force or not target.exists() or target.stat().st_mtime < source.stat().st_mtime:
+        write_atomic(target, [encode()])
+
+
+def build_images(force=False):
+    """반응형 사본과 줄인 사본을 만들고 VARIANTS_INDEX를 씁니다. 원본보다 오래된 사본만 다시 만듭니다."""
+    build_dir = Path(settings.STATIC_BUILD_DIR)
+    index = {}
+    for name, path in _source_images():
+        if path.stat().st_size < settings.STATIC_IMAGE_MIN_BYTES:
+            continue
+        with Image.open(path) as image:
+            width = image.width
+        stem = os.path.splitext(name)[0]
+
+        if name.lower().endswith(('.jpg', '.jpeg')):
+            # 같은 이름의 사본은 원본보다 작을 때만 씁니다. (이미 최적화된 원본은 그대로 사용)
+            data = encode_image(path, min(width, settings.STATIC_IMAGE_MAX_WIDTH), 'jpeg')
+            if len(data) < path.stat().st_size:
+                _write_if_stale(build_dir / name, path, lambda: data, force)
+
+        variants = {'webp': [], 'jpeg': []}
+        for variant_width in sorted({min(w, width) for w in settings.STATIC_IMAGE_WIDTHS}):
+            for fmt, ext in (('webp', 'webp'), ('jpeg', 'jpg')):
+                variant = f'{stem}-{variant_width}w.{ext}'
+                _write_if_stale(build_dir / variant, path,
+                                functools.partial(encode_image, path, variant_width, fmt), force)
+                variants[fmt].append([variant_width, variant])
+        index[name] = variants
+
+    write_atomic(build_dir / VARIANTS_INDEX, [json.dumps(index, indent=2, sort_keys=True).encode()])
+    image_variants.cache_clear()
+    return index
+
+
+@functools.cache
+def image_variants():
+    """build_images()가 만든 반응형 사본 목록 (빌드 전이면 빈 dict)"""
+    path = finders.find(VARIANTS_INDEX)
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# 압축 / collectstatic
+# ---------------------------------------------------------------------------
+
+def _compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+def precompress(path):
+    """path.gz(와 path.br)를 쓰고 붙인 확장자 목록을 반환합니다. 거의 줄지 않으면 쓰지 않습니다."""
+    data = Path(path).read_bytes()
+    written = []
+    for suffix, compress in _compressors():
+        compressed = compress(data)
+        if len(compressed) < len(data) * 0.9:
+            write_atomic(Path(f'{path}{suffix}'), [compressed])
+            written.append(suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """내용 해시 이름으로 저장하고(ManifestStaticFilesStorage), 텍스트 파일은 압축본을 함께 씁니다.
+
+    DEBUG에서는 해시 없는 원래 이름으로 제공하므로 개발 중에는 collectstatic이 필요 없습니다.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESS_EXTENSIONS):
+                precompress(self.path(name))
+
+
+# ---------------------------------------------------------------------------
+# 제공 (STATIC_SERVE_ENABLED)
+# ---------------------------------------------------------------------------
+
+@functools.cache
+def _hashed_names():
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+def serve(request, path):
+    """STATIC_ROOT의 파일. 브라우저가 받을 수 있는 압축본(br → gzip)이 있으면 그것을 보냅니다."""
+    try:
+        full_path = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    if not full_path.is_file():
+        raise Http404
+
+    stat = full_path.stat()
+    if not was_modified_since(request.headers.get('if-modified-since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        send_path, encoding = full_path, None
+        accept_encoding = request.headers.get('accept-encoding', '')
+        for suffix, name in (('.br', 'br'), ('.gz', 'gzip')):
+            compressed = Path(f'{full_path}{suffix}')
+            if name in accept_encoding and compressed.is_file():
+                send_path, encoding = compressed, name
+                break
+        content_type = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+        response = FileResponse(open(send_path, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    # 해시 이름은 내용이 바뀌면 이름도 바뀌므로 영구 캐시, 그 외(원래 이름)는 STATIC_CACHE_MAX_AGE초
+    if path in _hashed_names():
+        response['Cache-Control'] = IMMUTABLE
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.STATIC_CACHE_MAX_AGE}'
+    return response
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from .models import GenerationJob
+
+
+def wants_event_stream(request):
+    """fetch/EventSource가 결과를 스트리밍으로 받겠다고 요청했는지 확인합니다."""
+    return "text/event-stream" in request.headers.get("accept", "")
+
+def streams_job_events(request):
+    """결과 페이지가 진행 상황 스트림(/jobs/<id>/events/)을 열지 여부
+
+    WSGI에서는 스트림 하나가 최대 GENERATION_EVENTS_MAX_SECONDS 동안 요청 스레드를 붙잡으므로,
+    async 뷰를 ASGI 서버로 제공할 때만 스트림을 쓰고 그 외에는 상태 JSON을 주기적으로 조회합니다.
+    """
+    return settings.ASYNC_VIEWS_ENABLED and isinstance(request, ASGIRequest)
+
+def sse_event(event, data):
+    """Server-Sent Events 형식의 메시지 하나 (data는 JSON으로 보냄)"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # nginx 등 프록시가 응답을 모아 두지 않고 바로 흘려보내도록 합니다.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _image_event(index, result):
+    data = {"index": index, "url": result.get("url"), "error": result.get("error")}
+    if result.get("asset"):
+        data["url"] = reverse("media_asset", args=[result["asset"]])
+    return data
+
+
+class _JobEventTracker:
+    """이미 보낸 상태를 기억하고, 작업 행에서 바뀐 부분만 이벤트로 만듭니다."""
+    fields = ("status", "image_number", "results", "word_urls", "error")
+
+    def __init__(self):
+        self.status = None
+        self.words = None
+        self.images = {}
+        self.finished = False
+
+    def diff(self, job):
+        if job is None:
+            self.finished = True
+            return [sse_event("error", {"error": "작업을 찾을 수 없습니다."})]
+        events = []
+        if job["status"] != self.status:
+            self.status = job["status"]
+            events.append(sse_event("status", {"status": self.status, "image_number": job["image_number"]}))
+        if job["word_urls"] and job["word_urls"] != self.words:
+            self.words = job["word_urls"]
+            events.append(sse_event("copy", {"lines": self.words}))
+        for index, result in enumerate(job["results"]):
+            if result.get("pending"):
+                continue
+            data = _image_event(index, result)
+            if self.images.get(index) != data:
+                self.images[index] = data
+                events.append(sse_event("image", data))
+        if job["status"] in (GenerationJob.STATUS_SUCCEEDED, GenerationJob.STATUS_FAILED):
+            self.finished = True
+            events.append(sse_event("done", {"status": job["status"], "error": job["error"]}))
+        return events
+
+
+def job_events(job_id):
+    """생성 작업의 진행 상황을 바뀐 부분만 이벤트로 보냅니다.
+
+    워커가 이미지 한 장, 추천 문구가 끝날 때마다 저장하므로 DB를 짧은 간격으로
+    확인해 새로 생긴 항목만 내보냅니다. 연결이 끊기면 EventSource가 다시 접속하고
+    처음부터 다시 받으므로, 브라우저 쪽은 index 기준으로 덮어쓰기만 합니다.
+    """
+    tracker = _JobEventTracker()
+    deadline = time.monotonic() + settings.GENERATION_EVENTS_MAX_SECONDS
+    keepalive_at = time.monotonic() + 15
+
+    # 재접속 간격(ms)
+    yield f"retry: {int(settings.GENERATION_EVENTS_RETRY_MS)}\n\n"
+    while True:
+        job = GenerationJob.objects.filter(id=job_id).values(*tracker.fields).first()
+        yield from tracker.diff(job)
+        if tracker.finished:
+            return
+        if time.monotonic() >= deadline:
+            # 연결을 오래 붙잡지 않도록 끊고, 브라우저가 다시 접속하게 합니다.
+            return
+        if time.monotonic() >= keepalive_at:
+            keepalive_at = time.monotonic() + 15
+            yield ": keepalive\n\n"
+        time.sleep(settings.GENERATION_EVENTS_POLL_INTERVAL)
+
+
+async def ajob_events(job_id):
+    """job_events()의 async 버전 (ASGI). 기다리는 동안 스레드를 점유하지 않습니다."""
+    tracker = _JobEventTracker()
+    deadline = time.monotonic() + settings.GENERATION_EVENTS_MAX_SECONDS
+    keepalive_at = time.monotonic() + 15
+
+    yield f"retry: {int(settings.GENERATION_EVENTS_RETRY_MS)}\n\n"
+    while True:
+        job = await GenerationJob.objects.filter(id=job_id).values(*tracker.fields).afirst()
+        for event in tracker.diff(job):
+            yield event
+        if tracker.finished or time.monotonic() >= deadline:
+            return
+        if time.monotonic() >= keepalive_at:
+            keepalive_at = time.monotonic() + 15
+            yield ": keepalive\n\n"
+        await asyncio.sleep(settings.GENERATION_EVENTS_POLL_INTERVAL)
@@ -0,0 +1,60 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.urls import reverse
+
+from firstapp import static_assets
+
+register = template.Library()
+
+
+def _digest(asset):
+    # MediaAsset 또는 작업 결과에 저장된 해시 문자열을 모두 받습니다.
+    return getattr(asset, 'digest', asset)
+
+
+@register.simple_tag
+def asset_derivative_url(asset, width, fmt='webp'):
+    return reverse('media_asset_derivative', args=[_digest(asset), int(width), fmt])
+
+
+@register.simple_tag
+def asset_thumbnail_url(asset, fmt='webp'):
+    return asset_derivative_url(asset, settings.ASSET_THUMBNAIL_WIDTH, fmt)
+
+
+@register.simple_tag
+def asset_srcset(asset, fmt='webp'):
+    """<img srcset="..."> 값: 'url 480w, url 960w, ...'"""
+    return ', '.join(
+        f'{asset_derivative_url(asset, width, fmt)} {width}w'
+        for width in settings.ASSET_RESPONSIVE_WIDTHS
+    )
+
+
+@register.inclusion_tag('responsive_image.html')
+def responsive_image(asset, fallback_url='', alt='', css_class='', sizes='100vw'):
+    """로컬 사본이 있으면 WebP/JPEG 반응형 <picture>, 없으면 원래 URL의 <img>를 그립니다."""
+    digest = _digest(asset) if asset else None
+    context = {'fallback_url': fallback_url, 'alt': alt, 'css_class': css_class, 'sizes': sizes, 'digest': digest}
+    if digest:
+        context.update({
+            'webp_srcset': asset_srcset(digest, 'webp'),
+            'jpeg_srcset': asset_srcset(digest, 'jpeg'),
+            'src': asset_derivative_url(digest, settings.ASSET_RESPONSIVE_WIDTHS[0], 'jpeg'),
+        })
+    return context
+
+
+@register.inclusion_tag('responsive_image.html')
+def static_image(name, alt='', css_class='', sizes='100vw'):
+    """정적 이미지. build_static_assets로 만든 반응형 사본이 있으면 WebP/JPEG <picture>로 그립니다."""
+    context = {'fallback_url': static(name), 'alt': alt, 'css_class': css_class, 'sizes': sizes}
+    variants = static_assets.image_variants().get(name)
+    if variants:
+        context.update({
+            'webp_srcset': ', '.join(f'{static(variant)} {width}w' for width, variant in variants['webp']),
+            'jpeg_srcset': ', '.join(f'{static(variant)} {width}w' for width, variant in variants['jpeg']),
+            'src': static(variants['jpeg'][0][1]),
+        })
+    return context
@@ -1,17 +1,460 @@
-import replicate
+import itertools
+import json
 import os
-import requests
-from dotenv import load_dotenv
+import queue
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import urlsplit
 
-load_dotenv()
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
-client = replicate.Client(api_token="your_token")
+from . import admission, analysis_cache, generation, llm_cache, metrics, phash, providers, resilience, webhooks
+from .fake_provider import FakeReplicateClient
+from .models import AnalysisCache, Counter, GeneratedImage, GenerationJob, Prediction, ProviderSlot, TextCompletionCache
+from .pagination import decode_cursor, encode_cursor, keyset_page
 
-output = client.run(
-    "black-forest-labs/flux-kontext-pro",
-    input={
-        "prompt": "Korean game-youtuber kim-doe is drinking this small can of beer using one hand on a beach",
-        "input_image": open("beer_can_no_bg.png", "rb"),
-        "aspect_ratio": "16:9",
+SECRET = 'whsec_dGVzdC13ZWJob29rLXNlY3JldA=='
+PRODUCT_IMAGE = os.path.join(settings.BASE_DIR, 'firstapp', 'static', 'images', 'prod_1.jpg')
+
+
+def signed_headers(body, timestamp=None, webhook_id='msg_test'):
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    return {
+        'webhook-id': webhook_id,
+        'webhook-timestamp': timestamp,
+        'webhook-signature': f'v1,{webhooks.sign(webhook_id, timestamp, body)}',
     }
-)
+
+
+@override_settings(REPLICATE_WEBHOOK_SECRET=SECRET)
+class WebhookSignatureTests(TestCase):
+    def test_valid_signature(self):
+        body = b'{"status": "succeeded"}'
+        self.assertTrue(webhooks.verify_signature(signed_headers(body), body))
+
+    def test_tampered_body(self):
+        headers = signed_headers(b'{"status": "succeeded"}')
+        self.assertFalse(webhooks.verify_signature(headers, b'{"status": "failed"}'))
+
+    def test_rotated_signatures(self):
+        # 키를 교체하는 동안에는 서명이 여러 개 옵니다.
+        body = b'{}'
+        headers = signed_headers(body)
+        headers['webhook-signature'] = f"v1,b2xkLXNpZ25hdHVyZQ== {headers['webhook-signature']}"
+        self.assertTrue(webhooks.verify_signature(headers, body))
+
+    def test_missing_headers(self):
+        body = b'{}'
+        headers = signed_headers(body)
+        del headers['webhook-id']
+        self.assertFalse(webhooks.verify_signature(headers, body))
+
+    def test_replayed_old_timestamp(self):
+        body = b'{"status": "succeeded"}'
+        old = int(time.time()) - settings.WEBHOOK_TIMESTAMP_TOLERANCE_SECONDS - 60
+        self.assertFalse(webhooks.verify_signature(signed_headers(body, timestamp=old), body))
+
+    def test_malformed_secret(self):
+        body = b'{}'
+        headers = signed_headers(body)
+        with override_settings(REPLICATE_WEBHOOK_SECRET='whsec_not base64!'):
+            self.assertFalse(webhooks.verify_signature(headers, body))
+
+    def test_replayed_notification_is_recorded_once(self):
+        job = GenerationJob.objects.create(upload_path='x.jpg', status=GenerationJob.STATUS_RUNNING)
+        prediction = Prediction.objects.create(
+            job=job, stage=Prediction.STAGE_TRANSLATE, index=0, model='openai/o4-mini', provider_id='p1',
+        )
+        body = json.dumps({'id': 'p1', 'status': 'succeeded', 'output': ['text']}).encode()
+        url = f'/webhooks/replicate/?prediction={prediction.pk}'
+        for _ in range(2):
+            response = Client().post(url, body, content_type='application/json', headers=signed_headers(body))
+            self.assertEqual(response.status_code, 204)
+        self.assertEqual(webhooks.claim_completed(), prediction)
+        self.assertIsNone(webhooks.claim_completed())
+
+    def test_rejected_signature(self):
+        body = b'{}'
+        headers = signed_headers(body)
+        headers['webhook-signature'] = 'v1,AAAA'
+        response = Client().post('/webhooks/replicate/?prediction=1', body, content_type='application/json',
+                                 headers=headers)
+        self.assertEqual(response.status_code, 403)
+
+
+class GenerationFlowTests(TransactionTestCase):
+    """가짜 provider로 생성 작업을 끝까지 실행합니다. (poll 모드는 스레드 풀을 쓰므로 TransactionTestCase)"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='firstapp-tests-')
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.work_dir, 'media'),
+            ASSET_STORE_DIR=os.path.join(self.work_dir, 'assets'),
+            METRICS_DIR=os.path.join(self.work_dir, 'metrics'),
+            ASSET_MIRROR_ENABLED=False,
+            REPLICATE_WEBHOOK_SECRET=SECRET,
+            # 테스트에서는 collectstatic 없이 정적 파일 URL을 만들 수 없으므로 결과 URL을 고정합니다.
+            FAKE_PROVIDER_OUTPUT_URL='https://fake-provider.local/output.jpg',
+        )
+        self.settings_override.enable()
+        self.webhooks = queue.Queue()
+        self.client_patch = mock.patch.object(
+            providers, 'client', FakeReplicateClient(delay=0, deliver=self._deliver, seed=1),
+        )
+        self.client_patch.start()
+        admission._prepared_scopes.clear()
+        self.user = User.objects.create_user('tester', password='pw')
+        with open(PRODUCT_IMAGE, 'rb') as f:
+            self.upload_path = default_storage.save('uploads/product.jpg', ContentFile(f.read()))
+
+    def tearDown(self):
+        self.client_patch.stop()
+        self.settings_override.disable()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _deliver(self, url, headers, body):
+        # 완료 웹훅은 타이머 스레드에서 오므로 테스트 스레드가 받아서 전달합니다.
+        self.webhooks.put((url, headers, body))
+
+    def _claim_job(self, model_choice, image_number=2):
+        GenerationJob.objects.create(
+            user=self.user, upload_path=self.upload_path, model_choice=model_choice, image_number=image_number,
+            product_type='맥주', theme='해변', mood='밝은', placement='모래 위',
+        )
+        return generation.claim_next_job()
+
+    def _drive_webhooks(self, job, deadline=30):
+        """웹훅을 전달하고 완료된 예측을 advance()로 진행해 작업이 끝날 때까지 반복합니다."""
+        stop_at = time.monotonic() + deadline
+        while time.monotonic() < stop_at:
+            job.refresh_from_db()
+            if job.status != GenerationJob.STATUS_RUNNING:
+                return job
+            prediction = webhooks.claim_completed()
+            if prediction is not None:
+                webhooks.advance(prediction)
+                continue
+            try:
+                url, headers, body = self.webhooks.get(timeout=1)
+            except queue.Empty:
+                continue
+            parts = urlsplit(url)
+            response = Client().post(
+                f'{parts.path}?{parts.query}', body, content_type='application/json',
+                headers={k: v for k, v in headers.items() if k != 'content-type'},
+            )
+            self.assertEqual(response.status_code, 204)
+        self.fail(f'작업이 {deadline}초 안에 끝나지 않았습니다: {job.id}')
+
+    def _assert_succeeded(self, job, image_number):
+        self.assertEqual(job.status, GenerationJob.STATUS_SUCCEEDED, job.error)
+        self.assertTrue(job.full_prompt)
+        self.assertIn('가짜 광고 문구', job.word_urls[0])
+        self.assertEqual(len(job.results), image_number)
+        self.assertTrue(all(result['url'] for result in job.results))
+        self.assertEqual(GeneratedImage.objects.filter(job=job).count(), image_number)
+        # 끝난 뒤에는 provider 자리가 모두 반납되어야 합니다.
+        self.assertFalse(ProviderSlot.objects.exclude(holder='').exists())
+
+    def test_poll_mode(self):
+        for model_choice in ('flux', 'custom_bar'):
+            with self.subTest(model_choice=model_choice):
+                job = generation.run_job(self._claim_job(model_choice))
+                job.refresh_from_db()
+                self._assert_succeeded(job, 2)
+
+    @override_settings(GENERATION_COMPLETION_MODE='webhook')
+    def test_webhook_mode(self):
+        for model_choice in ('flux', 'custom_bar'):
+            with self.subTest(model_choice=model_choice):
+                job = generation.run_job(self._claim_job(model_choice))
+                self.assertEqual(job.status, GenerationJob.STATUS_RUNNING, job.error)
+                job = self._drive_webhooks(job)
+                self._assert_succeeded(job, 2)
+                self.assertFalse(Prediction.objects.filter(job=job, needs_advance=True).exists())
+
+    @override_settings(GENERATION_COMPLETION_MODE='webhook')
+    def test_webhook_mode_failed_prediction_fails_job(self):
+        job = generation.run_job(self._claim_job('flux', image_number=1))
+        prediction = Prediction.objects.get(job=job, stage=Prediction.STAGE_TRANSLATE)
+        webhooks.record_update(prediction.pk, {'id': prediction.provider_id, 'status': 'failed', 'error': 'boom'})
+        webhooks.advance(webhooks.claim_completed())
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertEqual(job.error, 'boom')
+
+    @override_settings(GENERATION_COMPLETION_MODE='webhook')
+    def test_webhook_mode_timeouts_open_breaker(self):
+        model = webhooks.TEXT_MODEL
+        pol = resilience.policy(model)
+        self.addCleanup(resilience._breakers.clear)
+        resilience._breakers.clear()
+        for _ in range(pol['breaker_failures']):
+            self.assertEqual(resilience.breaker_state(model), 'closed')
+            job = generation.run_job(self._claim_job('flux', image_number=1))
+            prediction = Prediction.objects.get(job=job, stage=Prediction.STAGE_TRANSLATE)
+            # reconcile_predictions()가 timeout을 넘긴 예측을 실패로 기록한 경우
+            Prediction.objects.filter(pk=prediction.pk).update(
+                created_at=timezone.now() - timedelta(seconds=pol['timeout'] + 1),
+            )
+            webhooks.record_update(prediction.pk, {'id': prediction.provider_id, 'status': 'failed', 'error': 'timeout'})
+            webhooks.advance(webhooks.claim_completed())
+        # 사이사이 제출에 성공한 예측(copy)은 연속 실패 수를 되돌리지 않습니다.
+        self.assertEqual(resilience.breaker_state(model), 'open')
+
+
+# 페이지 렌더링 테스트는 collectstatic 없이 정적 파일 URL을 만들도록 manifest 없는 저장소를 씁니다.
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class ResultPageTests(TestCase):
+    def test_wsgi_result_page_polls_status(self):
+        # WSGI 요청에서는 스레드를 붙잡는 이벤트 스트림 대신 상태 조회를 씁니다.
+        job = GenerationJob.objects.create(upload_path='x.jpg')
+        for async_views in (False, True):
+            with self.subTest(async_views=async_views), override_settings(ASYNC_VIEWS_ENABLED=async_views):
+                response = Client().get(f'/jobs/{job.id}/')
+                self.assertNotContains(response, 'EventSource')
+                self.assertContains(response, f'/jobs/{job.id}/status/')
+
+    @override_settings(ASYNC_VIEWS_ENABLED=True)
+    async def test_asgi_result_page_streams_events(self):
+        job = await GenerationJob.objects.acreate(upload_path='x.jpg')
+        response = await AsyncClient().get(f'/jobs/{job.id}/')
+        self.assertContains(response, 'EventSource')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp(prefix='firstapp-metrics-')
+        self.settings_override = override_settings(METRICS_ENABLED=True, METRICS_DIR=self.metrics_dir, METRICS_TOKEN='')
+        self.settings_override.enable()
+        # 프로세스별 파일 경로를 새 METRICS_DIR로 다시 정하도록 합니다.
+        metrics._pid = None
+
+    def tearDown(self):
+        self.settings_override.disable()
+        metrics._pid = None
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def test_metrics_require_internal_address_without_token(self):
+        self.assertEqual(Client(REMOTE_ADDR='127.0.0.1').get('/metrics').status_code, 200)
+        self.assertEqual(Client(REMOTE_ADDR='10.0.0.5').get('/metrics').status_code, 200)
+        self.assertEqual(Client(REMOTE_ADDR='8.8.8.8').get('/metrics').status_code, 403)
+        # 같은 호스트의 프록시를 거쳐 온 외부 요청
+        response = Client(REMOTE_ADDR='127.0.0.1').get('/metrics', headers={'X-Forwarded-For': '8.8.8.8'})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+        response = Client(REMOTE_ADDR='8.8.8.8').get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_dead_process_files_are_merged(self):
+        if os.name != 'posix':
+            self.skipTest('프로세스 확인은 POSIX에서만 합니다.')
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        counter = ['firstapp_provider_retries_total', [['model', 'dead/model']], 3]
+        for suffix in ('a', 'b'):
+            with open(os.path.join(self.metrics_dir, f'{dead.pid}-{suffix}.json'), 'w') as f:
+                json.dump({'counters': [counter], 'histograms': []}, f)
+        key = ('firstapp_provider_retries_total', (('model', 'dead/model'),))
+        self.assertEqual(metrics.collect()[0][key], 6)
+        self.assertFalse([n for n in os.listdir(self.metrics_dir) if n.startswith(f'{dead.pid}-')])
+        # 합친 뒤에도 값은 그대로입니다.
+        self.assertEqual(metrics.collect()[0][key], 6)
+
+    @override_settings(ANALYSIS_CACHE_ENABLED=True)
+    def test_analysis_cache_counts_as_metrics(self):
+        analysis_cache.store('0123456789abcdef', 'low', 'low', '분석 결과')
+        self.assertEqual(analysis_cache.lookup('0123456789abcdef', 'low', 'low'), '분석 결과')
+        self.assertIsNone(analysis_cache.lookup('fedcba9876543210', 'low', 'low'))
+        stats = analysis_cache.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+        # 조회마다 DB 카운터를 쓰지 않습니다.
+        self.assertFalse(Counter.objects.exists())
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', password='pw')
+        for i in range(7):
+            GeneratedImage.objects.create(user=self.user, image_url=f'https://example.com/{i}.jpg')
+        images = list(GeneratedImage.objects.order_by('pk'))
+        # 같은 시각에 만든 이미지가 페이지 경계에 걸리도록 세 개씩 같은 created_at을 줍니다.
+        base = timezone.now()
+        for i, image in enumerate(images):
+            GeneratedImage.objects.filter(pk=image.pk).update(created_at=base - timedelta(seconds=i // 3))
+        self.expected = list(GeneratedImage.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def _walk(self, limit):
+        pages, cursor = [], None
+        while True:
+            items, cursor = keyset_page(GeneratedImage.objects.all(), cursor, limit)
+            pages.append([image.pk for image in items])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_everything_once(self):
+        for limit in (1, 2, 3, 4, 6, 7, 10):
+            with self.subTest(limit=limit):
+                pages = self._walk(limit)
+                self.assertEqual(list(itertools.chain.from_iterable(pages)), self.expected)
+                self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+
+    def test_no_cursor_on_exact_last_page(self):
+        items, cursor = keyset_page(GeneratedImage.objects.all(), None, 7)
+        self.assertEqual(len(items), 7)
+        self.assertIsNone(cursor)
+
+    def test_cursor_round_trip(self):
+        image = GeneratedImage.objects.first()
+        self.assertEqual(decode_cursor(encode_cursor(image)), (image.created_at, image.pk))
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor', '!!!', ''):
+            if cursor:
+                with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                    decode_cursor(cursor)
+
+
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_GLOBAL_MAX_PREDICTIONS=4, ADMISSION_USER_MAX_PREDICTIONS=1,
+                   ADMISSION_MODEL_MAX_PREDICTIONS={'default': 2})
+class AdmissionTests(TestCase):
+    def setUp(self):
+        admission._prepared_scopes.clear()
+
+    def _held(self, holder):
+        return set(ProviderSlot.objects.filter(holder=holder).values_list('scope', flat=True))
+
+    def test_acquire_all_scopes(self):
+        holder = admission.try_acquire('model/a', user_id=1)
+        self.assertEqual(self._held(holder), {'global', 'model:model/a', 'user:1'})
+        admission.release(holder)
+        self.assertFalse(ProviderSlot.objects.exclude(holder='').exists())
+
+    def test_partial_claim_is_released(self):
+        first = admission.try_acquire('model/a', user_id=1)
+        # global, model 자리는 남아 있지만 사용자 자리가 없으므로 앞에서 잡은 자리도 돌려놓아야 합니다.
+        self.assertIsNone(admission.try_acquire('model/a', user_id=1, holder='second'))
+        self.assertEqual(self._held('second'), set())
+        self.assertEqual(ProviderSlot.objects.exclude(holder='').count(), 3)
+        self.assertIsNotNone(admission.try_acquire('model/a', user_id=2))
+        admission.release(first)
+
+    def test_model_limit(self):
+        holders = [admission.try_acquire('model/a', user_id=user_id) for user_id in (1, 2)]
+        self.assertTrue(all(holders))
+        self.assertIsNone(admission.try_acquire('model/a', user_id=3))
+        self.assertIsNotNone(admission.try_acquire('model/b', user_id=3))
+
+    def test_expired_lease_is_reclaimed(self):
+        admission.try_acquire('model/a', user_id=1)
+        ProviderSlot.objects.exclude(holder='').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNotNone(admission.try_acquire('model/a', user_id=1))
+
+
+class PhashTests(TestCase):
+    def test_near_q_matches_brute_force(self):
+        rng = random.Random(7)
+        target = rng.getrandbits(64)
+        hashes = []
+        for _ in range(300):
+            # 가까운 해시가 충분히 섞이도록 target에서 0~12비트를 뒤집은 값과 무작위 값을 함께 만듭니다.
+            if rng.random() < 0.7:
+                value = target
+                for bit in rng.sample(range(64), rng.randint(0, 12)):
+                    value ^= 1 << bit
+            else:
+                value = rng.getrandbits(64)
+            hashes.append(f'{value:016x}')
+        AnalysisCache.objects.bulk_create([
+            AnalysisCache(phash=h, reasoning_effort='low', verbosity='low', analysis_text=h,
+                          **phash.band_fields(h, 'phash_band'))
+            for h in hashes
+        ])
+        target_hash = f'{target:016x}'
+        for max_distance in (0, 3, 4, 8, 11):
+            with self.subTest(max_distance=max_distance):
+                expected = {h for h in hashes if phash.hamming(target_hash, h) <= max_distance}
+                candidates = set(AnalysisCache.objects.filter(
+                    phash.near_q(target_hash, max_distance, 'phash_band'),
+                ).values_list('phash', flat=True))
+                self.assertTrue(expected)
+                self.assertLessEqual(expected, candidates)
+
+    def test_bands_round_trip(self):
+        value = '0123456789abcdef'
+        joined = 0
+        for band in phash.bands(value):
+            joined = (joined << phash.BAND_BITS) | band
+        self.assertEqual(f'{joined:016x}', value)
+
+
+@override_settings(LLM_CACHE_ENABLED=True, LLM_CACHE_TTL_SECONDS=60, LLM_CACHE_MAX_ENTRIES=3, LLM_CACHE_EVICT_EVERY=1)
+class LlmCacheTests(TestCase):
+    def _store(self, key, age=0, last_used=0):
+        llm_cache.store(key, 'model', f'response {key}')
+        now = timezone.now()
+        TextCompletionCache.objects.filter(key=key).update(
+            created_at=now - timedelta(seconds=age), last_used_at=now - timedelta(seconds=last_used),
+        )
+
+    def test_lookup_and_ttl(self):
+        self._store('fresh')
+        self._store('expired', age=120)
+        self.assertEqual(llm_cache.lookup('fresh'), 'response fresh')
+        self.assertIsNone(llm_cache.lookup('expired'))
+        self.assertIsNone(llm_cache.lookup('missing'))
+
+    def test_evict_expired_and_least_recently_used(self):
+        with override_settings(LLM_CACHE_EVICT_EVERY=1000):
+            self._store('expired', age=120)
+            for i, key in enumerate(('a', 'b', 'c', 'd')):
+                self._store(key, last_used=40 - i * 10)
+        self.assertEqual(llm_cache.evict(), 2)
+        self.assertEqual(set(TextCompletionCache.objects.values_list('key', flat=True)), {'b', 'c', 'd'})
+
+    def test_lookup_refreshes_lru_position(self):
+        with override_settings(LLM_CACHE_EVICT_EVERY=1000):
+            for i, key in enumerate(('a', 'b', 'c', 'd')):
+                self._store(key, last_used=40 - i * 10)
+        llm_cache.lookup('a')
+        llm_cache.evict()
+        self.assertEqual(set(TextCompletionCache.objects.values_list('key', flat=True)), {'a', 'c', 'd'})
+
+    def test_store_evicts_periodically(self):
+        with mock.patch.object(llm_cache, '_stores', itertools.count(1)), \
+                override_settings(LLM_CACHE_EVICT_EVERY=5):
+            for key in 'abcd':
+                self._store(key)
+            self.assertEqual(TextCompletionCache.objects.count(), 4)
+            self._store('e')
+            self.assertEqual(TextCompletionCache.objects.count(), 3)
+
+    def test_cached_text_call(self):
+        calls = []
+        for _ in range(2):
+            self.assertEqual(llm_cache.cached_text_call('model', {'prompt': ' 같은  입력 '}, lambda: calls.append(1) or 'out'),
+                             'out')
+        self.assertEqual(len(calls), 1)
+
+    def test_stats_unknown_without_metrics(self):
+        self._store('a')
+        with override_settings(METRICS_ENABLED=False):
+            llm_cache.lookup('a')
+            stats = llm_cache.cache_stats()
+        self.assertEqual(stats, {'hits': None, 'misses': None, 'hit_rate': None, 'entries': 1})
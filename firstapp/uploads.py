@@ -0,0 +1,41 @@
+"""업로드 이미지 저장 (생성/분석/편집/영상 뷰 공용)
+
+업로드 내용을 한 번 해시해 MEDIA_ROOT/uploads/<앞 2글자>/<해시><확장자>에 저장합니다.
+같은 이미지를 다시 올리면 새로 쓰지 않고 기존 파일을 돌려주며,
+해시(digest)는 이미지별 작업을 캐시할 때 키로 사용할 수 있습니다.
+"""
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .media_store import put_file
+
+UPLOAD_NAMESPACE = 'uploads'
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.heic'}
+
+
+class StoredUpload:
+    def __init__(self, digest, name, size):
+        self.digest = digest
+        self.name = name  # default_storage 기준 경로
+        self.size = size
+
+    @property
+    def path(self):
+        return default_storage.path(self.name)
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+    def __repr__(self):
+        return f'StoredUpload({self.name!r})'
+
+
+def store_upload(uploaded_file):
+    ext = os.path.splitext(uploaded_file.name or '')[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        ext = ''
+    digest, rel_path, size = put_file(uploaded_file, ext, namespace=UPLOAD_NAMESPACE, root=settings.MEDIA_ROOT)
+    return StoredUpload(digest, rel_path, size)
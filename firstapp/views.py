@@ -1,22 +1,52 @@
-import os
-import replicate
+import ipaddress
+import json
+import logging
+import time
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.files.storage import default_storage
-from dotenv import load_dotenv
-from .models import GeneratedImage, UserProfile, Preset
+from django.template.loader import render_to_string
+from django.core.paginator import Paginator
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import (FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+                         HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse)
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.crypto import constant_time_compare
+from django.urls import reverse
+from .models import Counter, GeneratedImage, GenerationJob, MediaAsset, UserProfile, Preset
+from .generation import flatten_output, get_output_url, enqueue_generation_job
+from .model_pipelines import get_pipeline
+from .media_store import asset_path
+from . import (admission, analysis_cache, derivatives, metrics, page_cache, phash, providers, resilience,
+               similar_index, webhooks)
+from .pagination import keyset_page
+from .uploads import store_upload
+from .provider_files import open_input, resolve_image_input
+from .image_prep import prepare_image
+from .streaming import job_events, sse_event, sse_response, streams_job_events, wants_event_stream
 from django.contrib.auth import logout, login
+from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required
 from .forms import CustomUserCreationForm
 from django.contrib.auth.models import User
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 def home_view(request):
     context = {}
-    return render(request, "home.html")
+    return page_cache.render(request, "home.html")
     
 def login_view(request):
     context = {}
-    return render(request, "login.html")
+    return page_cache.render(request, "login.html")
+
+
+class LoginView(auth_views.LoginView):
+    """로그인 페이지. 빈 폼은 모든 방문자에게 같으므로 GET은 페이지 캐시를 거칩니다."""
+    template_name = "login.html"
+
+    def get(self, request, *args, **kwargs):
+        return page_cache.render(request, self.template_name, self.get_context_data)
 
 def delete_account_view(request):
     context = {}
@@ -41,6 +71,29 @@ def editing_view(request):
 def video_view(request):
     return render(request, "video.html")
 
+def _admin_user_directory(admin_user, search=''):
+    """관리자 페이지의 유저 목록
+
+    프로필은 JOIN으로, 이미지 수/마지막 생성 시각은 상관 서브쿼리로 같은 쿼리에서 가져옵니다.
+    서브쿼리는 페이지에 포함된 유저에 대해서만 (user, -created_at) 인덱스로 계산됩니다.
+    """
+    user_images = GeneratedImage.objects.filter(user=OuterRef('pk')).order_by()
+    users = (User.objects
+             .exclude(id=admin_user.id)
+             .select_related('userprofile')
+             .annotate(
+                 image_count=Coalesce(Subquery(
+                     user_images.values('user').annotate(c=Count('*')).values('c')[:1]
+                 ), 0),
+                 last_generated_at=Subquery(
+                     user_images.order_by('-created_at').values('created_at')[:1]
+                 ),
+             )
+             .order_by('username'))
+    if search:
+        users = users.filter(username__icontains=search)
+    return users
+
 @login_required # 로그인을 해야만 접근 가능
 def profile(request):
     # .get() 대신 get_object_or_404를 쓰면 유저 프로필이 없을 때 404 에러를 냅니다.
@@ -52,13 +105,17 @@ def profile(request):
     }
 
     if is_admin:
-        # 관리자일 경우: '자신'을 제외한 모든 유저 목록을 context에 추가
-        all_other_users = User.objects.exclude(id=request.user.id)
-        context['all_users'] = all_other_users
+        # 관리자일 경우: '자신'을 제외한 유저 목록(검색/페이지)을 context에 추가
+        search = request.GET.get('q', '').strip()
+        page = Paginator(_admin_user_directory(request.user, search), settings.ADMIN_USERS_PAGE_SIZE).get_page(request.GET.get('page'))
+        context['all_users'] = page.object_list
+        context['page_obj'] = page
+        context['search'] = search
     else:
-        # 일반 회원일 경우: '자신'의 이미지 목록을 context에 추가
-        images = GeneratedImage.objects.filter(user=request.user).order_by('-created_at')
+        # 일반 회원일 경우: '자신'의 이미지 목록 첫 페이지를 context에 추가 (이후는 무한 스크롤)
+        images, next_cursor = keyset_page(_image_history(request.user), limit=settings.PROFILE_PAGE_SIZE)
         context['images'] = images
+        context['next_cursor'] = next_cursor
         
     # is_admin 값에 따라 'profile.html'이 다르게 렌더링됩니다.
     return render(request, 'profile.html', context)
@@ -73,17 +130,73 @@ def view_user_profile(request, user_id):
     # 2) 관리자가 보려는 '대상' 유저를 찾음
     target_user = get_object_or_404(User, id=user_id)
     
-    # 3) 대상 유저가 생성한 이미지 목록을 가져옴
-    images = GeneratedImage.objects.filter(user=target_user).order_by('-created_at')
+    # 3) 대상 유저가 생성한 이미지 목록 첫 페이지를 가져옴
+    images, next_cursor = keyset_page(_image_history(target_user), limit=settings.PROFILE_PAGE_SIZE)
     
     context = {
         'target_user': target_user,
-        'images': images
+        'images': images,
+        'next_cursor': next_cursor,
     }
     
     # 이 뷰를 위한 새 템플릿을 렌더링합니다.
     return render(request, 'view_user_profile.html', context)
 
+def _image_history(user):
+    return GeneratedImage.objects.filter(user=user).select_related('asset')
+
+def _image_history_page(request, user, template):
+    """무한 스크롤용 다음 페이지: 카드 HTML과 다음 커서를 JSON으로 반환"""
+    try:
+        images, next_cursor = keyset_page(_image_history(user), request.GET.get('cursor'), settings.PROFILE_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': '잘못된 커서입니다.'}, status=400)
+    html = render_to_string(template, {'images': images, 'next_cursor': next_cursor}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+@login_required
+def profile_images(request):
+    return _image_history_page(request, request.user, 'profile_image_cards.html')
+
+@login_required
+def view_user_images(request, user_id):
+    if not request.user.userprofile.is_admin:
+        return JsonResponse({'error': '권한이 없습니다.'}, status=403)
+    target_user = get_object_or_404(User, id=user_id)
+    return _image_history_page(request, target_user, 'view_user_image_cards.html')
+
+@login_required
+def similar_generations(request):
+    """업로드한 제품 사진과 비슷한 이전 생성 결과 (JSON: 카드 HTML + 목록)"""
+    if request.method != "POST":
+        return JsonResponse({'error': 'POST 요청만 지원합니다.'}, status=405)
+    uploaded_file = request.FILES.get("image")
+    if not uploaded_file:
+        return JsonResponse({'error': '이미지를 첨부해주세요.'}, status=400)
+
+    # 같은 파일로 바로 생성을 요청하면 이 업로드를 그대로 재사용합니다.
+    upload = store_upload(uploaded_file)
+    image_hash = phash.try_dhash(upload.path)
+    started = time.perf_counter()
+    images = similar_index.similar_images(request.user, image_hash)
+    took_ms = (time.perf_counter() - started) * 1000
+
+    html = render_to_string('similar_generations.html', {'images': images}, request=request)
+    return JsonResponse({
+        'html': html,
+        'took_ms': round(took_ms, 2),
+        'matches': [{
+            'id': image.id,
+            'url': image.display_url,
+            'result_url': reverse('generation_job', args=[image.job_id]) if image.job_id else image.display_url,
+            'distance': image.distance,
+            'product_type': image.product_type,
+            'theme': image.theme,
+            'mood': image.mood,
+            'created_at': image.created_at.isoformat(),
+        } for image in images],
+    })
+
 @login_required
 def delete_account(request):
     if request.method == 'POST':
@@ -95,32 +208,7 @@ def delete_account(request):
     # GET 요청일 경우 (링크를 클릭해서 처음 접속한 경우)
     return render(request, 'delete_account.html')
 
-load_dotenv()
-
-client = replicate.Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
-
-def flatten_output(output):
-    if isinstance(output, list):
-        return ' '.join(str(item).strip() for item in output if item).replace("\n", " ").strip()
-    elif isinstance(output, str):
-        return output.replace("\n", " ").strip()
-    return str(output).strip()
-
-def flatten_output2(o):
-    if isinstance(o, list):
-        return ''.join(s for s in o if s).strip()
-    return (o or '').strip()
-
-def get_output_url(output):
-    """Replicate 결과를 안전하게 문자열 URL로 변환"""
-    if not output: return None
-    if isinstance(output, list) and output: return str(output[0])
-    return str(output)
-
 def generate_images(request):
-    image_urls = []
-    word_urls = []
-
     if request.method != "POST":
         context = {
             "settings": {
@@ -135,351 +223,205 @@ def generate_images(request):
                 "count": request.GET.get("count", "1"),
             }
         }
-        return render(request, "main.html")
-    
-    if request.method == "POST":
-        # GET POST VALUES
-        product_type = request.POST.get("product_type", "맥주")
-        theme = request.POST.get("theme", "식당")
-        mood = request.POST.get("mood", "신나는")
-        placement = request.POST.get("placement", "테이블 위에 놓인")
-        user_prompt = request.POST.get("prompt", "")
-        aspect_ratio = request.POST.get("aspect_ratio", "16:9")
-        image_number = request.POST.get("count", "1")
-        uploaded_file = request.FILES.get("image")
-        model_choice = request.POST.get("model", "flux").lower()
-
-        # 안전하게 정수 변환
-        try:
-            image_number = max(1, min(int(image_number), 10))  # 1~10 범위 제한
-        except ValueError:
-            image_number = 1  # 기본값
-
-        original_settings = {
-        'product_type': product_type,
-        'theme': theme,
-        'mood': mood,
-        'placement': placement,
-        'prompt': user_prompt,
-        'extra_requirements': user_prompt,
-        'model': model_choice,
-        'aspect_ratio': aspect_ratio,
-        'count': image_number,
-        }
+        return page_cache.render(request, "main.html")
 
-        # 프롬프트 합성
-        full_prompt_ = f"""
-        Translate the following product marketing scene into natural and realistic English, without listing:
-        "입력된 이미지에 있는 바로 그 {product_type} 제품의 외형(라벨 디자인, 병 모양, 색상 등)을 완벽하게 유지한 채, 다음 상황에 자연스럽게 배치된 고품질 광고 사진을 만드세요: {mood} 분위기의 {theme} 배경에서, 해당 {product_type}이(가) {placement}에 놓여 있습니다. {user_prompt}"
-        """.strip()
-        
-        word_prompt = f"""
-        너의 역할은 카피라이터야.
-        상황을 기반으로, 술 마케팅에 어울리는 간결하고 감각적인 한국어 광고 문구 3가지를 추천해줘.
-        상황: {mood} 분위기의 {theme} 배경에서, 해당 {product_type}이(가) {placement}에 놓여 있습니다. {user_prompt}
-        제약 : 서론 없이 문구 3개만 줄바꿈으로 출력.
-        """.strip()
-
-        translated_prompt = client.run(
-            "openai/o4-mini",
-            input={
-                "prompt": full_prompt_,
-            }
-        )
-
-        full_prompt = flatten_output2(translated_prompt)
-
-        if uploaded_file:
-            file_path = default_storage.save(uploaded_file.name, uploaded_file)
-            full_path = default_storage.path(file_path)
-
-            with open(full_path, "rb") as f:
-                # 1. 이미지 생성
-                f.seek(0)
-                output = None
-                for _ in range(image_number):
-                    if model_choice == "flux":
-                        output = client.run(
-                            "black-forest-labs/flux-kontext-pro",
-                            input={
-                                "prompt": full_prompt,
-                                "input_image": f,
-                                "aspect_ratio": aspect_ratio,
-                            }
-                        )
-                    elif model_choice == "custom_beach":
-                        output0 = replicate.run(
-                            "clipnpaper/alcohol_beach:5c3ef136e48fd434e8fa47c9deaad6d12527a61757305ca01169e58fc5b19ef5",
-                            input={
-                                "model": "dev",
-                                "input_image": f,
-                                "prompt": ",alcohol_beach background" +full_prompt+ ",Do not create alcohol products",
-                                "mask" : f,
-                                "aspect_ratio": aspect_ratio,
-                            }
-                        )
-                        if isinstance(output0, list):
-                            bg_url = str(output0[0])
-                        else:
-                            bg_url = str(output0)
-                        f.seek(0)
-                        output1 = replicate.run(
-                            "google/nano-banana-pro",
-                            input={
-                                "prompt" : "주류 광고 이미지를 제작합니다. 배경 이미지와 제품 이미지를 합성하세요. 제품의 일관성을 유지하세요. ",
-                                "image_input": [f, bg_url],
-                                "aspect_ratio": aspect_ratio,
-                                "output_format" : "png"
-                            }
-                        )
-                        if isinstance(output1, list) and len(output1) > 0:
-                            output = output1[0]  # 리스트면 첫 번째 요소
-                        else:
-                            output = output1
-                    elif model_choice == "custom_bar":
-                        output0 = replicate.run(
-                            "clipnpaper/alcohol_cozy_bar:8f3dff77476698778b50f4d7a1112e10f03496d0f19ce38c583ab16cecec6fba",
-                            input={
-                                "model": "dev",
-                                #"input_image": f,
-                                "prompt": ",cozy_bar background" +full_prompt+ "\n keep the provided bottle exactly as it is, "
-                                                            "do not alter the bottle. Do not alter, redraw, re-create, re-interpret,"
-                                                            " or modify the bottle, label, logo, text, shape, typography, or any branding elements in any way.",
-                                "mask" : f,
-                                "aspect_ratio": aspect_ratio,
-                            }
-                        )
-                        if isinstance(output0, list):
-                            bg_url = str(output0[0])
-                        else:
-                            bg_url = str(output0)
-                        f.seek(0)
-                        output1 = replicate.run(
-                            "google/nano-banana-pro",
-                            input={
-                                "prompt" : "주류 광고 이미지를 제작합니다. 배경 이미지와 제품 이미지를 합성하세요. 제품의 일관성을 유지하세요. ",
-                                "image_input": [f, bg_url],
-                                "aspect_ratio": aspect_ratio,
-                                "output_format" : "png"
-                            }
-                        )
-                        if isinstance(output1, list) and len(output1) > 0:
-                            output = output1[0]  # 리스트면 첫 번째 요소
-                        else:
-                            output = output1
-
-                    elif model_choice == "custom_stylish":
-                        output0 = replicate.run(
-                            "clipnpaper/alcohol_stylish:b320a707aabb4390f663d2e834c30b072b3b1ad0d294182b1c4eec329818074f",
-                            input={
-                                "model": "dev",
-                                #"input_image": f,
-                                "prompt": "stylish background" +full_prompt+ "\n keep the provided bottle exactly as it is, "
-                                                            "do not alter the bottle. Do not alter, redraw, re-create, re-interpret,"
-                                                            " or modify the bottle, label, logo, text, shape, typography, or any branding elements in any way.",
-                                "mask" : f,
-                                "aspect_ratio": aspect_ratio,
-                            }
-                        )
-                        if isinstance(output0, list):
-                            bg_url = str(output0[0])
-                        else:
-                            bg_url = str(output0)
-                        f.seek(0)
-                        output1 = replicate.run(
-                            "google/nano-banana-pro",
-                            input={
-                                "prompt" : "주류 광고 이미지를 제작합니다. 배경 이미지와 제품 이미지를 합성하세요. 제품의 일관성을 유지하세요. ",
-                                "image_input": [f, bg_url],
-                                "aspect_ratio": aspect_ratio,
-                                "output_format" : "png"
-                            }
-                        )
-                        if isinstance(output1, list) and len(output1) > 0:
-                            output = output1[0]  # 리스트면 첫 번째 요소
-                        else:
-                            output = output1
-
-                    elif model_choice == "custom_bbq":
-                        output0 = replicate.run(
-                            "clipnpaper/alcohol_bbq:81520f34f3770086c356c923a1101026bf77cbbe0bc84c3d2d9a496fa81735fa",
-                            input={
-                                "model": "dev",
-                                #"input_image": f,
-                                "prompt": "BBQ background" +full_prompt+ "\n keep the provided bottle exactly as it is, "
-                                                            "do not alter the bottle. Do not alter, redraw, re-create, re-interpret,"
-                                                            " or modify the bottle, label, logo, text, shape, typography, or any branding elements in any way.",
-                                "mask" : f,
-                                "aspect_ratio": aspect_ratio,
-                            }
-                        )
-                        if isinstance(output0, list):
-                            bg_url = str(output0[0])
-                        else:
-                            bg_url = str(output0)
-                        f.seek(0)
-                        output1 = replicate.run(
-                            "google/nano-banana-pro",
-                            input={
-                                "prompt" : "주류 광고 이미지를 제작합니다. 배경 이미지와 제품 이미지를 합성하세요. 제품의 일관성을 유지하세요. ",
-                                "image_input": [f, bg_url],
-                                "aspect_ratio": aspect_ratio,
-                                "output_format" : "png"
-                            }
-                        )
-                        if isinstance(output1, list) and len(output1) > 0:
-                            output = output1[0]  # 리스트면 첫 번째 요소
-                        else:
-                            output = output1
-
-                    elif model_choice == "custom_pojangmacha":
-                        output0 = replicate.run(
-                            "clipnpaper/pojangmacha:5470dfeb19844ba06245c7e22214b7cdbce9e6034e8edcad74d9ef5a0c61a5cd",
-                            input={
-                                "model": "dev",
-                                #"input_image": f,
-                                "prompt": "pojangmacha background" +full_prompt+ "\n keep the provided bottle exactly as it is, "
-                                                            "do not alter the bottle. Do not alter, redraw, re-create, re-interpret,"
-                                                            " or modify the bottle, label, logo, text, shape, typography, or any branding elements in any way.",
-                                "mask" : f,
-                                "aspect_ratio": aspect_ratio,
-                            }
-                        )
-                        if isinstance(output0, list):
-                            bg_url = str(output0[0])
-                        else:
-                            bg_url = str(output0)
-                        f.seek(0)
-                        output1 = replicate.run(
-                            "google/nano-banana-pro",
-                            input={
-                                "prompt" : "주류 광고 이미지를 제작합니다. 배경 이미지와 제품 이미지를 합성하세요. 제품의 일관성을 유지하세요. ",
-                                "image_input": [f, bg_url],
-                                "aspect_ratio": aspect_ratio,
-                                "output_format" : "png"
-                            }
-                        )
-                        if isinstance(output1, list) and len(output1) > 0:
-                            output = output1[0]  # 리스트면 첫 번째 요소
-                        else:
-                            output = output1
-
-                    elif model_choice=="nanobanana":
-                        output = client.run(
-                            "google/nano-banana-pro",
-                            input={
-                                "prompt": full_prompt,
-                                "image_input": [f],
-                                "aspect_ratio": aspect_ratio,
-                                "output_format": "png"
-                            }
-                        )
-
-                    generated_url = None
-                    if isinstance(output, list) and output:
-                        generated_url = output[0]
-                    elif isinstance(output, str):
-                        generated_url = output
-
-                    elif output: 
-                        try:
-                            generated_url = str(output)
-                            # 변환된 문자열이 URL이 맞는지 간단히 확인
-                            if not generated_url.startswith('http'):
-                                generated_url = None # URL이 아니면 다시 None으로
-                        except Exception:
-                            generated_url = None # 변환 중 오류 발생 시
-
-                    if generated_url:
-                        image_urls.append(generated_url)
-                        if request.user.is_authenticated:
-                            # 생성된 이미지를 DB에 저장
-                            GeneratedImage.objects.create(
-                                user=request.user,
-                                image_url=generated_url,
-                                prompt=full_prompt,
-
-                                product_type=product_type,
-                                theme=theme,
-                                mood=mood,
-                                placement=placement,
-                                user_prompt=user_prompt
-                            )
-
-                # 2. 추천 문구 생성 (파일을 다시 열 필요 없음)
-                f.seek(0) # 파일 포인터를 다시 처음으로 돌립니다.
-                output = client.run(
-                    "openai/o4-mini",
-                    input={
-                        "prompt": word_prompt,
-                        "input_image": f,
-                    }
-                )
-                word_urls.append(flatten_output(output))
-                        
-                        # 임시로 업로드된 파일 삭제 (선택 사항)
-                        # default_storage.delete(file_path)
-
-                # GET 요청이거나, POST 처리가 완료된 후 템플릿을 렌더링합니다.
-        return render(request, "result.html", {
-            "image_urls": image_urls,
-            "word_urls": word_urls
-        })
-    else : 
-        context = {
-            "settings": {
-                "product_type": request.GET.get("product_type", "소주"),
-                "theme": request.GET.get("theme", "해변"),
-                "mood": request.GET.get("mood", "따듯한"),
-                "placement": request.GET.get("placement", "테이블 위에 놓인"),
-                "prompt": request.GET.get("prompt", ""),
-                "extra_requirements": request.GET.get("extra_requirements", ""),
-                "model": request.GET.get("model", "black-forest-labs/flux-kontext-pro"),
-                "aspect_ratio": request.GET.get("aspect_ratio", "16:9"),
-                "count": request.GET.get("count", "4"),
-            }
-        }
-        # main.html을 렌더링 (폼 페이지)
-        return render(request, "main.html", context)      
-    """return render(request, "main.html", {
-        "image_urls": image_urls,
-        "word_urls": word_urls
-    })"""
+    params, uploaded_file, error = _generation_form(request)
+    if error:
+        return render(request, "main.html", {"error": error})
+    try:
+        admission.check_enqueue(request.user)
+    except admission.Overloaded as e:
+        return _overloaded_response(request, e)
+
+    upload = store_upload(uploaded_file)
+
+    # 생성은 워커(run_generation_worker)가 처리하고, 여기서는 작업만 등록합니다.
+    job = enqueue_generation_job(request.user, upload.name, upload_digest=upload.digest, **params)
+    return _job_created_response(request, job)
+
+def _generation_form(request):
+    """생성 폼 입력값을 읽고 검증합니다. (동기/async 뷰 공용)
+
+    반환: (작업 파라미터, 업로드 파일, 오류 메시지 또는 None)
+    """
+    # GET POST VALUES
+    product_type = request.POST.get("product_type", "맥주")
+    theme = request.POST.get("theme", "식당")
+    mood = request.POST.get("mood", "신나는")
+    placement = request.POST.get("placement", "테이블 위에 놓인")
+    user_prompt = request.POST.get("prompt", "")
+    aspect_ratio = request.POST.get("aspect_ratio", "16:9")
+    image_number = request.POST.get("count", "1")
+    uploaded_file = request.FILES.get("image")
+    model_choice = request.POST.get("model", "flux").lower()
+    # 체크박스 앞의 hidden 값("0")이 함께 오므로 마지막 값을 사용합니다. 값이 없으면 재사용
+    reuse_backgrounds = request.POST.getlist("reuse_backgrounds", ["1"])[-1] != "0"
+
+    # 안전하게 정수 변환
+    try:
+        image_number = max(1, min(int(image_number), 10))  # 1~10 범위 제한
+    except ValueError:
+        image_number = 1  # 기본값
+
+    params = {
+        "product_type": product_type,
+        "theme": theme,
+        "mood": mood,
+        "placement": placement,
+        "user_prompt": user_prompt,
+        "aspect_ratio": aspect_ratio,
+        "image_number": image_number,
+        "model_choice": model_choice,
+        "reuse_backgrounds": reuse_backgrounds,
+    }
+    if not uploaded_file:
+        return params, None, "이미지를 첨부해주세요."
+    if get_pipeline(model_choice) is None:
+        return params, uploaded_file, "지원하지 않는 모델입니다."
+    return params, uploaded_file, None
+
+def _wants_json(request):
+    # fetch 등으로 호출한 경우
+    return request.headers.get("x-requested-with") == "XMLHttpRequest" or "application/json" in request.headers.get("accept", "")
+
+def _job_created_response(request, job):
+    # fetch 등으로 호출한 경우 작업 ID만 바로 돌려줍니다.
+    if _wants_json(request):
+        return JsonResponse({
+            "job_id": str(job.id),
+            "status": job.status,
+            "status_url": reverse("generation_job_status", args=[job.id]),
+            "result_url": reverse("generation_job", args=[job.id]),
+        }, status=202)
+    return redirect("generation_job", job_id=job.id)
+
+def _overloaded_response(request, error, template="main.html"):
+    """작업을 받을 수 없을 때: 사용자 한도 초과는 429, 대기열이 가득 차면 503 (Retry-After 포함)"""
+    if _wants_json(request):
+        response = JsonResponse({"error": str(error), "retry_after": error.retry_after}, status=error.status)
+    else:
+        response = render(request, template, {"error": str(error)}, status=error.status)
+    response["Retry-After"] = str(error.retry_after)
+    return response
+
+def _get_job_for_request(request, job_id):
+    job = get_object_or_404(GenerationJob, id=job_id)
+    # 로그인 사용자의 작업은 본인(또는 관리자)만 볼 수 있습니다.
+    if job.user_id and job.user_id != request.user.id:
+        if not (request.user.is_authenticated and request.user.userprofile.is_admin):
+            raise Http404
+    return job
+
+def generation_job(request, job_id):
+    """작업 결과 페이지. 완료 전에는 이벤트 스트림(ASGI) 또는 상태 조회로 결과를 받아 제자리에서 채웁니다."""
+    job = _get_job_for_request(request, job_id)
+    # 진행 중인 작업의 이미지는 스트림이 접속하자마자 index와 함께 다시 보내므로 비워 둡니다.
+    finished = job.is_finished
+    return render(request, "result.html", {
+        "job": job,
+        "results": [r for r in job.results if r.get("url")] if finished else [],
+        "image_urls": job.image_urls if finished else [],
+        "word_urls": job.word_urls,
+        "original_settings": job.original_settings,
+        "stream_events": streams_job_events(request),
+        "status_poll_ms": settings.GENERATION_STATUS_POLL_MS,
+    })
 
-# views.py
+def generation_job_events(request, job_id):
+    """작업 진행 상황 스트림 (Server-Sent Events)"""
+    job = _get_job_for_request(request, job_id)
+    return sse_response(job_events(job.id))
 
-# ... (기존 코드들) ...
+def _immutable_file_response(request, etag, path, content_type):
+    # 주소가 내용 해시로 정해져 바뀌지 않으므로 영구 캐시를 허용합니다.
+    etag = f'"{etag}"'
+    if request.headers.get("if-none-match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        if not path.exists():
+            raise Http404
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+def media_asset(request, digest):
+    """로컬 저장소의 원본 파일"""
+    asset = get_object_or_404(MediaAsset, digest=digest)
+    return _immutable_file_response(request, asset.digest, asset_path(asset), asset.content_type)
+
+def media_asset_derivative(request, digest, width, fmt):
+    """썸네일/반응형 크기 이미지. 처음 요청될 때 만들어 저장합니다."""
+    if fmt not in derivatives.FORMATS or width not in derivatives.allowed_widths():
+        raise Http404
+    asset = get_object_or_404(MediaAsset, digest=digest)
+    etag = f"{digest}-{width}.{fmt}"
+    path = derivatives.derivative_path(digest, width, fmt)
+    if request.headers.get("if-none-match") != f'"{etag}"':
+        path = derivatives.get_or_create_derivative(asset, width, fmt)
+    return _immutable_file_response(request, etag, path, derivatives.content_type(fmt))
+
+def generation_job_status(request, job_id):
+    """작업 상태/결과 JSON"""
+    job = _get_job_for_request(request, job_id)
+    return JsonResponse({
+        "job_id": str(job.id),
+        "status": job.status,
+        "results": job.results,
+        "word_urls": job.word_urls,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    })
 
-@login_required(login_url='login')
-def analysis_view(request):
+@csrf_exempt
+def replicate_webhook(request):
+    """provider 예측 완료 알림 (webhook 모드). 서명을 확인하고 결과를 기록합니다."""
     if request.method != "POST":
-        return render(request, "analysis.html")
-
-    uploaded_file = request.FILES.get("target_image")
-    if not uploaded_file:
-        return render(request, "analysis.html", {"error": "이미지를 선택해주세요."})
-    
-    file_path = default_storage.save(f"temp/analysis/{uploaded_file.name}", uploaded_file)
-    full_path = default_storage.path(file_path)
-    file_url = default_storage.url(file_path) # 템플릿에서 보여줄 URL
-    original_image_url = settings.MEDIA_URL + file_path
-
+        return HttpResponseNotAllowed(["POST"])
+    if not webhooks.verify_signature(request.headers, request.body):
+        return HttpResponseForbidden()
+    try:
+        prediction_id = int(request.GET["prediction"])
+        payload = json.loads(request.body)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest()
+    # 이미 처리한 알림이어도 2xx로 응답해야 provider가 다시 보내지 않습니다.
+    webhooks.record_update(prediction_id, payload)
+    return HttpResponse(status=204)
+
+def _internal_request(request):
+    """루프백/사설망 주소에서 직접 온 요청인지 (프록시를 거쳐 온 요청은 내부 요청으로 보지 않음)"""
+    if "x-forwarded-for" in request.headers or "forwarded" in request.headers:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+def metrics_view(request):
+    """Prometheus 형식 지표 (모든 웹/워커 프로세스 합계)
+
+    METRICS_TOKEN이 있으면 Bearer 토큰이 필요하고, 없으면 내부 주소에서 온 요청만 허용합니다.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN:
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"):
+            return HttpResponseForbidden()
+    elif not _internal_request(request):
+        return HttpResponseForbidden()
+    body = metrics.render(dict(Counter.objects.values_list("name", "value")))
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    analysis_text = ""
+# views.py
 
-    # 분석 결과 데이터 (기본값)
-    parsed_data = {
-        "product_type": "맥주", "theme": "해변", "mood": "신나는", "placement": "테이블 위에 놓인"
-    }
+# ... (기존 코드들) ...
 
-    try:
-        with open(file_path, "rb") as f:
-            # ⭐ [핵심] 우리가 가진 선택지 리스트를 프롬프트에 포함시킵니다.
-            # LLaVA에게 이 중에서만 고르라고 시킵니다.
-            reasoning_effort = request.POST.get('reasoning_effort', 'minimal')
-            verbosity = request.POST.get('verbosity', 'medium')
-            system_prompt = "You are a professional liquor marketing expert and photographer. Your task is to analyze the provided image and generate a complete marketing brief and AI image generation prompts"
-            prompt = """
+ANALYSIS_SYSTEM_PROMPT = "You are a professional liquor marketing expert and photographer. Your task is to analyze the provided image and generate a complete marketing brief and AI image generation prompts"
+ANALYSIS_PROMPT = """
             Analyze this image for a liquor advertisement and categorize it exactly into the options provided below.
             Output must be in Korean.
 
@@ -496,50 +438,186 @@ def analysis_view(request):
             Placement: [Value]
             Prompt: [Value]
             """
-            
-            output = client.run(
-                "openai/gpt-5",
-                input=
-                    {"prompt": prompt,
-                        "image_input": [f],
-                        "system_prompt": system_prompt,
-                        "reasoning_effort": reasoning_effort,
-                        "verbosity": verbosity
-                }
-            )
-            analysis_text = flatten_output(output)
-            
-            # 3. DB 업데이트
-            #analyzed_obj.analysis_text = analysis_text
-            
-            #analyzed_obj.save()
-
-            # 4. 결과 텍스트를 파싱해서 딕셔너리로 변환 (바로 적용하기 위해)
-            # 예: "Product: 맥주" -> {"product_type": "맥주"}
-            lines = analysis_text.split('\n')
-            for line in lines:
-                if "Product:" in line: parsed_data['product_type'] = line.split("Product:")[1].strip()
-                elif "Theme:" in line: parsed_data['theme'] = line.split("Theme:")[1].strip()
-                elif "Mood:" in line: parsed_data['mood'] = line.split("Mood:")[1].strip()
-                elif "Placement:" in line: parsed_data['placement'] = line.split("Placement:")[1].strip()
-                elif "Prompt:" in line: parsed_data['user_prompt'] = line.split("Prompt:")[1].strip()
 
-    except Exception as e:
-        print(f"Analysis Error: {e}")
-        return render(request, "analysis.html", {"error": "분석 중 오류가 발생했습니다."})
+def _analysis_input(request):
+    """분석 모델 입력값 (이미지 제외)"""
+    # ⭐ [핵심] 우리가 가진 선택지 리스트를 프롬프트에 포함시킵니다.
+    # LLaVA에게 이 중에서만 고르라고 시킵니다.
+    return {
+        "prompt": ANALYSIS_PROMPT,
+        "system_prompt": ANALYSIS_SYSTEM_PROMPT,
+        "reasoning_effort": request.POST.get('reasoning_effort', 'minimal'),
+        "verbosity": request.POST.get('verbosity', 'medium'),
+    }
+
+def _parse_analysis(analysis_text):
+    """결과 텍스트를 파싱해서 딕셔너리로 변환 (바로 적용하기 위해)"""
+    # 분석 결과 데이터 (기본값)
+    parsed_data = {
+        "product_type": "맥주", "theme": "해변", "mood": "신나는", "placement": "테이블 위에 놓인"
+    }
+    # 예: "Product: 맥주" -> {"product_type": "맥주"}
+    lines = analysis_text.split('\n')
+    for line in lines:
+        if "Product:" in line: parsed_data['product_type'] = line.split("Product:")[1].strip()
+        elif "Theme:" in line: parsed_data['theme'] = line.split("Theme:")[1].strip()
+        elif "Mood:" in line: parsed_data['mood'] = line.split("Mood:")[1].strip()
+        elif "Placement:" in line: parsed_data['placement'] = line.split("Placement:")[1].strip()
+        elif "Prompt:" in line: parsed_data['user_prompt'] = line.split("Prompt:")[1].strip()
+    return lines, parsed_data
+
+def _analysis_events(request, upload, model_input, image_hash, cached_text=None):
+    """분석 결과를 토큰이 나오는 대로 보내고, 끝나면 결과 화면 HTML을 보냅니다."""
+    if cached_text is not None:
+        # 저장된 결과는 한 번에 보냅니다.
+        yield sse_event("token", {"text": cached_text})
+        analysis_text = cached_text
+    else:
+        yield sse_event("status", {"status": "analyzing"})
+        chunks = []
+        try:
+            image_key, image_path = prepare_image(upload.digest, upload.path, "openai/gpt-5")
+            with admission.admitted("openai/gpt-5", request.user.id), \
+                    open_input(resolve_image_input(image_key, image_path)) as f:
+                for text in providers.stream("openai/gpt-5", {**model_input, "image_input": [f]}, stage="analysis"):
+                    if text:
+                        chunks.append(text)
+                        yield sse_event("token", {"text": text})
+        except Exception as e:
+            logger.exception("Analysis Error: %s", e)
+            yield sse_event("error", {"error": _provider_error_message(e, "분석 중 오류가 발생했습니다.")})
+            return
+        analysis_text = flatten_output("".join(chunks))
+        analysis_cache.store(image_hash, model_input["reasoning_effort"], model_input["verbosity"], analysis_text)
+
+    lines, parsed_data = _parse_analysis(analysis_text)
+    html = render_to_string("result_analysis.html", {
+        "original_iamge_url": upload.url,
+        "analysis_text": lines,
+        "parsed_data": parsed_data,
+        "from_cache": cached_text is not None,
+    }, request=request)
+    yield sse_event("done", {"html": html})
+
+def _provider_error_message(error, default):
+    # 시간 초과/모델 장애/자리 부족처럼 호출 정책이 만든 오류는 이유를 그대로 보여줍니다.
+    return str(error) if isinstance(error, (resilience.ProviderError, admission.Overloaded)) else default
+
+def _cached_analysis(request, full_path, model_input):
+    """같은(또는 거의 같은) 이미지를 같은 옵션으로 분석한 결과가 있으면 재사용합니다.
+
+    반환: (이미지 지각 해시, 저장된 분석 텍스트 또는 None). '다시 분석'이면 캐시를 건너뜁니다.
+    """
+    image_hash = analysis_cache.image_phash(full_path)
+    if request.POST.get("reanalyze") == "1":
+        return image_hash, None
+    return image_hash, analysis_cache.lookup(image_hash, model_input["reasoning_effort"], model_input["verbosity"])
+
+@login_required(login_url='login')
+def analysis_view(request):
+    if request.method != "POST":
+        return page_cache.render(request, "analysis.html")
+
+    uploaded_file = request.FILES.get("target_image")
+    if not uploaded_file:
+        return render(request, "analysis.html", {"error": "이미지를 선택해주세요."})
+    
+    upload = store_upload(uploaded_file)
+    full_path = upload.path
+    original_image_url = upload.url # 템플릿에서 보여줄 URL
+
+    model_input = _analysis_input(request)
+    image_hash, cached_text = _cached_analysis(request, full_path, model_input)
+
+    # 스트리밍 요청이면 분석 텍스트를 나오는 대로 보냅니다.
+    if wants_event_stream(request):
+        return sse_response(_analysis_events(request, upload, model_input, image_hash, cached_text))
+
+    analysis_text = cached_text or ""
+
+    if cached_text is None:
+        try:
+            image_key, image_path = prepare_image(upload.digest, full_path, "openai/gpt-5")
+            with admission.admitted("openai/gpt-5", request.user.id), \
+                    open_input(resolve_image_input(image_key, image_path)) as f:
+                output = providers.run(
+                    "openai/gpt-5",
+                    input={**model_input, "image_input": [f]},
+                    stage="analysis",
+                )
+                analysis_text = flatten_output(output)
+                
+                # 3. DB 업데이트
+                #analyzed_obj.analysis_text = analysis_text
+                
+                #analyzed_obj.save()
+
+        except admission.Overloaded as e:
+            return _overloaded_response(request, e, "analysis.html")
+        except Exception as e:
+            logger.exception("Analysis Error: %s", e)
+            return render(request, "analysis.html", {"error": _provider_error_message(e, "분석 중 오류가 발생했습니다.")})
+
+        analysis_cache.store(image_hash, model_input["reasoning_effort"], model_input["verbosity"], analysis_text)
+
+    lines, parsed_data = _parse_analysis(analysis_text)
 
     # 5. 결과 페이지로 이동 (분석된 옵션 값도 같이 넘김)
     return render(request, "result_analysis.html", {
         "original_iamge_url":original_image_url,
         "analysis_text": lines,
-        "parsed_data": parsed_data # 파싱된 데이터 전달
+        "parsed_data": parsed_data, # 파싱된 데이터 전달
+        "from_cache": cached_text is not None,
     })
 
+def _editing_events(request, upload, user_prompt):
+    """편집 예측의 상태 변화(starting → processing → succeeded)와 결과 이미지를 바로 보냅니다."""
+    yield sse_event("status", {"status": "uploading"})
+    try:
+        image_key, image_path = prepare_image(upload.digest, upload.path, "bytedance/seedream-4")
+        with admission.admitted("bytedance/seedream-4", request.user.id), \
+                resilience.guard("bytedance/seedream-4", stage="editing"):
+            with open_input(resolve_image_input(image_key, image_path)) as f:
+                prediction = providers.create("bytedance/seedream-4", {
+                    "image_input": [f],
+                    "prompt": user_prompt,
+                }, stage="editing")
+            # 모델 정책의 시간 제한이 지나면 예측을 취소하고 실패로 보냅니다.
+            timeout = resilience.policy("bytedance/seedream-4")["timeout"]
+            deadline = time.monotonic() + timeout
+            status = None
+            while True:
+                if prediction.status != status:
+                    status = prediction.status
+                    yield sse_event("status", {"status": status})
+                if status in ("succeeded", "failed", "canceled"):
+                    break
+                if time.monotonic() >= deadline:
+                    prediction.cancel()
+                    raise resilience.PredictionTimeout("bytedance/seedream-4", timeout)
+                time.sleep(settings.EDITING_POLL_INTERVAL)
+                prediction.reload()
+            if status != "succeeded":
+                raise RuntimeError(prediction.error or status)
+        image_url = str(get_output_url(prediction.output)).strip()
+    except Exception as e:
+        logger.exception("Editing Error: %s", e)
+        yield sse_event("error", {"error": _provider_error_message(e, "이미지 편집 중 오류가 발생했습니다.")})
+        return
+
+    yield sse_event("image", {"url": image_url})
+    html = render_to_string("result_editing.html", {
+        "original_image_url": upload.url,
+        "edited_image_url": image_url,
+        "prompt": user_prompt,
+    }, request=request)
+    yield sse_event("done", {"html": html})
+
 @login_required(login_url='login')
 def editing_view(request):
     # 1. [GET] 편집 폼 페이지 보여주기
     if request.method != "POST":
-        return render(request, "editing.html")
+        return page_cache.render(request, "editing.html")
 
     # 2. [POST] 편집 로직 실행
     uploaded_file = request.FILES.get("edit_image")
@@ -551,22 +629,30 @@ def editing_view(request):
     if not user_prompt:
         return render(request, "editing.html", {"error": "어떻게 편집할지 내용을 입력해주세요."})
 
-    # 파일 임시 저장 (Replicate에 보내기 위함, DB 저장 X)
-    # media/temp/edit/ 폴더에 저장
-    file_path = default_storage.save(f"temp/edit/{uploaded_file.name}", uploaded_file)
-    full_path = default_storage.path(file_path)
+    # 파일 저장 (Replicate에 보내기 위함, DB 저장 X)
+    # 같은 이미지는 한 번만 저장됩니다.
+    upload = store_upload(uploaded_file)
+    full_path = upload.path
     # 템플릿에 보여줄 원본 이미지 URL
-    original_image_url = settings.MEDIA_URL + file_path
+    original_image_url = upload.url
+
+    # 스트리밍 요청이면 진행 상태와 결과를 나오는 대로 보냅니다.
+    if wants_event_stream(request):
+        return sse_response(_editing_events(request, upload, user_prompt))
+
     edited_image_url = None
     try:
-        with open(full_path, "rb") as f:
+        image_key, image_path = prepare_image(upload.digest, full_path, "bytedance/seedream-4")
+        with admission.admitted("bytedance/seedream-4", request.user.id), \
+                open_input(resolve_image_input(image_key, image_path)) as f:
             # ⭐ Replicate 모델 호출 (Instruct-Pix2Pix)
-            output = client.run(
+            output = providers.run(
                 "bytedance/seedream-4",
                 input={
                     "image_input": [f],
                     "prompt": user_prompt,
-                }
+                },
+                stage="editing",
             )
             
             # 결과 URL 추출 (헬퍼 함수 사용)
@@ -576,9 +662,11 @@ def editing_view(request):
             else: image_url = str(output)
 
             image_url = str(image_url).strip()
+    except admission.Overloaded as e:
+        return _overloaded_response(request, e, "editing.html")
     except Exception as e:
-        print(f"Editing Error: {e}")
-        return render(request, "editing.html", {"error": "이미지 편집 중 오류가 발생했습니다."})
+        logger.exception("Editing Error: %s", e)
+        return render(request, "editing.html", {"error": _provider_error_message(e, "이미지 편집 중 오류가 발생했습니다.")})
     
     finally:
         pass
@@ -590,11 +678,40 @@ def editing_view(request):
         "prompt": user_prompt
     })
 
+# 영상 생성에 쓸 수 있는 모델 (video.html의 선택지). 목록에 없는 값은 provider에 보내지 않습니다.
+VIDEO_MODELS = ("google/veo-3.1",)
+
+def _video_input(request):
+    """영상 모델 입력값 (이미지 제외)"""
+    prompt = request.POST.get('video_positive_prompt', 'Animate this image')
+    
+    # 파라미터 형변환
+    try:
+        duration = int(request.POST.get('video_duration', '4'))
+    except ValueError:
+        duration = 4
+        
+    aspect_ratio = request.POST.get('video_ratio', '16:9')
+    resolution = request.POST.get('video_resolution', '720p')
+    
+    # boolean 변환
+    audio_val = request.POST.get('video_generate_audio', 'false')
+    generate_audio = True if audio_val == 'true' else False
+
+    return {
+        "prompt": prompt,
+        "aspect_ratio": aspect_ratio,
+        "duration": duration,
+        "resolution": resolution,
+        "generate_audio": generate_audio
+        # 모델에 따라 fps 등 추가 파라미터가 필요할 수 있음
+    }
+
 @login_required(login_url='login')
 def video_view(request):
     # 1. [GET] 입력 폼 보여주기
     if request.method != "POST":
-        return render(request, "video.html")
+        return page_cache.render(request, "video.html")
 
     # 2. [POST] 영상 생성 요청 처리
     uploaded_file = request.FILES.get("video_image")
@@ -602,50 +719,34 @@ def video_view(request):
     if not uploaded_file:
         return render(request, "video.html", {"error": "이미지를 선택해주세요."})
 
-    # 파일 임시 저장
-    file_path = default_storage.save(f"temp/video/{uploaded_file.name}", uploaded_file)
-    full_path = default_storage.path(file_path)
-    file_obj = open(full_path, "rb")
+    # 사용자 입력값 가져오기 (video.html의 name과 일치)
+    video_model = request.POST.get('video_model', 'google/veo-3.1') # 기본값 설정
+    if video_model not in VIDEO_MODELS:
+        return render(request, "video.html", {"error": f"지원하지 않는 모델입니다: {video_model}"})
+
+    # 파일 저장 (같은 이미지는 한 번만 저장됩니다)
+    upload = store_upload(uploaded_file)
+    full_path = upload.path
     
     video_url = None
 
     try:
-        with open(full_path, "rb") as f:
-            # 사용자 입력값 가져오기 (video.html의 name과 일치)
-            video_model = request.POST.get('video_model', 'google/veo-3.1') # 기본값 설정
-            prompt = request.POST.get('video_positive_prompt', 'Animate this image')
-            
-            # 파라미터 형변환
-            try:
-                duration = int(request.POST.get('video_duration', '4'))
-            except ValueError:
-                duration = 4
-                
-            aspect_ratio = request.POST.get('video_ratio', '16:9')
-            resolution = request.POST.get('video_resolution', '720p')
-            
-            # boolean 변환
-            audio_val = request.POST.get('video_generate_audio', 'false')
-            generate_audio = True if audio_val == 'true' else False
-
-            output = client.run(
+        image_key, image_path = prepare_image(upload.digest, full_path, video_model)
+        with admission.admitted(video_model, request.user.id), \
+                open_input(resolve_image_input(image_key, image_path)) as f:
+            output = providers.run(
                 video_model,
-                input={
-                    "image": f,
-                    "prompt": prompt,
-                    "aspect_ratio": aspect_ratio,
-                    "duration": duration,
-                    "resolution": resolution,
-                    "generate_audio": generate_audio
-                    # 모델에 따라 fps 등 추가 파라미터가 필요할 수 있음
-                }
+                input={"image": f, **_video_input(request)},
+                stage="video",
             )
             
             # 결과 URL 추출
             video_url = get_output_url(output)
 
+    except admission.Overloaded as e:
+        return _overloaded_response(request, e, "video.html")
     except Exception as e:
-        print(f"Video Generation Error: {e}")
+        logger.exception("Video Generation Error: %s", e)
         return render(request, "video.html", {"error": f"영상 생성 중 오류가 발생했습니다: {str(e)}"})
     
     finally:
@@ -0,0 +1,485 @@
+"""provider 예측 완료 웹훅 (GENERATION_COMPLETION_MODE=webhook)
+
+기본(poll) 모드에서는 워커 스레드가 resilience.run()으로 예측이 끝날 때까지 provider를 폴링하며 기다립니다.
+webhook 모드에서는 워커가 예측을 webhook URL과 함께 제출만 하고 바로 다음 작업으로 넘어가며,
+provider가 완료를 알려 오면 receiver(views.replicate_webhook)는 결과를 Prediction 행에 기록만 하고 바로 응답하며,
+워커(run_generation_worker)가 그 행을 가져가(claim_completed) 작업의 다음 단계를 제출합니다. (advance)
+입력 이미지 준비/업로드, 자리 대기, 제출은 모두 워커에서 일어나므로 웹훅 요청은 provider의 전송 시간 제한 안에 끝납니다.
+
+  translate ─┬→ background(배경 슬롯별) → image(합성) ─┐
+             └→ image (배경이 없는 파이프라인) ──────────┼→ 완료 (GeneratedImage 저장, 미러링)
+  copy ──────────────────────────────────────────────┘
+
+- 진행 상태는 모두 DB(Prediction, GenerationJob)에 있으므로 웹/워커 프로세스가 재시작되어도 이어집니다.
+- 웹훅은 같은 알림이 여러 번 올 수 있어, 완료되지 않은 행만 바꾸는 조건부 UPDATE로 한 번만 기록합니다.
+  기록과 함께 needs_advance를 켜 두므로 다음 단계는 응답 뒤에도 유실되지 않습니다.
+- 이미지 결과는 Prediction 행에서 다시 계산해 저장하므로 동시에 도착한 웹훅끼리 결과를 덮어쓰지 않습니다.
+- 서명은 Standard Webhooks 방식(webhook-id/webhook-timestamp/webhook-signature, HMAC-SHA256)입니다.
+- 알림이 유실된 예측은 워커가 주기적으로 provider에서 직접 조회해 같은 경로로 처리합니다. (reconcile_predictions)
+  모델 정책의 timeout(PROVIDER_POLICIES)을 넘긴 예측은 이때 취소하고 실패로 처리합니다.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from . import admission, llm_cache, providers, resilience
+from .generation import _source_phash, build_prompts, flatten_output, flatten_output2, generated_images
+from .image_prep import prepare_image
+from .media_store import mirror_job_results
+from .model_pipelines import _cached_backgrounds, extract_url, get_pipeline, scene_key
+from .models import BackgroundAsset, GeneratedImage, GenerationJob, Prediction
+from .provider_files import open_input, resolve_image_input
+
+logger = logging.getLogger(__name__)
+
+TEXT_MODEL = "openai/o4-mini"
+# 완료 알림만 받습니다. (시작/로그 알림은 쓰지 않음)
+WEBHOOK_EVENTS = ["completed"]
+PENDING_STATUSES = (Prediction.STATUS_STARTING, Prediction.STATUS_PROCESSING)
+
+
+# ---------------------------------------------------------------------------
+# 서명
+# ---------------------------------------------------------------------------
+
+def _secret_key():
+    secret = settings.REPLICATE_WEBHOOK_SECRET
+    if not secret:
+        raise ImproperlyConfigured("webhook 모드에는 REPLICATE_WEBHOOK_SECRET 설정이 필요합니다.")
+    # provider가 주는 키는 "whsec_<base64>" 형식입니다.
+    try:
+        return base64.b64decode(secret.removeprefix("whsec_"), validate=True)
+    except binascii.Error:
+        raise ImproperlyConfigured("REPLICATE_WEBHOOK_SECRET가 'whsec_<base64>' 형식이 아닙니다.")
+
+
+def sign(webhook_id, timestamp, body):
+    """웹훅 본문의 서명 (base64). 로컬 대체 provider가 웹훅을 보낼 때도 사용합니다."""
+    content = f"{webhook_id}.{timestamp}.".encode() + body
+    return base64.b64encode(hmac.new(_secret_key(), content, hashlib.sha256).digest()).decode()
+
+
+def verify_signature(headers, body):
+    """webhook-signature가 본문과 맞고, 보낸 시각이 허용 범위 안인지 확인합니다."""
+    if not settings.REPLICATE_WEBHOOK_SECRET:
+        logger.error("Webhook received but REPLICATE_WEBHOOK_SECRET is not set")
+        return False
+    webhook_id = headers.get("webhook-id")
+    timestamp = headers.get("webhook-timestamp")
+    signatures = headers.get("webhook-signature")
+    if not (webhook_id and timestamp and signatures):
+        return False
+    try:
+        # 오래된 알림을 다시 보내는 재전송 공격을 막습니다.
+        if abs(time.time() - int(timestamp)) > settings.WEBHOOK_TIMESTAMP_TOLERANCE_SECONDS:
+            return False
+    except ValueError:
+        return False
+    try:
+        expected = sign(webhook_id, timestamp, body)
+    except ImproperlyConfigured as e:
+        logger.error("Webhook received but the secret is invalid: %s", e)
+        return False
+    # 키를 교체하는 동안에는 "v1,<서명> v1,<서명>"처럼 여러 개가 올 수 있습니다.
+    return any(hmac.compare_digest(expected, candidate.partition(",")[2]) for candidate in signatures.split())
+
+
+# ---------------------------------------------------------------------------
+# 제출
+# ---------------------------------------------------------------------------
+
+def webhook_url(prediction):
+    # 웹훅이 제출 응답보다 먼저 올 수 있어, provider ID 대신 우리 행 ID로 찾습니다.
+    return f"{settings.WEBHOOK_BASE_URL.rstrip('/')}{reverse('replicate_webhook')}?prediction={prediction.pk}"
+
+
+def _submit(job, stage, index, model, build_input, image=None):
+    """Prediction 행을 먼저 만들고 예측을 제출합니다. image(provider URL/경로)는 열어서 build_input(f)에 넘깁니다."""
+    prediction = Prediction.objects.create(job=job, stage=stage, index=index, model=model)
+    try:
+        # 완료 알림을 받을 때까지 모델/사용자 자리를 잡아 둡니다. (record_update에서 반납)
+        admission.acquire(model, job.user_id, holder=_slot_holder(prediction.pk))
+        if not Prediction.objects.filter(pk=prediction.pk, status__in=PENDING_STATUSES).exists():
+            # 자리를 기다리는 동안 작업이 실패했거나 reconcile_predictions()가 실패 처리한 경우
+            admission.release(_slot_holder(prediction.pk))
+            return
+        with open_input(image) if image is not None else nullcontext() as f:
+            remote = providers.submit(
+                model, build_input(f), stage=stage,
+                webhook=webhook_url(prediction), webhook_events_filter=WEBHOOK_EVENTS,
+            )
+    except Exception as e:
+        logger.exception("Prediction submit failed (job %s, %s[%s])", job.id, stage, index)
+        record_update(prediction.pk, {"status": Prediction.STATUS_FAILED, "error": str(e)})
+        return
+    # 웹훅이 먼저 도착해 채워 두었을 수 있으므로 비어 있을 때만 기록합니다.
+    recorded = Prediction.objects.filter(
+        pk=prediction.pk, provider_id='', status__in=PENDING_STATUSES,
+    ).update(provider_id=remote.id)
+    if recorded or Prediction.objects.filter(pk=prediction.pk, provider_id=remote.id).exists():
+        return
+    # 제출하는 동안 실패 처리됐거나(reconcile_predictions) 작업이 다시 큐에 들어가 지워진 예측:
+    # 결과를 받을 곳이 없으므로 취소합니다.
+    _cancel(remote.id)
+
+
+def _cancel(provider_id):
+    try:
+        providers.cancel(provider_id)
+    except Exception:
+        logger.warning("Prediction cancel failed: %s", provider_id)
+
+
+def _submit_seconds(model):
+    """예측 제출에 걸릴 수 있는 최대 시간(초): 자리 대기 + 재시도를 포함한 입력 업로드와 제출 요청"""
+    pol = resilience.policy(model)
+    request = settings.PROVIDER_CONNECT_TIMEOUT + settings.PROVIDER_READ_TIMEOUT
+    return settings.ADMISSION_WAIT_SECONDS + (pol["retries"] + 1) * (2 * request + pol["backoff_max"])
+
+
+def _slot_holder(prediction_id):
+    return f"prediction:{prediction_id}"
+
+
+def _upload_digest(job):
+    return job.upload_digest or llm_cache.file_digest(default_storage.path(job.upload_path))
+
+
+def _text_keys(job):
+    """(번역 캐시 키, 번역 프롬프트, 문구 캐시 키, 문구 프롬프트) - generation.run_generation_job()과 같은 키"""
+    full_prompt_, word_prompt = build_prompts(job.product_type, job.theme, job.mood, job.placement, job.user_prompt)
+    return (
+        llm_cache.text_call_key(TEXT_MODEL, {"prompt": full_prompt_}), full_prompt_,
+        llm_cache.text_call_key(TEXT_MODEL, {"prompt": word_prompt}, _upload_digest(job)), word_prompt,
+    )
+
+
+def _product_image(job, model):
+    full_path = default_storage.path(job.upload_path)
+    return resolve_image_input(*prepare_image(_upload_digest(job), full_path, model))
+
+
+def _is_running(job):
+    return GenerationJob.objects.filter(id=job.id, status=GenerationJob.STATUS_RUNNING).exists()
+
+
+def start_job(job):
+    """RUNNING으로 선점한 작업의 첫 단계(번역, 추천 문구)를 제출하고 바로 반환합니다.
+
+    캐시에 있는 단계는 제출하지 않고 바로 다음 단계로 넘어갑니다. 이후 단계는 웹훅이 이어서 진행합니다.
+    """
+    _secret_key()  # 서명 키가 없으면 완료 알림을 받을 수 없으므로 제출하지 않습니다.
+    if get_pipeline(job.model_choice) is None:
+        raise ValueError(f"지원하지 않는 모델입니다: {job.model_choice}")
+
+    # 다시 큐에 들어온 작업이면 이전 시도의 예측과 중간 결과를 지웁니다. (늦게 온 웹훅은 무시됨)
+    job.predictions.all().delete()
+    job.full_prompt, job.word_urls, job.results, job.backgrounds = '', [], [], []
+    job.save(update_fields=['full_prompt', 'word_urls', 'results', 'backgrounds'])
+
+    translate_key, full_prompt_, copy_key, word_prompt = _text_keys(job)
+    copy_text = llm_cache.lookup(copy_key)
+    if copy_text is None:
+        _submit(job, Prediction.STAGE_COPY, 0, TEXT_MODEL,
+                lambda f: {"prompt": word_prompt, "input_image": f},
+                _product_image(job, TEXT_MODEL))
+    else:
+        _save_copy(job, copy_text)
+    if not _is_running(job):
+        return
+
+    translated = llm_cache.lookup(translate_key)
+    if translated is None:
+        _submit(job, Prediction.STAGE_TRANSLATE, 0, TEXT_MODEL, lambda f: {"prompt": full_prompt_})
+    else:
+        _save_translation(job, translated)
+        _maybe_finish(job)
+
+
+def _save_copy(job, text):
+    job.word_urls = [text]
+    GenerationJob.objects.filter(id=job.id).update(word_urls=job.word_urls)
+
+
+def _save_translation(job, text):
+    job.full_prompt = text
+    GenerationJob.objects.filter(id=job.id).update(full_prompt=text)
+    _submit_images(job)
+
+
+def _submit_image(job, pipeline, index, product_image, background_url=None):
+    _submit(job, Prediction.STAGE_IMAGE, index, pipeline.model,
+            lambda f: pipeline.build_input(job.full_prompt, job.aspect_ratio, f, background_url),
+            product_image)
+
+
+def _submit_images(job):
+    """이미지 N장을 제출합니다. custom_*는 배경 슬롯을 정하고, 배경이 없는 슬롯의 배경부터 제출합니다.
+
+    이미지 i는 배경 슬롯 i % len(backgrounds)를 사용합니다. (poll 모드의 배경 재사용 풀과 같은 배분)
+    """
+    pipeline = get_pipeline(job.model_choice)
+    product_image = _product_image(job, pipeline.model)
+    if not pipeline.background:
+        for index in range(job.image_number):
+            _submit_image(job, pipeline, index, product_image)
+        return
+
+    if job.reuse_backgrounds:
+        size = max(1, min(job.image_number, settings.GENERATION_BACKGROUND_POOL_SIZE))
+        key = scene_key(pipeline, job.full_prompt, job.aspect_ratio, _upload_digest(job))
+        pooled = _cached_backgrounds(key, size)
+    else:
+        size, pooled = job.image_number, []
+    job.backgrounds = pooled + [None] * (size - len(pooled))
+    GenerationJob.objects.filter(id=job.id).update(backgrounds=job.backgrounds)
+
+    for slot, url in enumerate(job.backgrounds):
+        if url is None:
+            _submit(job, Prediction.STAGE_BACKGROUND, slot, pipeline.background.model,
+                    lambda f: pipeline.background.build_input(job.full_prompt, job.aspect_ratio, f),
+                    product_image)
+    for index in range(job.image_number):
+        url = job.backgrounds[index % size]
+        if url:
+            _submit_image(job, pipeline, index, product_image, url)
+
+
+# ---------------------------------------------------------------------------
+# 완료 처리
+# ---------------------------------------------------------------------------
+
+def record_update(prediction_id, payload):
+    """provider가 알려 온 예측 상태(웹훅 본문 또는 조회 결과)를 기록합니다.
+
+    완료됐으면 needs_advance를 켜 두고, 다음 단계는 워커가 advance()로 진행합니다.
+    처음 받은 완료 알림이면 True, 모르는 예측이거나 이미 처리한 알림이면 False를 반환합니다.
+    """
+    prediction = Prediction.objects.filter(pk=prediction_id).first()
+    if prediction is None:
+        return False
+    provider_id = payload.get("id") or ''
+    if provider_id and prediction.provider_id and provider_id != prediction.provider_id:
+        # 다른 예측의 본문을 이 주소로 보낸 경우
+        return False
+
+    status = payload.get("status")
+    fields = {"status": status}
+    if provider_id:
+        fields["provider_id"] = provider_id
+    pending = Prediction.objects.filter(pk=prediction.pk, status__in=PENDING_STATUSES)
+    if status in PENDING_STATUSES:
+        pending.update(**fields)
+        return False
+    if status not in Prediction.TERMINAL_STATUSES:
+        return False
+
+    fields.update(output=payload.get("output"), error=str(payload.get("error") or ''), completed_at=timezone.now(),
+                  needs_advance=True)
+    if not pending.update(**fields):
+        return False
+    admission.release(_slot_holder(prediction.pk))
+    return True
+
+
+def claim_completed():
+    """다음 단계를 진행하지 않은 완료 예측 하나를 선점해 반환합니다. 없으면 None
+
+    needs_advance를 조건으로 건 UPDATE로 선점하므로 워커가 여러 개여도 한 번만 진행합니다.
+    """
+    candidates = (Prediction.objects
+                  .filter(needs_advance=True)
+                  .order_by('completed_at')
+                  .values_list('pk', flat=True)[:10])
+    for prediction_id in candidates:
+        if Prediction.objects.filter(pk=prediction_id, needs_advance=True).update(needs_advance=False):
+            return Prediction.objects.select_related('job').get(pk=prediction_id)
+    return None
+
+
+def advance(prediction):
+    """완료된 예측의 결과를 작업에 반영하고 다음 단계를 제출합니다. (워커에서 실행)"""
+    if prediction.provider_id:
+        # 서킷 브레이커는 제출(resilience.submit)하는 워커 프로세스에 있으므로 결과도 여기서 반영합니다.
+        # 제출 단계의 실패는 resilience.submit()이 이미 반영했습니다.
+        resilience.record_result(
+            prediction.model, prediction.status == Prediction.STATUS_SUCCEEDED, stage=prediction.stage,
+            seconds=(prediction.completed_at - prediction.created_at).total_seconds(),
+        )
+    job = prediction.job
+    if job.status != GenerationJob.STATUS_RUNNING:
+        return
+    succeeded = prediction.status == Prediction.STATUS_SUCCEEDED
+    try:
+        if prediction.stage == Prediction.STAGE_TRANSLATE:
+            if not succeeded:
+                raise RuntimeError(prediction.error or "프롬프트 번역에 실패했습니다.")
+            translate_key = _text_keys(job)[0]
+            text = flatten_output2(prediction.output)
+            llm_cache.store(translate_key, TEXT_MODEL, text)
+            _save_translation(job, text)
+        elif prediction.stage == Prediction.STAGE_COPY:
+            if not succeeded:
+                raise RuntimeError(prediction.error or "추천 문구 생성에 실패했습니다.")
+            copy_key = _text_keys(job)[2]
+            text = flatten_output(prediction.output)
+            llm_cache.store(copy_key, TEXT_MODEL, text)
+            _save_copy(job, text)
+        elif prediction.stage == Prediction.STAGE_BACKGROUND:
+            _background_done(job, prediction)
+        else:
+            # 한 장 끝날 때마다 결과를 저장해 결과 스트림에서 바로 보이게 합니다.
+            GenerationJob.objects.filter(id=job.id, status=GenerationJob.STATUS_RUNNING).update(
+                results=_image_results(job),
+            )
+        # 예측은 이미 선점(needs_advance=False)했으므로, 완료 처리에서 오류가 나도 작업을 실패로 끝냅니다.
+        # (그대로 두면 다시 진행할 예측이 없어 RUNNING에 남음)
+        _maybe_finish(job)
+    except Exception as e:
+        logger.exception("Generation job %s failed", job.id)
+        fail_job(job, str(e))
+
+
+def _known_backgrounds(job):
+    urls = [url for url in job.backgrounds if url]
+    done = Prediction.objects.filter(
+        job=job, stage=Prediction.STAGE_BACKGROUND, status=Prediction.STATUS_SUCCEEDED,
+    ).values_list('output', flat=True)
+    return urls + [url for url in map(extract_url, done) if url]
+
+
+def _background_done(job, prediction):
+    """배경 하나가 끝나면 그 슬롯을 쓰는 이미지들의 합성을 제출합니다."""
+    pipeline = get_pipeline(job.model_choice)
+    slots = [i for i in range(job.image_number) if i % len(job.backgrounds) == prediction.index]
+    url = extract_url(prediction.output) if prediction.status == Prediction.STATUS_SUCCEEDED else None
+    if url and job.reuse_backgrounds:
+        key = scene_key(pipeline, job.full_prompt, job.aspect_ratio, _upload_digest(job))
+        BackgroundAsset.objects.create(scene_key=key, pipeline=pipeline.name, url=url)
+    elif not url:
+        logger.error("Background generation failed (job %s, slot %s): %s", job.id, prediction.index, prediction.error)
+        # 이미 만들어진 다른 배경이 있으면 그것으로 대신 합성합니다.
+        known = _known_backgrounds(job)
+        if not known:
+            error = prediction.error or f"{pipeline.name}: 배경 생성 결과가 없습니다."
+            now = timezone.now()
+            Prediction.objects.bulk_create([
+                Prediction(job=job, stage=Prediction.STAGE_IMAGE, index=i, model=pipeline.model,
+                           status=Prediction.STATUS_FAILED, error=error, completed_at=now)
+                for i in slots
+            ])
+            return
+        url = known[0]
+    product_image = _product_image(job, pipeline.model)
+    for index in slots:
+        _submit_image(job, pipeline, index, product_image, url)
+
+
+def _image_results(job):
+    """이미지 슬롯별 결과 (아직 끝나지 않은 슬롯은 pending)"""
+    results = [{"url": None, "pending": True} for _ in range(job.image_number)]
+    rows = (Prediction.objects
+            .filter(job=job, stage=Prediction.STAGE_IMAGE, status__in=Prediction.TERMINAL_STATUSES)
+            .order_by('id')
+            .values_list('index', 'status', 'output', 'error'))
+    for index, status, output, error in rows:
+        url = extract_url(output) if status == Prediction.STATUS_SUCCEEDED else None
+        results[index] = {"url": url} if url else {"url": None, "error": error or "생성 결과가 없습니다."}
+    return results
+
+
+def _maybe_finish(job):
+    """번역/문구/이미지가 모두 끝났으면 작업을 완료 처리합니다. (조건부 UPDATE라 한 번만 실행됨)"""
+    job.refresh_from_db(fields=['status', 'full_prompt', 'word_urls'])
+    if job.status != GenerationJob.STATUS_RUNNING or not job.full_prompt or not job.word_urls:
+        return
+    results = _image_results(job)
+    if any(r.get("pending") for r in results):
+        return
+    if not any(r["url"] for r in results):
+        fail_job(job, results[0]["error"] if results else "생성된 이미지가 없습니다.")
+        return
+
+    source_phash = _source_phash(job)
+    # 완료 상태와 GeneratedImage가 함께 보이도록 한 트랜잭션으로 저장합니다.
+    with transaction.atomic():
+        finished = GenerationJob.objects.filter(id=job.id, status=GenerationJob.STATUS_RUNNING).update(
+            status=GenerationJob.STATUS_SUCCEEDED, results=results, finished_at=timezone.now(),
+        )
+        if not finished:
+            return
+        job.refresh_from_db()
+        if job.user_id:
+            GeneratedImage.objects.bulk_create(generated_images(job, source_phash))
+    if settings.ASSET_MIRROR_ENABLED:
+        # 다음 작업을 늦추지 않도록 따로 내려받습니다. (중간에 끊기면 mirror_generated_assets가 채움)
+        threading.Thread(target=_mirror, args=(job,), daemon=True).start()
+
+
+def _mirror(job):
+    try:
+        mirror_job_results(job)
+    except Exception:
+        logger.exception("Mirroring failed (job %s)", job.id)
+    finally:
+        connection.close()
+
+
+def fail_job(job, error):
+    """작업을 실패 처리하고, 아직 끝나지 않은 예측은 취소를 요청합니다."""
+    failed = GenerationJob.objects.filter(id=job.id, status=GenerationJob.STATUS_RUNNING).update(
+        status=GenerationJob.STATUS_FAILED, error=error, finished_at=timezone.now(),
+    )
+    if not failed:
+        return
+    pending = (Prediction.objects.filter(job=job, status__in=PENDING_STATUSES)
+               .exclude(provider_id='').values_list('provider_id', flat=True))
+    for provider_id in pending:
+        _cancel(provider_id)
+
+
+def reconcile_predictions(older_than=None):
+    """완료 알림 없이 오래된 예측을 provider에서 직접 조회해 처리합니다. (웹훅 유실 대비)
+
+    모델 정책의 timeout을 넘기고도 끝나지 않은 예측은 취소하고 실패로 기록합니다.
+    처리한 완료 건수를 반환합니다.
+    """
+    older_than = settings.GENERATION_WEBHOOK_RECONCILE_SECONDS if older_than is None else older_than
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=older_than)
+    stale = (Prediction.objects
+             .filter(status__in=PENDING_STATUSES, created_at__lt=cutoff)
+             .values_list('pk', 'provider_id', 'model', 'created_at')[:100])
+    handled = 0
+    for prediction_id, provider_id, model, created_at in stale:
+        if not provider_id:
+            if (now - created_at).total_seconds() <= _submit_seconds(model):
+                continue  # 아직 자리를 기다리거나 제출하는 중일 수 있음
+            # 제출 도중 프로세스가 죽어 provider ID를 받지 못한 예측
+            payload = {"status": Prediction.STATUS_FAILED, "error": "예측 제출 결과를 확인할 수 없습니다."}
+        else:
+            try:
+                remote = providers.get(provider_id)
+            except Exception:
+                logger.exception("Prediction lookup failed: %s", provider_id)
+                continue
+            payload = {"id": remote.id, "status": remote.status, "output": remote.output, "error": remote.error}
+            timeout = resilience.policy(model)["timeout"]
+            if remote.status in PENDING_STATUSES and (now - created_at).total_seconds() > timeout:
+                _cancel(provider_id)
+                payload.update(status=Prediction.STATUS_FAILED, error=str(resilience.PredictionTimeout(model, timeout)))
+        handled += record_update(prediction_id, payload)
+    return handled